@@ -3,12 +3,16 @@ from dash import html, dcc, Input, Output, State, ALL, ctx
 from typing import Dict, List, Any
 
 from flowfunc import Flowfunc
+from flowfunc.background import RunManager
 from flowfunc.config import Config
+from flowfunc.dash_integration import background_run_components, register_background_run
 from flowfunc.jobrunner import JobRunner
 from flowfunc.models import OutNode
+from flowfunc.quantum.nodes import quantum_nodes
+from flowfunc.store import SQLiteWorkflowStore
 import math
-import random
 import datetime
+import os
 
 # --- App Initialization ---
 app = dash.Dash(__name__, assets_folder='assets', suppress_callback_exceptions=True)
@@ -37,15 +41,6 @@ def string_join(a: str, b: str, separator: str = " ") -> str:
 def to_uppercase(text: str) -> str:
     """Converts a string to uppercase."""
     return text.upper()
-def hadamard_gate(qubit_state: str = "|0>") -> str:
-    """Simulates a Hadamard gate. |0> -> |+> or |1> -> |->"""
-    if qubit_state == "|0>": return "|+>"
-    elif qubit_state == "|1>": return "|->"
-    return "Invalid state"
-def measure_qubit(state: str = "|+>") -> int:
-    """Simulates measuring a qubit with a 50/50 chance."""
-    if state in ["|+>", "|->"]: return random.choice([0, 1])
-    return 0
 def compare_values(a: str, b: str, operation: str = "==") -> bool:
     """Compares two values (a, b) based on the operation (==, !=, >, <, >=, <=)."""
     try:
@@ -84,12 +79,15 @@ def get_current_time(format_string: str = "%Y-%m-%d %H:%M:%S") -> str:
 # --- 2. Create and Configure Node Library ---
 all_nodes = [
     add, subtract, multiply, divide, power, string_join, to_uppercase,
-    hadamard_gate, measure_qubit, compare_values, conditional_switch,
+    compare_values, conditional_switch,
     create_list, get_list_item, log_message, get_current_time
-]
+] + quantum_nodes
 nodeeditor_config = Config.from_function_list(all_nodes)
 config_dict = nodeeditor_config.dict()
 runner = JobRunner(nodeeditor_config)
+run_manager = RunManager(runner)
+workflow_store = SQLiteWorkflowStore(os.environ.get("QFLOW_WORKFLOW_DB", "workflows.sqlite3"))
+WORKFLOWS_PER_PAGE = 12
 
 # --- 3. Page Layouts ---
 landing_page_layout = html.Div(className="container", children=[
@@ -111,7 +109,12 @@ workflows_layout = html.Div(className="dashboard-container", children=[
         html.H1("My Workflows"),
         dcc.Link("＋ Create New Workflow", href="/editor", className="button-accent")
     ]),
-    html.Div(id="workflows-grid-container", className="workflows-grid")
+    html.Div(id="workflows-grid-container", className="workflows-grid"),
+    html.Div(className="workflows-pagination", children=[
+        html.Button("← Previous", id="workflows-prev-page", n_clicks=0, className="workflow-button"),
+        html.Span(id="workflows-page-label", className="workflow-date"),
+        html.Button("Next →", id="workflows-next-page", n_clicks=0, className="workflow-button"),
+    ]),
 ])
 
 def build_node_legend(conf: dict) -> List[html.Div]:
@@ -152,13 +155,15 @@ editor_layout = html.Div(className="editor-page-container", children=[
             )
         ]),
 
-        html.Div(id="output", style={'padding': '10px', 'backgroundColor': '#111827', 'color': 'white', 'height': '80px', 'overflowY': 'auto', 'borderTop': '1px solid #4B5563', 'fontSize': '0.875rem'}),
+        *background_run_components("workflow"),
+        html.Div(id="output", children="▶ Click 'Run Workflow' to see the results.", style={'padding': '10px', 'backgroundColor': '#111827', 'color': 'white', 'height': '80px', 'overflowY': 'auto', 'borderTop': '1px solid #4B5563', 'fontSize': '0.875rem'}),
     ]),
 ])
 
 # --- 4. Main App Layout & Callbacks ---
 app.layout = html.Div([
-    dcc.Store(id='workflow-storage', storage_type='local'),
+    dcc.Store(id='workflows-page', data=0),
+    dcc.Store(id='workflows-changed'),
     dcc.Store(id='save-notification-trigger'),
     dcc.Location(id='url', refresh=False),
     html.Div(id='page-content')
@@ -173,125 +178,142 @@ def display_page(pathname):
     else:
         return landing_page_layout
 
+def parse_query(search: str) -> Dict[str, str]:
+    return dict(param.split("=", 1) for param in (search or "").strip("?").split("&") if "=" in param)
+
 @app.callback(
     Output('workflows-grid-container', 'children'),
-    Input('workflow-storage', 'data')
+    Output('workflows-page-label', 'children'),
+    Input('workflows-page', 'data'),
+    Input('workflows-changed', 'data')
 )
-def update_workflow_dashboard(stored_data):
-    if not stored_data:
-        return html.P("No saved workflows yet. Create one in the editor!", style={'color': 'white', 'textAlign': 'center'})
+def update_workflow_dashboard(page, _):
+    total = workflow_store.count()
+    if not total:
+        return html.P("No saved workflows yet. Create one in the editor!", style={'color': 'white', 'textAlign': 'center'}), ""
 
+    pages = math.ceil(total / WORKFLOWS_PER_PAGE)
+    page = min(page or 0, pages - 1)
     cards = []
-    sorted_workflows = sorted(stored_data.items(), key=lambda item: item[0], reverse=True)
-    
-    for wf_id, wf_data in sorted_workflows:
+    for wf in workflow_store.list_workflows(offset=page * WORKFLOWS_PER_PAGE, limit=WORKFLOWS_PER_PAGE):
         card = html.Div(className="workflow-card", children=[
-            html.H3(wf_data.get('title', 'Untitled Workflow')),
-            html.P(wf_data.get('description', 'No description.'), className="workflow-description"),
+            html.H3(wf.title),
+            html.P(wf.description or 'No description.', className="workflow-description"),
             html.Div(className="workflow-footer", children=[
-                html.Span(f"Last modified: {wf_data.get('last_modified', 'N/A')}", className="workflow-date"),
+                html.Span(f"Last modified: {wf.modified:%Y-%m-%d} · {wf.size / 1024:.1f} KB", className="workflow-date"),
                 html.Div([
-                    html.Button("Delete", id={'type': 'delete-workflow-btn', 'index': wf_id}, n_clicks=0, className="workflow-button delete"),
-                    dcc.Link("Edit ➔", href=f"/editor?id={wf_id}", className="workflow-button edit")
+                    html.Button("Delete", id={'type': 'delete-workflow-btn', 'index': wf.id}, n_clicks=0, className="workflow-button delete"),
+                    dcc.Link("Edit ➔", href=f"/editor?id={wf.id}", className="workflow-button edit")
                 ])
             ])
         ])
         cards.append(card)
-    return cards
+    return cards, f"Page {page + 1} of {pages}"
+
+@app.callback(
+    Output('workflows-page', 'data'),
+    Input('workflows-prev-page', 'n_clicks'),
+    Input('workflows-next-page', 'n_clicks'),
+    State('workflows-page', 'data'),
+    prevent_initial_call=True
+)
+def change_workflows_page(_, __, page):
+    page = page or 0
+    if ctx.triggered_id == 'workflows-prev-page':
+        return max(page - 1, 0)
+    pages = math.ceil(workflow_store.count() / WORKFLOWS_PER_PAGE)
+    return min(page + 1, max(pages - 1, 0))
 
 @app.callback(
-    Output('workflow-storage', 'data', allow_duplicate=True),
+    Output('workflows-changed', 'data', allow_duplicate=True),
     Input({'type': 'delete-workflow-btn', 'index': ALL}, 'n_clicks'),
-    State('workflow-storage', 'data'),
     prevent_initial_call=True
 )
-def delete_workflow(delete_clicks, stored_data):
-    stored_data = stored_data or {}
-    triggered_id = ctx.triggered_id
-    
+def delete_workflow(delete_clicks):
     if not any(n_clicks and n_clicks > 0 for n_clicks in delete_clicks):
         return dash.no_update
 
-    if triggered_id:
-        wf_id_to_delete = triggered_id['index']
-        if wf_id_to_delete in stored_data:
-            del stored_data[wf_id_to_delete]
+    if ctx.triggered_id:
+        workflow_store.delete(ctx.triggered_id['index'])
 
-    return stored_data
+    return datetime.datetime.now().timestamp()
 
 @app.callback(
-    Output('workflow-storage', 'data'),
+    Output('workflows-changed', 'data'),
     Output('save-notification-trigger', 'data'),
     Input('btn_save', 'n_clicks'),
-    State('workflow-storage', 'data'),
     State('nodeeditor', 'nodes'),
     State('url', 'search'),
     State('workflow-title-input', 'value'),
     prevent_initial_call=True
 )
-def save_workflow(n_clicks, stored_data, nodes, search, title):
-    stored_data = stored_data or {}
-    
-    query_params = dict(param.split("=") for param in search.strip("?").split("&") if "=" in param)
-    wf_id = query_params.get('id')
-
-    if not wf_id:
-        wf_id = 'wf_' + str(int(datetime.datetime.now().timestamp()))
-    
-    stored_data[wf_id] = {
-        'id': wf_id,
-        'title': title or 'Untitled Workflow',
-        'description': 'Workflow saved from the editor.',
-        'last_modified': datetime.datetime.now().strftime("%Y-%m-%d"),
-        'nodes': nodes
-    }
-    
-    return stored_data, datetime.datetime.now().timestamp()
+def save_workflow(n_clicks, nodes, search, title):
+    summary = workflow_store.save(
+        nodes or {},
+        title=title or 'Untitled Workflow',
+        description='Workflow saved from the editor.',
+        workflow_id=parse_query(search).get('id'),
+    )
+    timestamp = summary.modified.timestamp()
+    return timestamp, timestamp
 
 @app.callback(
     Output('nodeeditor', 'nodes'),
     Output('workflow-title-input', 'value'),
-    Input('url', 'href'),
-    State('workflow-storage', 'data')
+    Input('url', 'href')
 )
-def load_workflow_into_editor(href, stored_data):
+def load_workflow_into_editor(href):
     if not href or 'editor' not in href.split('?')[0]:
         return dash.no_update
 
     search = href.split('?', 1)[-1] if '?' in href else ''
-    query_params = dict(param.split("=") for param in search.strip("?").split("&") if "=" in param)
-    wf_id = query_params.get('id')
+    wf_id = parse_query(search).get('id')
 
-    if wf_id and stored_data and wf_id in stored_data:
-        workflow_to_load = stored_data[wf_id]
-        return workflow_to_load.get('nodes', {}), workflow_to_load.get('title', 'Untitled Workflow')
-    
-    return {}, 'Untitled Workflow'
+    # Only the opened workflow is loaded from the store
+    workflow = workflow_store.get(wf_id) if wf_id else None
+    if workflow is not None:
+        return workflow.nodes, workflow.title
 
+    return {}, 'Untitled Workflow'
 
-@app.callback(
-    Output("output", "children"),
-    Input("btn_run", "n_clicks"),
-    State("nodeeditor", "nodes"),
-)
-def run_nodes(nclicks, nodes):
-    if not nclicks:
-        return "▶ Click 'Run Workflow' to see the results."
-    results_dict = runner.run(nodes)
-    if not results_dict:
+def format_run_log(snapshot, nodes):
+    if not snapshot.statuses:
         return "▶ Workflow ran, but no final results were produced."
     output_log = []
-    for node_id, result_object in results_dict.items():
+    for node_id, status in snapshot.statuses.items():
         node_type = nodes.get(node_id, {}).get("type", "Unknown")
-        final_value = result_object.result
-        log_entry = html.Div([
-            html.Span("✅ ", style={'color': '#10B981', 'fontWeight': 'bold'}),
-            html.Span(f"Node '{node_type}' finished with output: "),
-            html.Span(f"{final_value}", style={'color': '#A78BFA', 'fontFamily': 'monospace', 'fontWeight': 'bold'})
-        ])
+        if node_id in snapshot.errors:
+            log_entry = html.Div([
+                html.Span("❌ ", style={'color': '#EF4444', 'fontWeight': 'bold'}),
+                html.Span(f"Node '{node_type}' failed: "),
+                html.Span(snapshot.errors[node_id], style={'color': '#FCA5A5', 'fontFamily': 'monospace'})
+            ])
+        elif node_id in snapshot.results:
+            final_value = next(iter(snapshot.results[node_id].values()), None)
+            log_entry = html.Div([
+                html.Span("✅ ", style={'color': '#10B981', 'fontWeight': 'bold'}),
+                html.Span(f"Node '{node_type}' finished with output: "),
+                html.Span(f"{final_value}", style={'color': '#A78BFA', 'fontFamily': 'monospace', 'fontWeight': 'bold'})
+            ])
+        else:
+            log_entry = html.Div([
+                html.Span("⏳ ", style={'fontWeight': 'bold'}),
+                html.Span(f"Node '{node_type}' is {status}."),
+            ])
         output_log.append(log_entry)
     return output_log
 
+
+register_background_run(
+    app,
+    run_manager,
+    prefix="workflow",
+    editor_id="nodeeditor",
+    trigger=Input("btn_run", "n_clicks"),
+    output=Output("output", "children"),
+    format_snapshot=format_run_log,
+)
+
 # This clientside callback shows the "Saved!" notification
 app.clientside_callback(
     """
@@ -4,25 +4,13 @@ import os as _os
 import sys as _sys
 import json
 
-import dash as _dash
-
-# noinspection PyUnresolvedReferences
-from ._imports_ import *
-from ._imports_ import __all__
-
-if not hasattr(_dash, '__plotly_dash') and not hasattr(_dash, 'development'):
-    print('Dash was not successfully imported. '
-          'Make sure you don\'t have a file '
-          'named \n"dash.py" in your current directory.', file=_sys.stderr)
-    _sys.exit(1)
+# The Dash component is loaded lazily (see `__getattr__` below) so that the
+# headless core (config, models, jobrunner) can be imported in workers, batch
+# jobs and CLIs without paying for the Dash/Flask/Plotly imports.
+__all__ = ["Flowfunc"]
 
 _basepath = _os.path.dirname(__file__)
 _filepath = _os.path.abspath(_os.path.join(_basepath, 'package-info.json'))
-with open(_filepath) as f:
-    package = json.load(f)
-
-package_name = package['name'].replace(' ', '_').replace('-', '_')
-__version__ = package['version']
 
 _current_path = _os.path.dirname(_os.path.abspath(__file__))
 
@@ -30,58 +18,123 @@ _this_module = _sys.modules[__name__]
 
 async_resources = []
 
-_js_dist = []
-
-_js_dist.extend(
-    [
-        {
-            "relative_package_path": "async-{}.js".format(async_resource),
-            "external_url": (
-                "https://unpkg.com/{0}@{2}"
-                "/{1}/async-{3}.js"
-            ).format(package_name, __name__, __version__, async_resource),
-            "namespace": package_name,
-            "async": True,
-        }
-        for async_resource in async_resources
-    ]
-)
-
-# TODO: Figure out if unpkg link works
-_js_dist.extend(
-    [
-        {
-            "relative_package_path": "async-{}.js.map".format(async_resource),
-            "external_url": (
-                "https://unpkg.com/{0}@{2}"
-                "/{1}/async-{3}.js.map"
-            ).format(package_name, __name__, __version__, async_resource),
-            "namespace": package_name,
-            "dynamic": True,
-        }
-        for async_resource in async_resources
-    ]
-)
-
-_js_dist.extend(
-    [
-        {
-            'relative_package_path': 'flowfunc.min.js',
-    
-            'namespace': package_name
-        },
-        {
-            'relative_package_path': 'flowfunc.min.js.map',
-    
-            'namespace': package_name,
-            'dynamic': True
-        }
-    ]
-)
-
-_css_dist = []
-
-
-for _component in __all__:
-    setattr(locals()[_component], '_js_dist', _js_dist)
-    setattr(locals()[_component], '_css_dist', _css_dist)
+_lazy_attributes = {}
+
+
+def _load_package_info():
+    with open(_filepath) as f:
+        package = json.load(f)
+    package_name = package['name'].replace(' ', '_').replace('-', '_')
+    _lazy_attributes.update(
+        package=package,
+        package_name=package_name,
+        __version__=package['version'],
+    )
+
+
+def _load_resources():
+    package_name = __getattr__('package_name')
+    __version__ = __getattr__('__version__')
+
+    _js_dist = []
+
+    _js_dist.extend(
+        [
+            {
+                "relative_package_path": "async-{}.js".format(async_resource),
+                "external_url": (
+                    "https://unpkg.com/{0}@{2}"
+                    "/{1}/async-{3}.js"
+                ).format(package_name, __name__, __version__, async_resource),
+                "namespace": package_name,
+                "async": True,
+            }
+            for async_resource in async_resources
+        ]
+    )
+
+    # TODO: Figure out if unpkg link works
+    _js_dist.extend(
+        [
+            {
+                "relative_package_path": "async-{}.js.map".format(async_resource),
+                "external_url": (
+                    "https://unpkg.com/{0}@{2}"
+                    "/{1}/async-{3}.js.map"
+                ).format(package_name, __name__, __version__, async_resource),
+                "namespace": package_name,
+                "dynamic": True,
+            }
+            for async_resource in async_resources
+        ]
+    )
+
+    _js_dist.extend(
+        [
+            {
+                'relative_package_path': 'flowfunc.min.js',
+
+                'namespace': package_name
+            },
+            {
+                'relative_package_path': 'flowfunc.min.js.map',
+
+                'namespace': package_name,
+                'dynamic': True
+            }
+        ]
+    )
+
+    _css_dist = []
+
+    _lazy_attributes.update(_js_dist=_js_dist, _css_dist=_css_dist)
+
+
+def _load_components():
+    try:
+        import dash as _dash
+    except ImportError as e:
+        raise ImportError(
+            'The Flowfunc component requires Dash. '
+            'Install it with `pip install dash` or use the "full" extra.'
+        ) from e
+
+    if not hasattr(_dash, '__plotly_dash') and not hasattr(_dash, 'development'):
+        raise ImportError(
+            'Dash was not successfully imported. '
+            'Make sure you don\'t have a file '
+            'named \n"dash.py" in your current directory.'
+        )
+
+    from . import _imports_
+
+    for _component in _imports_.__all__:
+        component = getattr(_imports_, _component)
+        setattr(component, '_js_dist', __getattr__('_js_dist'))
+        setattr(component, '_css_dist', __getattr__('_css_dist'))
+        _lazy_attributes[_component] = component
+        # Importing the submodule sets it as an attribute of this package,
+        # shadowing the component class with the same name.
+        globals()[_component] = component
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        if name in ('package', 'package_name', '__version__'):
+            _load_package_info()
+        elif name in ('_js_dist', '_css_dist'):
+            _load_resources()
+        elif name in __all__:
+            _load_components()
+    try:
+        return _lazy_attributes[name]
+    except KeyError:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}"
+        ) from None
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | {
+        'package', 'package_name', '__version__', '_js_dist', '_css_dist'
+    })
@@ -0,0 +1,213 @@
+"""
+Background runs
+---------------
+Run flows in the background and follow their progress node by node.
+
+A `RunManager` starts a flow and returns a run ID immediately. The status,
+results and errors of the nodes can then be polled using the run ID while
+the flow is running, for example from a Dash callback triggered by an
+interval (see `flowfunc.dash_integration`).
+
+Flows are run in the shared runtime of the JobRunner when its method is sync
+or async, and as python-rq jobs when it is distributed. The progress of a
+distributed run is read from redis, so it can be polled from any process.
+"""
+from __future__ import annotations
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Union
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from .graph import Graph, RunResult, RunState
+from .jobrunner import JobRunner
+from .models import OutNode
+from .spill import Spilled, restore
+
+# Status shown in the editor for the nodes which are waiting for other nodes
+LOCAL_STATUS_MAP = {"idle": "deferred"}
+
+
+class RunSnapshot(BaseModel):
+    """Progress of a run at a point in time"""
+
+    run_id: str
+    done: bool
+    # Node id to status, using the status names of the Flowfunc component
+    statuses: Dict[str, str]
+    # Results (result_mapped) of the finished nodes
+    results: Dict[str, Any]
+    # Errors of the failed nodes
+    errors: Dict[str, str]
+
+
+class _LocalRun:
+    __slots__ = ("graph", "state", "future")
+
+    def __init__(self, graph: Graph, state: RunState, future: Future):
+        self.graph = graph
+        self.state = state
+        self.future = future
+
+
+class RunManager:
+    """Starts flows in the background and keeps track of them
+
+    Attributes
+    ----------
+    job_runner: JobRunner
+        The runner used to run the flows
+    max_runs: int
+        Number of finished local runs which are kept. The oldest finished runs
+        are forgotten when there are more.
+    """
+
+    def __init__(self, job_runner: JobRunner, max_runs: int = 100):
+        self.job_runner = job_runner
+        self.max_runs = max_runs
+        self._runs: OrderedDict[str, _LocalRun] = OrderedDict()
+        # The runs are started and polled from many threads (Dash callbacks)
+        self._lock = threading.Lock()
+
+    @property
+    def distributed(self) -> bool:
+        return self.job_runner.method in ("distributed", "async_distributed")
+
+    def start(
+        self,
+        out_dict: Dict[str, Union[OutNode, dict]],
+        selected_node_ids: Optional[List[str]] = None,
+        keep: str = "all",
+        pinned: Optional[List[str]] = None,
+    ) -> str:
+        """Start running a flow and return the ID of the run
+
+        See `JobRunner.run` for `keep` and `pinned`, which only apply to local
+        runs. Raises a GraphValidationError if the flow is not valid.
+        """
+        if self.distributed:
+            if self.job_runner.same_worker:
+                raise ValueError(
+                    "Runs in the same worker don't report the status of each node."
+                )
+            mapped_dict = self.job_runner.submit(out_dict, selected_node_ids).result()
+            return next(iter(mapped_dict.values())).run_id
+        graph = self.job_runner.prepare(out_dict, selected_node_ids)
+        state = RunState(len(graph))
+        future = asyncio.run_coroutine_threadsafe(
+            self.job_runner.execute(
+                graph, state, self.job_runner.kept_nodes(graph, keep, pinned)
+            ),
+            self.job_runner.runtime_loop(),
+        )
+        run_id = uuid4().hex
+        with self._lock:
+            self._runs[run_id] = _LocalRun(graph, state, future)
+            self._forget_old_runs()
+        return run_id
+
+    def _forget_old_runs(self):
+        finished = [run_id for run_id, run in self._runs.items() if run.future.done()]
+        for run_id in finished[: max(len(self._runs) - self.max_runs, 0)]:
+            del self._runs[run_id]
+
+    def _local_run(self, run_id: str) -> Optional[_LocalRun]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def done(self, run_id: str) -> bool:
+        """Check if a run has finished"""
+        return self.snapshot(run_id, with_results=False).done
+
+    def result(self, run_id: str, timeout: Optional[float] = None) -> RunResult:
+        """Wait for a local run to finish and return its results"""
+        run = self._local_run(run_id)
+        if run is None:
+            raise KeyError(f"Run {run_id} not found.")
+        run.future.result(timeout=timeout)
+        return RunResult(run.graph, run.state)
+
+    def cancel(self, run_id: str):
+        """Cancel a run. The unfinished nodes are marked as canceled."""
+        run = self._local_run(run_id)
+        if run is not None:
+            loop = self.job_runner.runtime_loop()
+            loop.call_soon_threadsafe(run.future.cancel)
+        elif self.distributed:
+            self.job_runner.cancel(run_id)
+        else:
+            raise KeyError(f"Run {run_id} not found.")
+
+    def snapshot(self, run_id: str, with_results: bool = True) -> RunSnapshot:
+        """Current status, results and errors of the nodes of a run"""
+        run = self._local_run(run_id)
+        if run is not None:
+            return self._local_snapshot(run_id, run, with_results)
+        if self.distributed:
+            return self._distributed_snapshot(run_id, with_results)
+        raise KeyError(f"Run {run_id} not found.")
+
+    def _local_snapshot(
+        self, run_id: str, run: _LocalRun, with_results: bool
+    ) -> RunSnapshot:
+        graph, state = run.graph, run.state
+        # Checking if the run is done before reading the states so that the
+        # snapshot of a done run always has the final states
+        done = run.future.done()
+        statuses, results, errors = {}, {}, {}
+        for i, nodeid in enumerate(graph.ids):
+            status = state.status[i]
+            statuses[nodeid] = LOCAL_STATUS_MAP.get(status, status)
+            if state.error[i] is not None:
+                errors[nodeid] = str(state.error[i])
+            elif with_results and status == "finished":
+                if done:
+                    # Results spilled to disk with a memory budget
+                    restore(state, (i,))
+                mapped = state.result_mapped[i]
+                if mapped is not None and any(
+                    isinstance(value, Spilled) for value in list(mapped.values())
+                ):
+                    # The runner owns the spilled results until the run is done
+                    continue
+                results[nodeid] = None if mapped is None else dict(mapped)
+        return RunSnapshot(
+            run_id=run_id, done=done, statuses=statuses, results=results, errors=errors
+        )
+
+    def _distributed_snapshot(self, run_id: str, with_results: bool) -> RunSnapshot:
+        from rq.job import JobStatus
+
+        from .distributed import NodeJob, RUN_JOBS_KEY
+
+        connection = self.job_runner.queue.connection
+        job_ids = [
+            job_id.decode() if isinstance(job_id, bytes) else job_id
+            for job_id in connection.smembers(RUN_JOBS_KEY.format(run_id))
+        ]
+        if not job_ids:
+            raise KeyError(f"Run {run_id} not found.")
+        statuses, results, errors = {}, {}, {}
+        # Deferred jobs can only start once a queued, scheduled or started job
+        # finishes. If there are none, the deferred jobs depend on a failed or
+        # canceled job and will never run.
+        done = True
+        for job in NodeJob.fetch_many(job_ids, connection=connection):
+            if job is None:
+                continue
+            nodeid = job.meta.get("node_id", job.id)
+            status = job.get_status(refresh=False)
+            statuses[nodeid] = status
+            if status == JobStatus.FINISHED:
+                if with_results:
+                    results[nodeid] = job.result_mapped
+            elif status == JobStatus.FAILED:
+                errors[nodeid] = (job.exc_info or "").strip().split("\n")[-1]
+            elif status in (JobStatus.QUEUED, JobStatus.SCHEDULED, JobStatus.STARTED):
+                done = False
+        return RunSnapshot(
+            run_id=run_id, done=done, statuses=statuses, results=results, errors=errors
+        )
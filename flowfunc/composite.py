@@ -0,0 +1,271 @@
+"""
+Composite
+---------
+Workflows saved as reusable nodes.
+
+A composite node is a flow whose exposed input and output ports map to ports
+of its inner nodes. The flow is parsed, validated and flattened (composites
+used inside it are inlined too) once, when the composite is added to the
+config using `Config.add_composite`.
+
+The runner inlines the composite nodes of a flow before running it: the inner
+nodes are copied into the flow with the ids ``<composite id>/<inner id>`` and
+the connections to and from the composite are rewired to the inner ports. So
+the inner nodes are scheduled along with the rest of the flow, a node
+connected to an output of the composite starts as soon as that output is
+ready, and the pure inner nodes of all the copies of a composite are
+simplified by the planner like any other node. The composite node itself is
+kept as a node which gathers the exposed outputs, so its results can still
+be looked up by its id.
+"""
+from __future__ import annotations
+from copy import deepcopy
+from typing import Dict, List, Optional, Tuple, Union
+
+from .config import Config
+from .exceptions import GraphValidationError
+from .graph import Graph
+from .models import Node, Port
+from .planner import topological_order
+from .validation import validate_graph
+
+# (inner node id, inner port name)
+PortRef = Tuple[str, str]
+
+
+def _port(ports, name: str) -> Optional[Port]:
+    for port in ports or ():
+        if port.name == name:
+            return port
+    return None
+
+
+class Composite:
+    """A flow compiled to be inlined in other flows
+
+    Parameters
+    ----------
+    node_type: str
+        Type of the composite node
+    flow: dict
+        The flow, a dict of node dicts or OutNode objects like the ones saved
+        by the editor
+    inputs: dict
+        Name of each exposed input to the inner input port (or a list of
+        them) it's connected to
+    outputs: dict
+        Name of each exposed output to the inner output port it comes from
+    config: Config
+        The config with the inner nodes
+    check_types: bool
+        Check the types of the connections of the flow
+    """
+
+    def __init__(
+        self,
+        node_type: str,
+        flow: dict,
+        inputs: Dict[str, Union[PortRef, List[PortRef]]],
+        outputs: Dict[str, PortRef],
+        config: Config,
+        check_types: bool = False,
+    ):
+        self.type = node_type
+        graph = Graph.from_dict(flow)
+        issues = validate_graph(graph, config, check_types=check_types)
+        if issues:
+            raise GraphValidationError(issues)
+        # The ports exposed by composites used in the flow are resolved to
+        # their inner ports
+        nested = {
+            graph.ids[i]: composite_of(config.get_node(node_type))
+            for i, node_type in enumerate(graph.types)
+        }
+        inputs = {
+            name: [
+                ref
+                for refs in ([refs] if isinstance(refs, tuple) else refs)
+                for ref in self._resolve_input(nested, refs)
+            ]
+            for name, refs in inputs.items()
+        }
+        outputs = {
+            name: self._resolve_output(nested, ref) for name, ref in outputs.items()
+        }
+        graph = inline_composites(graph, config)
+        self.graph = graph
+        self.order = topological_order(graph)
+        connected = {
+            (graph.edge_dst[edge], graph.edge_dst_port[edge])
+            for edge in range(len(graph.edge_dst))
+        }
+        self.input_ports: List[Port] = []
+        self.inputs: Dict[str, List[Tuple[int, str]]] = {}
+        for name, refs in inputs.items():
+            targets = []
+            for node_id, port_name in refs:
+                i = self._index(node_id)
+                port = _port(config.get_node(graph.types[i]).inputs, port_name)
+                if port is None:
+                    raise ValueError(f"Node {node_id} has no input {port_name}.")
+                if (i, port_name) in connected:
+                    raise ValueError(
+                        f"Input {port_name} of node {node_id} is already connected."
+                    )
+                targets.append((i, port_name))
+                if len(targets) == 1:
+                    self.input_ports.append(self._exposed(port, name))
+            self.inputs[name] = targets
+        self.output_ports: List[Port] = []
+        self.outputs: Dict[str, Tuple[int, str]] = {}
+        for name, (node_id, port_name) in outputs.items():
+            i = self._index(node_id)
+            port = _port(config.get_node(graph.types[i]).outputs, port_name)
+            if port is None:
+                raise ValueError(f"Node {node_id} has no output {port_name}.")
+            self.output_ports.append(self._exposed(port, name))
+            self.outputs[name] = (i, port_name)
+        if not self.outputs:
+            raise ValueError("A composite node should have at least one output.")
+
+    @staticmethod
+    def _resolve_input(nested: dict, ref: PortRef) -> List[PortRef]:
+        node_id, port_name = ref
+        composite = nested.get(node_id)
+        if composite is None or port_name not in composite.inputs:
+            return [ref]
+        return [
+            (f"{node_id}/{composite.graph.ids[i]}", inner_port)
+            for i, inner_port in composite.inputs[port_name]
+        ]
+
+    @staticmethod
+    def _resolve_output(nested: dict, ref: PortRef) -> PortRef:
+        node_id, port_name = ref
+        composite = nested.get(node_id)
+        if composite is None or port_name not in composite.outputs:
+            return ref
+        i, inner_port = composite.outputs[port_name]
+        return f"{node_id}/{composite.graph.ids[i]}", inner_port
+
+    def _index(self, node_id: str) -> int:
+        if node_id not in self.graph.index:
+            raise ValueError(f"Node {node_id} is not part of the composite {self.type}.")
+        return self.graph.index[node_id]
+
+    @staticmethod
+    def _exposed(port: Port, name: str) -> Port:
+        port = deepcopy(port)
+        port.label = port.label.replace(port.name, name, 1) if port.label else name
+        port.name = name
+        return port
+
+    def node(self, **kwargs) -> Node:
+        """The config node of the composite"""
+        kwargs.setdefault("label", self.type.split(".")[-1].replace("_", " ").title())
+        return Node(
+            type=self.type,
+            method=self.gather,
+            inputs=self.input_ports,
+            outputs=self.output_ports,
+            **kwargs,
+        )
+
+    def gather(self, **outputs):
+        """Collect the exposed outputs, in the order of the output ports
+
+        This is the function of the node which is left in place of the
+        composite when it's inlined.
+        """
+        values = tuple(outputs.get(port.name) for port in self.output_ports)
+        return values[0] if len(values) == 1 else values
+
+    def inline(self, graph: Graph, prefix: str, inputs: dict) -> Dict[int, int]:
+        """Add the inner nodes and connections to a graph
+
+        The literal `inputs` of the composite node are set on the inner
+        ports they are exposed by. Returns the inner to outer node index
+        mapping.
+        """
+        inner = self.graph
+        literals = {}
+        for name, value in inputs.items():
+            for i, port_name in self.inputs.get(name, ()):
+                literals.setdefault(i, {})[port_name] = value
+        mapping = {}
+        for i in self.order:
+            node_inputs = inner.inputs[i]
+            if i in literals:
+                node_inputs = {**node_inputs, **literals[i]}
+            mapping[i] = graph.add_node(
+                f"{prefix}/{inner.ids[i]}", inner.types[i], node_inputs, inner.settings[i]
+            )
+        for edge, (src, dst) in enumerate(zip(inner.edge_src, inner.edge_dst)):
+            graph.add_edge(
+                mapping[src], inner.edge_src_port[edge], mapping[dst], inner.edge_dst_port[edge]
+            )
+        return mapping
+
+
+def composite_of(node: Node) -> Optional[Composite]:
+    """The composite a config node was created from, if any"""
+    owner = getattr(node.method, "__self__", None)
+    return owner if isinstance(owner, Composite) else None
+
+
+def inline_composites(graph: Graph, config: Config) -> Graph:
+    """Replace the composite nodes of a graph by their inner nodes
+
+    The graph is returned as it is if it has no composite nodes. Composite
+    nodes which already have results (see `Graph.preset`) are not inlined.
+    The graph should be validated first.
+    """
+    composites: Dict[str, Composite] = {}
+    for node_type in set(graph.types):
+        if config.has_node(node_type):
+            composite = composite_of(config.get_node(node_type))
+            if composite is not None:
+                composites[node_type] = composite
+    if not composites:
+        return graph
+    inlined = Graph()
+    inlined.source = graph.source
+    mapping = {}
+    # Outer node index to inner to outer index mapping of the inlined ones
+    inner_mapping: Dict[int, Dict[int, int]] = {}
+    for i in range(len(graph)):
+        mapping[i] = inlined.add_node(
+            graph.ids[i],
+            graph.types[i],
+            {} if graph.types[i] in composites and i not in graph.preset else graph.inputs[i],
+            graph.settings[i],
+        )
+        if i in graph.preset:
+            inlined.preset[mapping[i]] = graph.preset[i]
+        elif graph.types[i] in composites:
+            composite = composites[graph.types[i]]
+            inner_mapping[i] = composite.inline(inlined, graph.ids[i], graph.inputs[i])
+            # The composite node gathers the outputs
+            for name, (src, port_name) in composite.outputs.items():
+                inlined.add_edge(inner_mapping[i][src], port_name, mapping[i], name)
+    for edge, (src, dst) in enumerate(zip(graph.edge_src, graph.edge_dst)):
+        src_port, dst_port = graph.edge_src_port[edge], graph.edge_dst_port[edge]
+        if src >= 0 and src in inner_mapping:
+            inner_src, src_port = composites[graph.types[src]].outputs[src_port]
+            source = inner_mapping[src][inner_src]
+        else:
+            source = mapping[src] if src >= 0 else -1
+        if dst in inner_mapping:
+            targets = [
+                (inner_mapping[dst][i], port_name)
+                for i, port_name in composites[graph.types[dst]].inputs[dst_port]
+            ]
+        else:
+            targets = [(mapping[dst], dst_port)]
+        for target, port_name in targets:
+            inlined.add_edge(source, src_port, target, port_name, src_id=graph.missing.get(edge))
+        if src in inner_mapping or dst in inner_mapping:
+            # The connections of the source flow are stale for these nodes
+            inlined.rewired.update(mapping[i] for i in (src, dst) if i >= 0)
+    inlined.rewired.update(mapping[i] for i in graph.rewired)
+    return inlined
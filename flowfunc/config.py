@@ -2,7 +2,11 @@ from __future__ import annotations
 from copy import deepcopy
 from dataclasses import fields, is_dataclass
 from enum import Enum
+import hashlib
 import inspect
+import json
+import os
+import sys
 from typing import Any, Callable, List, Optional, Union
 from types import UnionType
 try:
@@ -13,7 +17,40 @@ from warnings import warn
 from pydantic import BaseModel
 
 from .models import Color, ConfigModel, ControlType, Node, Port, Control
-from .utils import issubclass_safe
+from .serialization import function_path, import_function, pack, unpack
+from .utils import issubclass_safe, logger, module_fingerprint
+
+# Bump this when the layout of the cache file changes
+CONFIG_CACHE_VERSION = 1
+
+# Attribute of a function where the options set using `node_options` are stored
+NODE_OPTIONS_ATTRIBUTE = "__flowfunc_node__"
+
+
+def node_options(**options):
+    """Decorator to set the options of the node created from a function
+
+    The options are the fields of the Node model, for example `timeout`.
+
+    Example
+    -------
+    @node_options(timeout=10)
+    def fetch(url: str) -> str:
+        ...
+    """
+    unknown = set(options) - set(Node.model_fields)
+    if unknown:
+        raise TypeError(f"Unknown node option(s): {', '.join(sorted(unknown))}")
+
+    def decorator(func):
+        setattr(
+            func,
+            NODE_OPTIONS_ATTRIBUTE,
+            {**getattr(func, NODE_OPTIONS_ATTRIBUTE, {}), **options},
+        )
+        return func
+
+    return decorator
 
 
 def arg_or_kwarg(par: inspect.Parameter):
@@ -179,6 +216,7 @@ def process_node(func: Callable) -> Node:
             )
         node_dict["inputs"].append(input_dict)
     node_dict["outputs"] = process_output(sign.return_annotation)
+    node_dict.update(getattr(func, NODE_OPTIONS_ATTRIBUTE, {}))
 
     return Node(**node_dict)
 
@@ -286,6 +324,125 @@ def ports_from_nodes(nodes: List[Node]) -> List[Port]:
     return ports
 
 
+def _annotation_modules(annotation: Any, modules: set, seen: set) -> None:
+    """Add the modules of the types used in an annotation to `modules`
+
+    The fields of pydantic models and dataclasses are followed too since
+    the controls of the ports are created from them.
+    """
+    if isinstance(annotation, str) or annotation is inspect.Signature.empty:
+        return
+    try:
+        if annotation in seen:
+            return
+        seen.add(annotation)
+    except TypeError:
+        # Unhashable annotation metadata
+        return
+    for arg in get_args(annotation):
+        _annotation_modules(arg, modules, seen)
+    if not inspect.isclass(annotation):
+        return
+    module = getattr(sys.modules.get(annotation.__module__), "__file__", None)
+    if module:
+        # Builtin types don't have a source file and cannot change
+        modules.add(annotation.__module__)
+    if issubclass_safe(annotation, BaseModel):
+        for field in annotation.model_fields.values():
+            _annotation_modules(field.annotation, modules, seen)
+    elif is_dataclass(annotation):
+        for field in fields(annotation):
+            _annotation_modules(field.type, modules, seen)
+
+
+def config_cache_path(cache_dir: str, function_list: List[Callable]) -> str | None:
+    """Path of the cache file for a list of functions
+
+    The file name is derived from the function types and the fingerprint
+    (file hash and modification time) of the modules where they, the types
+    of their annotations and this module are defined. Returns None if the
+    functions cannot be cached.
+    """
+    modules = {__name__}
+    seen: set = set()
+    for func in function_list:
+        modules.add(func.__module__)
+        try:
+            sign = inspect.signature(func)
+        except (TypeError, ValueError):
+            return None
+        for parameter in sign.parameters.values():
+            _annotation_modules(parameter.annotation, modules, seen)
+        _annotation_modules(sign.return_annotation, modules, seen)
+    fingerprint = module_fingerprint(modules)
+    if not fingerprint:
+        return None
+    digest = hashlib.sha256(
+        "\n".join(
+            [str(CONFIG_CACHE_VERSION), fingerprint]
+            + [".".join([func.__module__, func.__name__]) for func in function_list]
+        ).encode()
+    ).hexdigest()
+    return os.path.join(cache_dir, f"flowfunc-config-{digest[:32]}.json")
+
+
+def save_config_cache(
+    cache_path: str, function_list: List[Callable], nodes: List[Node], ports: List[Port]
+):
+    """Write the processed nodes and ports (without the callables) to the cache"""
+    data = {
+        "version": CONFIG_CACHE_VERSION,
+        "functions": [".".join([func.__module__, func.__name__]) for func in function_list],
+        "nodes": [node.model_dump(mode="json") for node in nodes],
+        "ports": [port.model_dump(mode="json") for port in ports],
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Writing to a temporary file first so that a process reading the
+        # cache at the same time never sees a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not write config cache {cache_path}: {e}")
+
+
+def load_config_cache(
+    cache_path: str, function_list: List[Callable]
+) -> tuple[List[Node], List[Port]] | None:
+    """Reconstruct the nodes and ports from the cache and rebind the functions
+
+    Returns None if there is no valid cache for the functions.
+    """
+    try:
+        with open(cache_path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    func_types = [".".join([func.__module__, func.__name__]) for func in function_list]
+    if data.get("version") != CONFIG_CACHE_VERSION or data.get("functions") != func_types:
+        return None
+    try:
+        # Options set using `node_options` aren't cached since they are not
+        # always serializable. They are read from the functions again.
+        nodes = [
+            Node.model_validate(
+                {
+                    **node_data,
+                    "method": func,
+                    **getattr(func, NODE_OPTIONS_ATTRIBUTE, {}),
+                }
+            )
+            for node_data, func in zip(data["nodes"], function_list)
+        ]
+        ports = [Port.model_validate(port_data) for port_data in data["ports"]]
+    except Exception as e:
+        logger.warning(f"Could not load config cache {cache_path}: {e}")
+        return None
+    return nodes, ports
+
+
 class Config:
     """This class is the python class corresponding to the flume config object.
 
@@ -303,6 +460,7 @@ class Config:
         function_list: List[Callable],
         extra_nodes: Optional[List[Node]] = None,
         extra_ports: Optional[List[Port]] = None,
+        cache_dir: Optional[str] = None,
     ):
         """Create config from a list of functions
 
@@ -314,23 +472,42 @@ class Config:
             List of extra nodes that should be added added to the config
         extra_ports: Optional[List[Node]]
             List of extra ports that should be added added to the config
+        cache_dir: Optional[str]
+            Directory where the processed nodes and ports are cached. If the
+            modules of the functions haven't changed since the cache was
+            written, the nodes are reconstructed from the cache and the
+            functions are rebound to them instead of processing the
+            signatures again.
 
         Returns
         -------
         config: Config
             An instance of Config object
         """
-        nodes = []
-        for func in function_list:
-            # Not using docstring based parsing
-            node = process_node(func)
-            nodes.append(node)
+        cache_path = None
+        cached = None
+        if cache_dir:
+            cache_path = config_cache_path(cache_dir, function_list)
+        if cache_path:
+            cached = load_config_cache(cache_path, function_list)
+        if cached:
+            nodes, ports = cached
+        else:
+            nodes = []
+            for func in function_list:
+                # Not using docstring based parsing
+                node = process_node(func)
+                nodes.append(node)
+            ports = ports_from_nodes(nodes)
+            if cache_path:
+                save_config_cache(cache_path, function_list, nodes, ports)
 
         if extra_nodes is None:
             extra_nodes = []
         if extra_ports is None:
             extra_ports = []
-        ports = list(set(extra_ports + ports_from_nodes(nodes)))
+        # Unique ports, in a stable order
+        ports = list(dict.fromkeys(extra_ports + ports))
         nodes = nodes + extra_nodes
         return cls(nodes, ports)
 
@@ -340,6 +517,15 @@ class Config:
         # ports from nodes are automatically extracted and used.
         self.ports = ports
 
+    @property
+    def nodes(self) -> List[Node]:
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes: List[Node]):
+        self._nodes = nodes
+        self._node_index = {}
+
     def get_node(self, node_type: str) -> Node:
         """Get a node object
 
@@ -353,10 +539,101 @@ class Config:
         node: Node
             Node pydantic object
         """
-        for node in self.nodes:
-            if node.type == node_type:
-                return node
-        raise ValueError(f"Node type {node_type} not found in config.")
+        node = self._node_index.get(node_type)
+        if node is None:
+            # Nodes could have been added to the list after the index was built
+            self._node_index = {node.type: node for node in reversed(self.nodes)}
+            node = self._node_index.get(node_type)
+        if node is None:
+            raise ValueError(f"Node type {node_type} not found in config.")
+        return node
+
+    def add_composite(
+        self,
+        node_type: str,
+        flow: dict,
+        inputs: dict,
+        outputs: dict,
+        check_types: bool = False,
+        **kwargs,
+    ) -> Node:
+        """Add a flow as a reusable composite node (see `flowfunc.composite`)
+
+        The flow is validated and compiled once here. When a flow using the
+        composite is run, its inner nodes are inlined in the flow.
+
+        Parameters
+        ----------
+        node_type: str
+            Type of the composite node
+        flow: dict
+            The flow, with nodes from this config (including other composites)
+        inputs: dict
+            Name of each exposed input to the (inner node id, input port), or
+            a list of them, it's connected to
+        outputs: dict
+            Name of each exposed output to the (inner node id, output port)
+            it comes from
+        check_types: bool
+            Check the types of the connections of the flow
+        kwargs:
+            Other fields of the node like label, category or description
+
+        Returns
+        -------
+        node: Node
+            The composite node
+        """
+        from .composite import Composite
+
+        composite = Composite(node_type, flow, inputs, outputs, self, check_types)
+        node = composite.node(**kwargs)
+        self.nodes = [n for n in self.nodes if n.type != node_type] + [node]
+        return node
+
+    def add_map(
+        self,
+        node_type: str,
+        over: str,
+        chunk_size: int = 1,
+        map_type: Optional[str] = None,
+        **kwargs,
+    ) -> Node:
+        """Add a node which applies a node to each item of a list (see `flowfunc.fanout`)
+
+        Parameters
+        ----------
+        node_type: str
+            Type of the node which is applied to each item
+        over: str
+            The input of the node which gets the items. The map node takes a
+            list in this input and the other inputs are passed to every call.
+        chunk_size: int
+            Default number of items per task. Can be changed with the
+            chunk_size input of the map node.
+        map_type: str
+            Optional. Type of the map node, by default "map.<node_type>"
+        kwargs:
+            Other fields of the node like label, category or description
+
+        Returns
+        -------
+        node: Node
+            The map node. Its result is the list of the results for each item.
+        """
+        from .fanout import MapNode
+
+        node = MapNode(self.get_node(node_type), over, chunk_size).node(map_type, **kwargs)
+        self.nodes = [n for n in self.nodes if n.type != node.type] + [node]
+        return node
+
+    def has_node(self, node_type: str) -> bool:
+        """Check if a node type is available in the config"""
+        try:
+            self.get_node(node_type)
+        except ValueError:
+            return False
+        return True
 
     def dict(self) -> dict:
         """Function to generate the config dict
@@ -378,3 +655,64 @@ class Config:
         )
 
         return config_model.model_dump(exclude_none=True)
+
+    def to_bytes(self, compress: bool = True) -> bytes:
+        """Encode the config in the compact binary format
+
+        The functions of the nodes are stored by their import path. Options set
+        using `node_options` are read from the functions again when decoding.
+        Composite and map nodes are left out, they have to be added again.
+        """
+        # Their functions are methods of the composite or map
+        nodes = [node for node in self.nodes if not inspect.ismethod(node.method)]
+        return pack(
+            {
+                "kind": "config",
+                "methods": [function_path(node.method) for node in nodes],
+                "nodes": [node.model_dump(mode="json") for node in nodes],
+                "ports": (
+                    None
+                    if self.ports is None
+                    else [port.model_dump(mode="json") for port in self.ports]
+                ),
+            },
+            compress,
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, function_list: Optional[List[Callable]] = None):
+        """Decode a config encoded using `to_bytes`
+
+        Parameters
+        ----------
+        data: bytes
+            The encoded config
+        function_list: Optional[List[Callable]]
+            Functions to bind to the nodes. Functions which are not in the list
+            are imported using their import path.
+
+        Returns
+        -------
+        config: Config
+            An instance of Config object
+        """
+        payload = unpack(data, allow_pickle=False)
+        if not isinstance(payload, dict) or payload.get("kind") != "config":
+            raise ValueError("Not an encoded config.")
+        functions = {function_path(func): func for func in function_list or []}
+        nodes = []
+        for path, node_data in zip(payload["methods"], payload["nodes"]):
+            func = functions.get(path) or import_function(path)
+            nodes.append(
+                Node.model_validate(
+                    {
+                        **node_data,
+                        "method": func,
+                        **getattr(func, NODE_OPTIONS_ATTRIBUTE, {}),
+                    }
+                )
+            )
+        ports = payload["ports"]
+        if ports is not None:
+            ports = [Port.model_validate(port_data) for port_data in ports]
+        return cls(nodes, ports)
@@ -0,0 +1,122 @@
+"""
+Dash integration
+----------------
+Run flows from a Dash app without blocking a server worker for the whole run.
+
+`background_run_components` creates the store and interval which track a run,
+and `register_background_run` registers the callback which starts a run when
+the trigger fires and then polls its progress. The status of each node is
+written to the `nodes_status` prop of the Flowfunc component as the nodes
+finish, so the editor highlights them while the flow is running.
+
+Local runs live in the memory of the server process. Use a distributed
+JobRunner (or a single process server) when the app runs with many worker
+processes.
+"""
+from __future__ import annotations
+from typing import Any, Callable, List, Optional
+
+import dash
+from dash import Input, Output, State, ctx, dcc
+
+from .background import RunManager, RunSnapshot
+from .exceptions import GraphValidationError
+
+
+def background_run_components(prefix: str, interval: int = 500) -> List[Any]:
+    """Components required to track a background run
+
+    Parameters
+    ----------
+    prefix: str
+        Prefix of the ids of the components. Use the same prefix in
+        `register_background_run`.
+    interval: int
+        Milliseconds between two polls of the progress of a run
+    """
+    return [
+        dcc.Store(id=f"{prefix}-run-id"),
+        dcc.Interval(id=f"{prefix}-interval", interval=interval, disabled=True),
+    ]
+
+
+def register_background_run(
+    app: dash.Dash,
+    manager: RunManager,
+    prefix: str,
+    editor_id: str,
+    trigger: Input,
+    output: Optional[Output] = None,
+    format_snapshot: Optional[Callable[[RunSnapshot, dict], Any]] = None,
+):
+    """Register the callback which starts and follows background runs
+
+    Parameters
+    ----------
+    app: dash.Dash
+        The Dash app
+    manager: RunManager
+        Run manager used to start the runs
+    prefix: str
+        Prefix used in `background_run_components`
+    editor_id: str
+        ID of the Flowfunc component. The flow is read from its `nodes` prop
+        and the status of the nodes are written to its `nodes_status` prop.
+    trigger: Input
+        The input which starts a run, for example the n_clicks of a button
+    output: Output
+        Optional. Output which is updated with `format_snapshot` on every poll
+    format_snapshot: Callable
+        Function which receives the RunSnapshot and the nodes of the editor and
+        returns the value of `output`. Required if `output` is given.
+    """
+    if output is not None and format_snapshot is None:
+        raise ValueError("format_snapshot is required when an output is given.")
+    interval_id = f"{prefix}-interval"
+    store_id = f"{prefix}-run-id"
+    outputs = [
+        Output(store_id, "data"),
+        Output(interval_id, "disabled"),
+        Output(editor_id, "nodes_status"),
+    ]
+    if output is not None:
+        outputs.append(output)
+
+    @app.callback(
+        outputs,
+        trigger,
+        Input(interval_id, "n_intervals"),
+        State(store_id, "data"),
+        State(editor_id, "nodes"),
+        prevent_initial_call=True,
+    )
+    def background_run(_, __, run_id, nodes):
+        if ctx.triggered_id != interval_id:
+            if not nodes:
+                return dash.no_update
+            try:
+                run_id = manager.start(nodes)
+            except GraphValidationError as e:
+                # Showing the problems of the flow as failed nodes
+                errors = {}
+                for issue in e.issues:
+                    errors.setdefault(issue.node_id, []).append(issue.message)
+                snapshot = RunSnapshot(
+                    run_id="",
+                    done=True,
+                    statuses={nodeid: "failed" for nodeid in errors},
+                    results={},
+                    errors={nodeid: " ".join(msgs) for nodeid, msgs in errors.items()},
+                )
+                run_id = None
+            else:
+                snapshot = manager.snapshot(run_id)
+        elif not run_id:
+            return dash.no_update
+        else:
+            snapshot = manager.snapshot(run_id)
+        values = [run_id, snapshot.done, snapshot.statuses]
+        if output is not None:
+            values.append(format_snapshot(snapshot, nodes or {}))
+        return values
+
@@ -4,11 +4,59 @@ RQ Utils
 This module defines redis-queue related classess and functions.
 """
 from __future__ import annotations
-from rq.job import Job
+import importlib
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from rq.command import send_stop_job_command
+from rq.defaults import DEFAULT_WORKER_TTL
+from rq.exceptions import InvalidJobOperation, NoSuchJobError
+from rq.job import Job, JobStatus
 from rq.queue import Queue
+from rq.worker import Worker, WorkerStatus
+from .exceptions import ConfigVersionError
 from .models import OutConnections
+from .jobrunner import registered_runner, registered_runners
+from .registry import get_config, is_registered, preload_configs
+from .utils import logger
 from pydantic import validate_arguments
 
+# Redis set with the IDs of all the jobs of a run
+RUN_JOBS_KEY = "flowfunc:run:{}:jobs"
+# Seconds for which the job IDs of a run are kept
+RUN_JOBS_TTL = 24 * 60 * 60
+
+
+class ValidatorCache:
+    """Argument validators of the node functions
+
+    Shared by all the jobs performed in a worker process so that a validator
+    is only built once per function.
+    """
+
+    def __init__(self):
+        self._validators: Dict[Callable, Callable] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, func: Callable) -> Callable:
+        validator = self._validators.get(func)
+        if validator is None:
+            self.misses += 1
+            validator = self._validators[func] = validate_arguments(
+                func, config=dict(arbitrary_types_allowed=True)
+            )
+        else:
+            self.hits += 1
+        return validator
+
+    def __len__(self) -> int:
+        return len(self._validators)
+
+
+validators = ValidatorCache()
+
 
 class NodeJob(Job):
     """Custom job class which will modify the kwargs based on the dependencies
@@ -47,14 +95,42 @@ class NodeJob(Job):
     @property
     def func(self):
         """Overriding Job class' func method to include argument validation"""
-        return validate_arguments(
-            super().func, config=dict(arbitrary_types_allowed=True)
-        )
+        return validators.get(super().func)
+
+    def should_retry(self, error: Exception) -> bool:
+        """Check if the error is one of the exception types the job should be
+        retried on. The types are stored in the `retry_on` meta variable.
+        """
+        retry_on = self.meta.get("retry_on")
+        if not retry_on:
+            return True
+        error_types = {f"{t.__module__}.{t.__qualname__}" for t in type(error).__mro__}
+        return bool(error_types.intersection(retry_on))
+
+    def check_config(self):
+        """Reject the job if the worker has a different version of its config
+
+        The name and version of the config are stored in the `config_name` and
+        `config_version` meta variables. Jobs are not checked if the config
+        isn't registered in the worker.
+        """
+        config_name = self.meta.get("config_name")
+        if config_name and is_registered(config_name):
+            get_config(config_name, self.meta.get("config_version"))
 
     def perform(self):
         """Overriding the perform method of the parent class"""
-        self.update_kwargs()
-        return super().perform()
+        try:
+            self.check_config()
+            self.update_kwargs()
+            return super().perform()
+        except Exception as e:
+            if self.retries_left and (
+                isinstance(e, ConfigVersionError) or not self.should_retry(e)
+            ):
+                # The worker doesn't retry a job without any retries left
+                self.retries_left = 0
+            raise
 
     @property
     def result_mapped(self):
@@ -75,3 +151,176 @@ class NodeQueue(Queue):
     """Node Queue class is derived from the base Queue class in RQ"""
 
     job_class = NodeJob
+
+
+class NodeWorker(Worker):
+    """Worker which is warmed up before it starts taking jobs
+
+    The node modules are imported, the registered configs (see
+    `flowfunc.registry`) are created and the argument validators of all their
+    nodes are built once, when the worker starts. The work horses forked for
+    each job inherit all of it.
+
+    With `fork=False` the jobs are performed in the worker process itself,
+    like the SimpleWorker of rq, which saves the cost of forking. Only use it
+    for trusted nodes: a node which crashes or leaks memory affects the
+    worker and all the jobs after it.
+
+    The worker can be started using the rq cli as well::
+
+        FLOWFUNC_PRELOAD=myapp.nodes rq worker -w flowfunc.distributed.NodeWorker
+
+    The default job and queue classes of rq are replaced by `NodeJob` and
+    `NodeQueue`, other (derived) classes passed with ``-j`` and
+    ``--queue-class`` are kept.
+
+    Attributes
+    ----------
+    preload_modules: List[str]
+        Modules imported when the worker starts. Defaults to the comma
+        separated modules in the FLOWFUNC_PRELOAD environment variable.
+    fork: bool
+        Fork a work horse for each job. Defaults to False if the
+        FLOWFUNC_WORKER_FORK environment variable is "0".
+    """
+
+    def __init__(
+        self,
+        queues,
+        *args,
+        preload: Optional[Iterable[str]] = None,
+        fork: Optional[bool] = None,
+        **kwargs,
+    ):
+        # The rq cli always passes its default job and queue classes, which
+        # don't pass the results of the upstream nodes to the jobs
+        if kwargs.get("job_class") in (None, Job):
+            kwargs["job_class"] = NodeJob
+        if kwargs.get("queue_class") in (None, Queue):
+            kwargs["queue_class"] = NodeQueue
+        queues = [
+            NodeQueue(
+                queue.name,
+                connection=queue.connection,
+                job_class=kwargs["job_class"],
+                serializer=queue.serializer,
+            )
+            if type(queue) is Queue
+            else queue
+            for queue in (queues if isinstance(queues, (list, tuple)) else [queues])
+        ]
+        super().__init__(queues, *args, **kwargs)
+        if preload is None:
+            preload = filter(None, os.environ.get("FLOWFUNC_PRELOAD", "").split(","))
+        if fork is None:
+            fork = os.environ.get("FLOWFUNC_WORKER_FORK", "1") != "0"
+        self.preload_modules = [module.strip() for module in preload]
+        self.fork = fork
+        self.preloaded_configs: Dict[str, str] = {}
+        self.preload_seconds = 0.0
+        self.jobs_in_process = 0
+        self.preload()
+
+    def preload(self):
+        """Import the node modules, create the configs and build the validators"""
+        start = time.perf_counter()
+        for module in self.preload_modules:
+            importlib.import_module(module)
+        self.preloaded_configs = preload_configs()
+        for name, version in self.preloaded_configs.items():
+            runner = registered_runner(name, version)
+            for node in runner.flume_config.nodes:
+                # Validators of the per node jobs and of the same worker runs
+                validators.get(node.method)
+                runner.validated(node.method)
+        self.preload_seconds = time.perf_counter() - start
+        logger.info(
+            f"Preloaded {len(self.preload_modules)} module(s) and"
+            f" {len(self.preloaded_configs)} config(s) in {self.preload_seconds:.3f}s"
+        )
+
+    def execute_job(self, job: Job, queue: Queue):
+        if self.fork:
+            return super().execute_job(job, queue)
+        self.set_state(WorkerStatus.BUSY)
+        self.perform_job(job, queue)
+        self.jobs_in_process += 1
+        self.set_state(WorkerStatus.IDLE)
+
+    def get_heartbeat_ttl(self, job: Job):
+        if self.fork:
+            return super().get_heartbeat_ttl(job)
+        # Same as the SimpleWorker of rq, since there is no work horse
+        if job.timeout == -1:
+            return DEFAULT_WORKER_TTL
+        return (job.timeout or DEFAULT_WORKER_TTL) + 60
+
+    def warm_stats(self) -> dict:
+        """Statistics of the caches of the worker process
+
+        The hits and misses of the validator cache only count the jobs which
+        were performed in the worker process (with `fork=False`). A work horse
+        has its own copy of the counters.
+        """
+        return {
+            "fork": self.fork,
+            "modules": list(self.preload_modules),
+            "configs": dict(self.preloaded_configs),
+            "preload_seconds": self.preload_seconds,
+            "validators": len(validators),
+            "validator_hits": validators.hits,
+            "validator_misses": validators.misses,
+            "runners": len(registered_runners()),
+            "runner_validators": sum(
+                len(runner._validators) for runner in registered_runners()
+            ),
+            "jobs_in_process": self.jobs_in_process,
+        }
+
+
+def register_run_job(job: Job, run_id: str):
+    """Add the job to the set of jobs of a run so that the run can be cancelled"""
+    key = RUN_JOBS_KEY.format(run_id)
+    pipeline = job.connection.pipeline()
+    pipeline.sadd(key, job.id)
+    pipeline.expire(key, RUN_JOBS_TTL)
+    pipeline.execute()
+
+
+def cancel_run(run_id: str, connection, exclude=()):
+    """Cancel all the unfinished jobs of a run
+
+    Queued, deferred and scheduled jobs are cancelled. Workers running a started
+    job are sent a command to stop it.
+    """
+    for job_id in connection.smembers(RUN_JOBS_KEY.format(run_id)):
+        if isinstance(job_id, bytes):
+            job_id = job_id.decode()
+        if job_id in exclude:
+            continue
+        try:
+            job = NodeJob.fetch(job_id, connection=connection)
+        except NoSuchJobError:
+            continue
+        status = job.get_status()
+        if status == JobStatus.STARTED:
+            try:
+                send_stop_job_command(connection, job_id)
+            except InvalidJobOperation:
+                # The job has finished in the meantime
+                continue
+        elif status in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+            job.cancel()
+        else:
+            continue
+        logger.info(f"Job {job_id} of run {run_id} has been cancelled.")
+
+
+def cancel_run_on_failure(job, connection, type, value, traceback):
+    """rq failure callback which cancels the other jobs of the failed job's run"""
+    if job.retries_left:
+        # The callback is called for every failed attempt of the job
+        return
+    run_id = job.meta.get("run_id")
+    if run_id:
+        cancel_run(run_id, connection, exclude=[job.id])
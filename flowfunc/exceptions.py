@@ -4,3 +4,44 @@ class ErrorInDependentNode(Exception):
 
 class QueueError(Exception):
     pass
+
+
+class NodeTimeoutError(TimeoutError):
+    """Raised when a node doesn't finish within its timeout"""
+
+    pass
+
+
+class RunCancelledError(Exception):
+    """Set as the error of nodes which were cancelled before finishing, either
+    because the run timed out or because another node failed in a fail fast run.
+    """
+
+    pass
+
+
+class GraphValidationError(ValueError):
+    """Raised when a flow has problems which prevent it from being run.
+    All the problems found are available in the `issues` attribute.
+    """
+
+    def __init__(self, issues):
+        self.issues = issues
+        super().__init__(
+            f"The flow has {len(issues)} problem(s):\n"
+            + "\n".join(f"- {issue.message}" for issue in issues)
+        )
+
+
+class ConfigNotFoundError(LookupError):
+    """Raised when a config is requested by a name which is not registered"""
+
+    pass
+
+
+class ConfigVersionError(ValueError):
+    """Raised when a job requires a different version of a config than the
+    one registered in the worker
+    """
+
+    pass
@@ -0,0 +1,129 @@
+"""
+Fan-out
+-------
+Map nodes, which apply a node to each item of a list.
+
+A map node is created from a node of the config using `Config.add_map`. It
+has the same inputs as the mapped node, except the one it maps over which
+takes a list, and an extra ``chunk_size`` input. Its result is the list of
+the results of the mapped node for each item, in the order of the items.
+
+In sync and async runs, the items are split into chunks of ``chunk_size``
+items (1 by default) and the runner schedules one task per chunk: in its
+thread pool for functions, on its event loop for coroutines. The timeout,
+the retry policy and the concurrency limit of the runner apply to each chunk
+and the arguments are validated for each item. When the node is run as a
+job of a queue, the worker maps the chunks over a thread pool.
+"""
+from __future__ import annotations
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from .config import process_port
+from .models import Node, Port
+
+
+def chunked(items: List[Any], chunk_size: int) -> List[List[Any]]:
+    """Split a list in consecutive chunks of `chunk_size` items"""
+    if chunk_size < 1:
+        raise ValueError(f"The chunk size should be at least 1, not {chunk_size}.")
+    return [items[start : start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+
+class MapNode:
+    """A node applied to each item of a list
+
+    Parameters
+    ----------
+    mapped: Node
+        The node which is applied to each item
+    over: str
+        The input of the mapped node which gets the items
+    chunk_size: int
+        Default number of items per task
+    """
+
+    def __init__(self, mapped: Node, over: str, chunk_size: int = 1):
+        if not isinstance(mapped.inputs, list):
+            raise ValueError(f"Node {mapped.type} has no static inputs to map over.")
+        if over not in [port.name for port in mapped.inputs]:
+            raise ValueError(f"Node {mapped.type} has no input {over}.")
+        if over == "chunk_size" or "chunk_size" in [port.name for port in mapped.inputs]:
+            raise ValueError(f"Node {mapped.type} already has a chunk_size input.")
+        chunked([], chunk_size)
+        self.mapped = mapped
+        self.over = over
+        self.chunk_size = chunk_size
+
+    def node(self, node_type: Optional[str] = None, **kwargs) -> Node:
+        """The config node of the map"""
+        inputs = []
+        for port in self.mapped.inputs:
+            if port.name == self.over:
+                port = Port(
+                    type="list",
+                    name=port.name,
+                    label=f"{port.name} (list)",
+                    acceptTypes=["list"],
+                )
+            inputs.append(port)
+        inputs.append(process_port("chunk_size", int))
+        kwargs.setdefault("label", f"Map {self.mapped.label}")
+        kwargs.setdefault("category", self.mapped.category)
+        kwargs.setdefault("pure", self.mapped.pure)
+        return Node(
+            type=node_type or f"map.{self.mapped.type}",
+            method=self.apply,
+            inputs=inputs,
+            outputs=[process_port("result", list)],
+            **kwargs,
+        )
+
+    def split(self, kwargs: dict) -> List[List[Any]]:
+        """Pop the items and the chunk size from the arguments and chunk the items"""
+        chunk_size = kwargs.pop("chunk_size", None) or self.chunk_size
+        return chunked(list(kwargs.pop(self.over, None) or []), chunk_size)
+
+    def chunk_function(self, method: Callable, kwargs: dict) -> Callable:
+        """Function (or coroutine function) applying `method` to a chunk"""
+        over = self.over
+        if inspect.iscoroutinefunction(self.mapped.method):
+
+            async def apply_chunk(chunk: List[Any]) -> List[Any]:
+                return [await method(**kwargs, **{over: item}) for item in chunk]
+
+        else:
+
+            def apply_chunk(chunk: List[Any]) -> List[Any]:
+                return [method(**kwargs, **{over: item}) for item in chunk]
+
+        return apply_chunk
+
+    def apply(self, **kwargs) -> List[Any]:
+        """Apply the mapped node to the items, chunks in parallel
+
+        The runner schedules the chunks itself in sync and async runs. This
+        is used when the map node is run as a job of a queue.
+        """
+        chunks = self.split(kwargs)
+        apply_chunk = self.chunk_function(self.mapped.method, kwargs)
+        if inspect.iscoroutinefunction(apply_chunk):
+
+            async def gather():
+                return await asyncio.gather(*(apply_chunk(chunk) for chunk in chunks))
+
+            results = asyncio.run(gather())
+        elif len(chunks) > 1:
+            with ThreadPoolExecutor(thread_name_prefix="flowfunc-map") as pool:
+                results = list(pool.map(apply_chunk, chunks))
+        else:
+            results = [apply_chunk(chunk) for chunk in chunks]
+        return [result for chunk in results for result in chunk]
+
+
+def map_of(node: Node) -> Optional[MapNode]:
+    """The map a config node was created from, if any"""
+    owner = getattr(node.method, "__self__", None)
+    return owner if isinstance(owner, MapNode) else None
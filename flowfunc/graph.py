@@ -0,0 +1,399 @@
+"""
+Graph
+-----
+Compact runtime representation of a flow.
+
+The editor (and saved json files) describe a flow as a dict of node dicts
+which also carry editor only data like the position and the width of the
+nodes. To run a flow only the node types, the literal input values and the
+connections are required. ``Graph`` stores them in flat lists and arrays which
+are indexed by an integer node index. Pydantic ``OutNode`` objects are only
+created at the API boundary when they are requested.
+"""
+from __future__ import annotations
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from pydantic import BaseModel
+
+from .models import OutConnections, OutNode
+
+
+def _get(item: Any, name: str, default: Any = None) -> Any:
+    """Get a field from a node (or connection) dict or pydantic object"""
+    if isinstance(item, BaseModel):
+        return getattr(item, name, default)
+    return item.get(name, default)
+
+
+def literal_inputs(input_data: Optional[dict]) -> dict:
+    """Convert the inputData of a node to keyword arguments of the node function"""
+    input_args = {}
+    for key, values in (input_data or {}).items():
+        if not values:
+            continue
+        # If there are more than one control in this port return the dict
+        if len(values) > 1:
+            variable_value = values
+        else:
+            # else return the value of the first item in the dict
+            # TODO: when flume implements option to have multiple inputs
+            # address it here.
+            variable_value = next(iter(values.values()))
+        if variable_value is None:
+            continue  # This is null coming from react for unset controls
+        input_args[key] = variable_value
+    return input_args
+
+
+class Graph:
+    """Flow parsed into flat lists indexed by an integer node index
+
+    Attributes
+    ----------
+    ids: List[str]
+        Node ids
+    index: Dict[str, int]
+        Node id to node index mapping
+    types: List[str]
+        Node types
+    inputs: List[dict]
+        Literal keyword arguments of each node (from inputData)
+    settings: List[Optional[dict]]
+        rq settings of each node
+    edge_src, edge_dst: array
+        Source and destination node index of each connection. The source index
+        is -1 if the connection refers to a node which is not in the flow.
+    edge_src_port, edge_dst_port: List[str]
+        Output port of the source and input port of the destination node of
+        each connection.
+    missing: Dict[int, str]
+        Edge index to node id mapping of the connections to missing nodes
+    preset: Dict[int, tuple]
+        Node index to (result, result_mapped) of nodes which already have a result
+    constants: Dict[int, str]
+        Node index to structural key of the constant nodes. Set by the planner
+        (see `flowfunc.planner`).
+    duplicates: Dict[int, int]
+        Node index of each duplicated pure node to the index of the node whose
+        results it shares. Set by the planner.
+    source: Optional[dict]
+        The flow the graph was parsed from. Used to create the OutNode objects.
+    rewired: Set[int]
+        Node indices of the nodes whose connections differ from the ones in
+        the source flow (see `flowfunc.composite`)
+    """
+
+    __slots__ = (
+        "ids",
+        "index",
+        "types",
+        "inputs",
+        "settings",
+        "edge_src",
+        "edge_dst",
+        "edge_src_port",
+        "edge_dst_port",
+        "missing",
+        "preset",
+        "constants",
+        "duplicates",
+        "source",
+        "rewired",
+        "_in_ptr",
+        "_in_order",
+        "_out_ptr",
+        "_out_order",
+    )
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.types: List[str] = []
+        self.inputs: List[dict] = []
+        self.settings: List[Optional[dict]] = []
+        self.edge_src = array("l")
+        self.edge_dst = array("l")
+        self.edge_src_port: List[str] = []
+        self.edge_dst_port: List[str] = []
+        self.missing: Dict[int, str] = {}
+        self.preset: Dict[int, tuple] = {}
+        self.constants: Dict[int, str] = {}
+        self.duplicates: Dict[int, int] = {}
+        self.source: Optional[dict] = None
+        self.rewired: Set[int] = set()
+        self._in_ptr = None
+        self._in_order = None
+        self._out_ptr = None
+        self._out_order = None
+
+    @classmethod
+    def from_dict(cls, out_dict: Dict[str, Any]) -> Graph:
+        """Parse the nodes dict from the editor (or a saved flow file)
+
+        The values of the dict can either be node dicts or OutNode objects.
+        Nothing is validated here. Use the validation module for that.
+        """
+        graph = cls()
+        graph.source = out_dict
+        for nodeid, node in out_dict.items():
+            graph.index[nodeid] = len(graph.ids)
+            graph.ids.append(nodeid)
+            graph.types.append(_get(node, "type"))
+            graph.inputs.append(literal_inputs(_get(node, "inputData")))
+            graph.settings.append(_get(node, "settings"))
+            result_mapped = _get(node, "result_mapped")
+            if result_mapped:
+                graph.preset[len(graph.ids) - 1] = (_get(node, "result"), result_mapped)
+        for dst, node in enumerate(out_dict.values()):
+            connections = _get(node, "connections")
+            inputs = _get(connections, "inputs") if connections else None
+            for port, port_connections in (inputs or {}).items():
+                if not port_connections:
+                    continue
+                # Now only one connection is supported by flume.
+                # Hence using the first one
+                connection = port_connections[0]
+                src_id = _get(connection, "nodeId")
+                graph.add_edge(
+                    graph.index.get(src_id, -1),
+                    _get(connection, "portName"),
+                    dst,
+                    port,
+                    src_id=src_id,
+                )
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_node(
+        self,
+        nodeid: str,
+        node_type: str,
+        inputs: Optional[dict] = None,
+        settings: Optional[dict] = None,
+    ) -> int:
+        """Add a node and return it's index"""
+        self.index[nodeid] = len(self.ids)
+        self.ids.append(nodeid)
+        self.types.append(node_type)
+        self.inputs.append(inputs if inputs is not None else {})
+        self.settings.append(settings)
+        self._in_ptr = self._out_ptr = None
+        return len(self.ids) - 1
+
+    def add_edge(
+        self, src: int, src_port: str, dst: int, dst_port: str, src_id: str = None
+    ) -> int:
+        """Add a connection and return it's index"""
+        edge = len(self.edge_src)
+        self.edge_src.append(src)
+        self.edge_dst.append(dst)
+        self.edge_src_port.append(src_port)
+        self.edge_dst_port.append(dst_port)
+        if src < 0:
+            self.missing[edge] = src_id
+        self._in_ptr = self._out_ptr = None
+        return edge
+
+    @staticmethod
+    def _csr(keys: array, size: int):
+        # Counting sort of the edge indices by node index. ptr[i]:ptr[i + 1]
+        # is the slice of `order` with the edges of node i.
+        ptr = array("l", [0]) * (size + 1)
+        for key in keys:
+            if key >= 0:
+                ptr[key + 1] += 1
+        for i in range(size):
+            ptr[i + 1] += ptr[i]
+        order = array("l", [0]) * ptr[size]
+        fill = array("l", ptr)
+        for edge, key in enumerate(keys):
+            if key >= 0:
+                order[fill[key]] = edge
+                fill[key] += 1
+        return ptr, order
+
+    def in_edges(self, i: int) -> array:
+        """Indices of the connections to the inputs of node i"""
+        if self._in_ptr is None:
+            self._in_ptr, self._in_order = self._csr(self.edge_dst, len(self.ids))
+        return self._in_order[self._in_ptr[i] : self._in_ptr[i + 1]]
+
+    def out_edges(self, i: int) -> array:
+        """Indices of the connections from the outputs of node i"""
+        if self._out_ptr is None:
+            self._out_ptr, self._out_order = self._csr(self.edge_src, len(self.ids))
+        return self._out_order[self._out_ptr[i] : self._out_ptr[i + 1]]
+
+    def in_degrees(self) -> array:
+        """Number of connections from nodes in the graph to each node"""
+        degrees = array("l", [0]) * len(self.ids)
+        for src, dst in zip(self.edge_src, self.edge_dst):
+            if src >= 0:
+                degrees[dst] += 1
+        return degrees
+
+    def indices(self, node_ids: Iterable[str]) -> List[int]:
+        """Node indices of the node ids which are part of the graph"""
+        return [self.index[nodeid] for nodeid in node_ids if nodeid in self.index]
+
+    def upstream(self, indices: Iterable[int]) -> List[int]:
+        """The given nodes and all the nodes they depend on"""
+        seen = set(indices)
+        queue = deque(seen)
+        while queue:
+            for edge in self.in_edges(queue.popleft()):
+                src = self.edge_src[edge]
+                if src >= 0 and src not in seen:
+                    seen.add(src)
+                    queue.append(src)
+        return sorted(seen)
+
+    def subgraph(self, indices: Iterable[int]) -> Graph:
+        """Create a new graph with only the given nodes"""
+        graph = Graph()
+        graph.source = self.source
+        mapping = {}
+        for i in sorted(set(indices)):
+            mapping[i] = graph.add_node(
+                self.ids[i], self.types[i], self.inputs[i], self.settings[i]
+            )
+            if i in self.preset:
+                graph.preset[mapping[i]] = self.preset[i]
+            if i in self.rewired:
+                graph.rewired.add(mapping[i])
+        for edge, (src, dst) in enumerate(zip(self.edge_src, self.edge_dst)):
+            if dst not in mapping or (src >= 0 and src not in mapping):
+                continue
+            graph.add_edge(
+                mapping[src] if src >= 0 else -1,
+                self.edge_src_port[edge],
+                mapping[dst],
+                self.edge_dst_port[edge],
+                src_id=self.missing.get(edge),
+            )
+        return graph
+
+    def connections(self, i: int) -> dict:
+        """The connections of node i in the format of the editor"""
+        inputs = {}
+        for edge in self.in_edges(i):
+            src = self.edge_src[edge]
+            inputs[self.edge_dst_port[edge]] = [
+                {
+                    "nodeId": self.ids[src] if src >= 0 else self.missing[edge],
+                    "portName": self.edge_src_port[edge],
+                }
+            ]
+        outputs = {}
+        for edge in self.out_edges(i):
+            outputs.setdefault(self.edge_src_port[edge], []).append(
+                {
+                    "nodeId": self.ids[self.edge_dst[edge]],
+                    "portName": self.edge_dst_port[edge],
+                }
+            )
+        return {"inputs": inputs, "outputs": outputs}
+
+    def out_node(self, i: int) -> OutNode:
+        """Create an OutNode object for node i"""
+        nodeid = self.ids[i]
+        source = self.source.get(nodeid) if self.source else None
+        if isinstance(source, OutNode):
+            node = source.model_copy(deep=True)
+        elif source is not None:
+            node = OutNode.model_validate(source)
+        else:
+            node = None
+        if node is not None:
+            if i in self.rewired:
+                node.connections = OutConnections.model_validate(self.connections(i))
+            return node
+        # Nodes which are not part of the source flow have no editor data
+        return OutNode(
+            id=nodeid,
+            x=0,
+            y=0,
+            type=self.types[i],
+            width=0,
+            connections=self.connections(i),
+            inputData={key: {key: value} for key, value in self.inputs[i].items()},
+            settings=self.settings[i],
+        )
+
+    def out_nodes(self) -> Dict[str, OutNode]:
+        """Create OutNode objects for all nodes in the graph"""
+        return {self.ids[i]: self.out_node(i) for i in range(len(self.ids))}
+
+
+class RunState:
+    """Execution state of each node of a graph, indexed by the node index"""
+
+    __slots__ = ("status", "result", "result_mapped", "error")
+
+    def __init__(self, size: int):
+        self.status: List[str] = ["idle"] * size
+        self.result: List[Any] = [None] * size
+        self.result_mapped: List[Optional[dict]] = [None] * size
+        self.error: List[Optional[Exception]] = [None] * size
+
+
+class RunResult:
+    """Results of a run which can be looked up by node id
+
+    Use `to_models` to convert the results to OutNode objects like the ones
+    returned by `JobRunner.run` by default.
+    """
+
+    __slots__ = ("graph", "state")
+
+    def __init__(self, graph: Graph, state: RunState):
+        self.graph = graph
+        self.state = state
+
+    def __len__(self) -> int:
+        return len(self.graph)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.graph.ids)
+
+    def __contains__(self, nodeid: str) -> bool:
+        return nodeid in self.graph.index
+
+    def status(self, nodeid: str) -> str:
+        return self.state.status[self.graph.index[nodeid]]
+
+    def _loaded(self, i: int) -> int:
+        # Results spilled to disk with a memory budget are loaded on first access
+        from .spill import restore
+
+        restore(self.state, (i,))
+        return i
+
+    def result(self, nodeid: str) -> Any:
+        return self.state.result[self._loaded(self.graph.index[nodeid])]
+
+    def result_mapped(self, nodeid: str) -> Optional[dict]:
+        return self.state.result_mapped[self._loaded(self.graph.index[nodeid])]
+
+    def error(self, nodeid: str) -> Optional[Exception]:
+        return self.state.error[self.graph.index[nodeid]]
+
+    def to_model(self, nodeid: str) -> OutNode:
+        """Create the OutNode object of a node along with it's results"""
+        i = self._loaded(self.graph.index[nodeid])
+        node = self.graph.out_node(i)
+        node.status = self.state.status[i]
+        node.result = self.state.result[i]
+        node.result_mapped = self.state.result_mapped[i]
+        if node.result_mapped is None and node.status != "idle":
+            node.result_mapped = {}
+        node.error = self.state.error[i]
+        return node
+
+    def to_models(self) -> Dict[str, OutNode]:
+        """Create the OutNode objects of all nodes along with their results"""
+        return {nodeid: self.to_model(nodeid) for nodeid in self.graph.ids}
@@ -1,21 +1,43 @@
 from __future__ import annotations
 import asyncio
 import inspect
-from copy import copy, deepcopy
-from typing import Any, Callable, Dict, List, Optional
+import math
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import copy
+from functools import partial
+from uuid import uuid4
+from weakref import WeakKeyDictionary
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
 
 from pydantic import validate_call, ConfigDict
 
+from .composite import inline_composites
 from .config import Config
-from .exceptions import ErrorInDependentNode, QueueError
-from .models import OutNode
+from .exceptions import (
+    ErrorInDependentNode,
+    GraphValidationError,
+    NodeTimeoutError,
+    QueueError,
+    RunCancelledError,
+)
+from .fanout import MapNode, map_of
+from .graph import Graph, RunResult, RunState
+from .models import OutNode, RetryPolicy
+from .planner import (
+    CONSTANT_CACHE_BYTES,
+    ConstantCache,
+    fold_constants,
+    merge_duplicates,
+    structural_keys,
+)
+from .registry import get_config, get_config_version, is_registered, register_config
+from .serialization import dumps_flow, dumps_result, loads
+from .spill import MemoryBudget
 from .utils import logger
-
-try:
-    from .distributed import NodeQueue
-except ImportError:
-    # Not opted for distributed
-    pass
+from .validation import GraphIssue, validate_graph
 
 
 def default_meta_method(
@@ -51,15 +73,39 @@ def default_meta_method(
     job: NodeJob
         An instance of the rq job
     """
+    config_node = job_runner.flume_config.get_node(node.type)
+    timeout = job_runner.timeout_for(config_node)
+    if timeout is not None:
+        job_kwargs = {"job_timeout": math.ceil(timeout), **job_kwargs}
+    retry = job_runner.retry_for(config_node)
+    if retry is not None and retry.max_attempts > 1:
+        from rq import Retry
+
+        job_kwargs = {
+            "retry": Retry(
+                max=retry.max_attempts - 1,
+                interval=[math.ceil(delay) for delay in retry.delays()],
+            ),
+            **job_kwargs,
+        }
+        retry_on = [f"{e.__module__}.{e.__qualname__}" for e in retry.retry_on]
+    else:
+        retry_on = None
+    if job_runner.fail_fast:
+        from .distributed import cancel_run_on_failure
+
+        job_kwargs = {"on_failure": cancel_run_on_failure, **job_kwargs}
     return job_queue.enqueue(
         method,
         kwargs=input_args,  # this is later updated by the custom job class
         meta={
             "node_connections": node.connections.dict(),
-            "result_keys": [
-                x.name for x in job_runner.flume_config.get_node(node.type).outputs
-            ],
+            "result_keys": [x.name for x in config_node.outputs],
             "node_id": node.id,
+            "run_id": node.run_id,
+            "retry_on": retry_on,
+            "config_name": job_runner.config_name,
+            "config_version": job_runner.config_version,
             **job_runner.meta_data,
         },
         depends_on=[dependent.job_id for dependent in dependents],
@@ -67,9 +113,7 @@ def default_meta_method(
     )
 
 
-def run_in_same_worker(flume_config, out_dict):
-    """Run the whole flow in the same worker"""
-    runner = JobRunner(flume_config=flume_config)
+def _run_flow_in_worker(runner: JobRunner, out_dict: dict) -> dict:
     result = {}
     run_output = runner.run(out_dict)
     if not run_output or not isinstance(run_output, dict):
@@ -83,6 +127,90 @@ def run_in_same_worker(flume_config, out_dict):
     return result
 
 
+def run_in_same_worker(flume_config, out_dict):
+    """Run the whole flow in the same worker"""
+    return _run_flow_in_worker(JobRunner(flume_config=flume_config), out_dict)
+
+
+# Runners of the registered configs in this worker process, by name and version
+_registered_runners: Dict[tuple, JobRunner] = {}
+
+
+def registered_runner(config_name: str, config_version: Optional[str] = None) -> JobRunner:
+    """The runner of a registered config in this process
+
+    The runner (and the argument validators it caches) is reused by all the
+    jobs which use the same config. Raises a ConfigVersionError if the
+    registered config has a different version.
+    """
+    config = get_config(config_name, config_version)
+    key = (config_name, get_config_version(config_name))
+    runner = _registered_runners.get(key)
+    if runner is None or runner.flume_config is not config:
+        runner = _registered_runners[key] = JobRunner(config)
+    return runner
+
+
+def registered_runners() -> List[JobRunner]:
+    """The runners of the registered configs created in this process"""
+    return list(_registered_runners.values())
+
+
+def run_registered_flow(config_name: str, config_version: str, out_dict: dict):
+    """Run the whole flow in the same worker using a registered config
+
+    The job only carries the name and version of the config. The worker
+    should have imported the module which registers the config.
+    """
+    return _run_flow_in_worker(registered_runner(config_name, config_version), out_dict)
+
+
+class FairLimiter:
+    """Limits the number of nodes running at once, interleaving the runs fairly
+
+    The nodes waiting for a slot are queued per run and the free slots are
+    handed out to the runs in turns, so that a run with many ready nodes
+    doesn't starve the other runs.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.queues: OrderedDict[Any, deque] = OrderedDict()
+
+    async def acquire(self, key: Any):
+        if self.active < self.limit and not self.queues:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(key, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over right before the cancellation
+                self.release()
+            else:
+                queue = self.queues.get(key)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self.queues[key]
+            raise
+
+    def release(self):
+        while self.queues:
+            key, queue = self.queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                # Moving the run to the end of the line
+                self.queues[key] = queue
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
 class JobRunner:
     """Class which runs the flow
 
@@ -116,6 +244,71 @@ class JobRunner:
         job is enqueued by default.
     meta_data: Dict[Any, Any]
         Optional. Any extra meta data to supply to the job
+    validate: bool
+        Check the flow for cycles, missing nodes and ports and unknown node
+        types before running it. A GraphValidationError with all the problems
+        found is raised if the flow is not valid.
+    check_types: bool
+        Also check that the connected ports have compatible types. Off by
+        default since editors without type safety can connect any ports, for
+        example an int output to a float input.
+    node_timeout: float
+        Optional. Seconds after which a node is cancelled and marked as failed
+        with a NodeTimeoutError, if the node doesn't define a timeout itself.
+        In distributed mode it is passed to rq as the job_timeout.
+    run_timeout: float
+        Optional. Seconds after which a sync or async run is cancelled. Nodes
+        which haven't finished by then are marked as canceled.
+    fail_fast: bool
+        Cancel the running and pending nodes as soon as a node fails. In
+        distributed mode the unfinished jobs of the run are cancelled by the
+        failure callback of the failed job.
+    default_retry: RetryPolicy
+        Optional. Retry policy of the nodes which don't define one themselves.
+        In distributed mode the policy is mapped to an rq Retry. Retries with
+        a delay need a worker running with the rq scheduler.
+    max_workers: int
+        Optional. Size of the thread pool in which functions which are not
+        coroutines are run when they shouldn't block the event loop.
+    max_concurrency: int
+        Optional. Maximum number of nodes running at once in an event loop,
+        across all the flows. Used with `submit` and `run_many` to interleave
+        many concurrent flows fairly.
+    config_name: str
+        Optional. Name under which the config is registered (see
+        `flowfunc.registry`). The config is registered under this name if it
+        isn't yet. Distributed jobs then refer to the config by its name and
+        version instead of carrying it, and the workers reject jobs which need
+        a different version of the config than the one they have.
+    fold_constants: bool
+        Evaluate the constant nodes (pure nodes which only depend on literal
+        inputs and other constant nodes, see `flowfunc.planner`) once and
+        reuse their results in the later sync and async runs of this runner.
+        The results are kept in `constants`, a ConstantCache limited in
+        bytes. With a `memory_budget`, the cache takes at most a quarter of
+        it, since the cached results stay in memory even when the results of
+        a run are released or spilled.
+    memory_budget: int
+        Optional. Bytes the results of a sync or async run may take in
+        memory. The results which are needed last are spilled to disk beyond
+        that and loaded again by the nodes which need them (see
+        `flowfunc.spill`).
+    spill_dir: str
+        Optional. Directory in which the spilled results are written. The
+        default temporary directory by default.
+    merge_duplicates: bool
+        Evaluate the copies of a pure node (or of a subgraph of pure nodes)
+        with the same inputs only once in sync and async runs. The copies get
+        the results of the first one.
+
+    Use `submit` or `run_many` to run many flows concurrently. They share one
+    event loop (running in a background thread), the thread pool and the
+    argument validators of this runner.
+
+    Functions which are not coroutines can only be cancelled if they don't
+    block the event loop. If a timeout or fail_fast applies to them, they are
+    run in a thread. The thread itself cannot be stopped and runs to
+    completion in the background, but the run doesn't wait for it.
     """
 
     def __init__(
@@ -128,8 +321,27 @@ class JobRunner:
         default_queue: Optional[Any] = None,
         meta_map: Optional[Dict[Callable, Callable]] = None,
         meta_data: Optional[Dict[str, Any]] = None,
+        validate: bool = True,
+        check_types: bool = False,
+        node_timeout: Optional[float] = None,
+        run_timeout: Optional[float] = None,
+        fail_fast: bool = False,
+        default_retry: Optional[RetryPolicy] = None,
+        max_workers: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        config_name: Optional[str] = None,
+        fold_constants: bool = True,
+        merge_duplicates: bool = True,
+        memory_budget: Optional[int] = None,
+        spill_dir: Optional[str] = None,
     ):
         self.flume_config = flume_config
+        self.config_name = config_name
+        self.config_version = None
+        if config_name is not None:
+            if not is_registered(config_name):
+                register_config(config_name, flume_config)
+            self.config_version = get_config_version(config_name)
         self.method = method
         self.queue = default_queue
         self.meta_map = meta_map if meta_map else {}
@@ -139,12 +351,179 @@ class JobRunner:
                 "If the method is distributed, the `default_queue` argument cannot be empty."
             )
         self.same_worker = same_worker
+        self.validate = validate
+        self.check_types = check_types
+        self.node_timeout = node_timeout
+        self.run_timeout = run_timeout
+        self.fail_fast = fail_fast
+        self.default_retry = default_retry
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.fold_constants = fold_constants
+        if memory_budget is not None:
+            self.constants = ConstantCache(
+                max_bytes=min(CONSTANT_CACHE_BYTES, memory_budget // 4)
+            )
+        else:
+            self.constants = ConstantCache()
+        self.merge_duplicates = merge_duplicates
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._limiters = WeakKeyDictionary()
+        # Argument validators of the node functions
+        self._validators: Dict[Callable, Callable] = {}
+
+    def validated(self, method: Callable) -> Callable:
+        """The node function wrapped with pydantic argument validation"""
+        validator = self._validators.get(method)
+        if validator is None:
+            validator = validate_call(config=ConfigDict(arbitrary_types_allowed=True))(
+                method
+            )
+            self._validators[method] = validator
+        return validator
+
+    def timeout_for(self, config_node) -> Optional[float]:
+        """Timeout of a node in seconds"""
+        if config_node.timeout is not None:
+            return config_node.timeout
+        return self.node_timeout
+
+    def retry_for(self, config_node) -> Optional[RetryPolicy]:
+        """Retry policy of a node"""
+        if config_node.retry is not None:
+            return config_node.retry
+        return self.default_retry
+
+    async def call(
+        self, method: Callable, input_args: dict, timeout: Optional[float] = None
+    ) -> Any:
+        """Call a node function with argument validation
+
+        Functions which are not coroutines are run in a thread if there is a
+        timeout which should be able to interrupt them, or if they are run in
+        the shared runtime. A NodeTimeoutError is raised if the function
+        doesn't finish within the timeout.
+        """
+        validated = self.validated(method)
+        loop = asyncio.get_running_loop()
+        if inspect.iscoroutinefunction(method):
+            awaitable = validated(**input_args)
+        elif (
+            timeout is None
+            and self.run_timeout is None
+            and not self.fail_fast
+            and loop is not self._loop
+        ):
+            return validated(**input_args)
+        else:
+            # Not using the default executor of the loop since asyncio.run
+            # waits for its threads to finish, including the timed out ones.
+            awaitable = loop.run_in_executor(
+                self.executor(), partial(validated, **input_args)
+            )
+        return await self.wait_for(awaitable, timeout)
+
+    @staticmethod
+    async def wait_for(awaitable: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Await with a timeout. A NodeTimeoutError is raised when it expires."""
+        if timeout is None:
+            return await awaitable
+        task = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if not done:
+            task.cancel()
+            raise NodeTimeoutError(f"The node did not finish within {timeout} seconds.")
+        return task.result()
+
+    async def call_with_retry(
+        self,
+        call: Callable[[], Awaitable],
+        retry: Optional[RetryPolicy],
+        key: Any,
+        nodeid: str,
+    ) -> Any:
+        """Await `call()` within the concurrency limit, retrying it with the policy
+
+        `key` identifies the run in the fair limiter (see `FairLimiter`).
+        """
+        limiter = self.limiter()
+        attempt = 1
+        while True:
+            try:
+                if limiter is None:
+                    return await call()
+                await limiter.acquire(key)
+                try:
+                    return await call()
+                finally:
+                    limiter.release()
+            except Exception as e:
+                if retry is not None and retry.should_retry(e, attempt):
+                    delay = retry.delay(attempt)
+                    logger.warning(
+                        f"Attempt {attempt} of Node {nodeid} has failed."
+                        f" Retrying in {delay:.2f} seconds."
+                    )
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                raise
+
+    async def call_map(self, mapper: MapNode, input_args: dict, key: Any, nodeid: str) -> list:
+        """Apply the node of a map node to each item, one task per chunk
+
+        Functions are run in the thread pool and coroutines on the event
+        loop. The timeout and retry policy of the mapped node apply to each
+        chunk. Returns the results in the order of the items.
+        """
+        mapped = mapper.mapped
+        chunks = mapper.split(input_args)
+        apply_chunk = mapper.chunk_function(self.validated(mapped.method), input_args)
+        timeout = self.timeout_for(mapped)
+        retry = self.retry_for(mapped)
+        loop = asyncio.get_running_loop()
+
+        def call(chunk):
+            if inspect.iscoroutinefunction(apply_chunk):
+                awaitable = apply_chunk(chunk)
+            else:
+                awaitable = loop.run_in_executor(self.executor(), apply_chunk, chunk)
+            return self.wait_for(awaitable, timeout)
+
+        tasks = [
+            asyncio.ensure_future(
+                self.call_with_retry(partial(call, chunk), retry, key, f"{nodeid}[{n}]")
+            )
+            for n, chunk in enumerate(chunks)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        logger.info(f"Mapped node {nodeid} over {len(chunks)} chunk(s).")
+        return [result for chunk in results for result in chunk]
+
+    def check(self, graph: Graph) -> List[GraphIssue]:
+        """Find all the problems in a flow which would prevent it from running"""
+        return validate_graph(graph, self.flume_config, check_types=self.check_types)
 
-    @validate_call
     def run(
         self,
-        out_dict: Dict[str, OutNode],
+        out_dict: Dict[str, Union[OutNode, dict]],
         selected_node_ids: Optional[List[str]] = None,
+        as_models: bool = True,
+        keep: str = "all",
+        pinned: Optional[List[str]] = None,
     ):
         """Run the node map
 
@@ -156,6 +535,21 @@ class JobRunner:
             The selected node IDs which should be run. The dependent nodes will
             automatically be identified from the out_dict and add to the list
             of nodes to be run.
+        as_models: bool
+            If False, the results of a sync or async run are returned as a
+            RunResult object instead of OutNode objects. The flow is then never
+            converted to pydantic objects, which is much faster for large flows.
+        keep: str
+            Which results of a sync or async run are kept. "all" keeps the
+            results of all the nodes. "outputs" only keeps the results of the
+            sink nodes (the nodes whose outputs aren't connected) and of the
+            `pinned` nodes. The results of the other nodes are released as
+            soon as all the nodes connected to their outputs are done, so the
+            intermediate results of a long pipeline aren't all in memory at
+            once. The released nodes are finished, but have no result.
+        pinned: List[str]
+            Optional. IDs of the nodes whose results are kept with
+            keep="outputs"
 
         Returns
         -------
@@ -167,146 +561,475 @@ class JobRunner:
         """
         if not out_dict:
             return
-        mapped_dict = deepcopy(out_dict)
+        graph = self.prepare(out_dict, selected_node_ids)
+        coroutine = self.flow_coroutine(graph, out_dict, as_models, keep, pinned)
+        if self.method in ("sync", "distributed"):
+            return asyncio.run(coroutine)
+        return coroutine
+
+    def prepare(
+        self,
+        out_dict: Dict[str, Union[OutNode, dict]],
+        selected_node_ids: Optional[List[str]] = None,
+    ) -> Graph:
+        """Parse, downselect, validate and simplify a flow (see `flowfunc.planner`)
+
+        Composite nodes are inlined after the validation (see `flowfunc.composite`).
+        """
+        graph = Graph.from_dict(out_dict)
         if selected_node_ids:
             logger.info(
-                f"Running {len(selected_node_ids)} node(s) out of {len(mapped_dict)}"
+                f"Running {len(selected_node_ids)} node(s) out of {len(graph)}"
                 f" in {self.method} mode."
             )
-            dependent_node_ids = self.dependent_nodes(selected_node_ids, mapped_dict)
-            logger.info(
-                f"Found {len(dependent_node_ids)} nodes dependent on selected nodes."
-            )
-            mapped_dict = {nodeid: mapped_dict[nodeid] for nodeid in dependent_node_ids}
+            graph = graph.subgraph(graph.upstream(graph.indices(selected_node_ids)))
+            logger.info(f"Found {len(graph)} nodes dependent on selected nodes.")
         else:
-            logger.info(f"Running {len(mapped_dict)} nodes in {self.method} mode.")
-        if self.method == "sync":
-            return asyncio.run(self.run_async(mapped_dict))
-        elif self.method == "async":
-            return self.run_async(mapped_dict)
-        elif self.method == "distributed" and self.same_worker:
-            return asyncio.run(self.run_distributed_same_worker(out_dict))
-        elif self.method == "async_distributed" and self.same_worker:
+            logger.info(f"Running {len(graph)} nodes in {self.method} mode.")
+        if self.validate:
+            issues = self.check(graph)
+            if issues:
+                raise GraphValidationError(issues)
+        graph = inline_composites(graph, self.flume_config)
+        if self.method in ("sync", "async"):
+            self.plan(graph)
+        return graph
+
+    def plan(self, graph: Graph):
+        """Merge the duplicated nodes and fold the constants of a graph"""
+        if not (self.fold_constants or self.merge_duplicates):
+            return
+        keys, constants = structural_keys(
+            graph, self.flume_config, salt=self.config_version or ""
+        )
+        if self.merge_duplicates:
+            merge_duplicates(graph, keys)
+        if self.fold_constants:
+            fold_constants(graph, {i: keys[i] for i in constants}, self.constants)
+
+    def flow_coroutine(
+        self,
+        graph: Graph,
+        out_dict: dict,
+        as_models: bool = True,
+        keep: str = "all",
+        pinned: Optional[List[str]] = None,
+    ):
+        """The coroutine which runs a prepared flow based on the method"""
+        if self.method in ("sync", "async"):
+            return self.run_async(graph, as_models=as_models, keep=keep, pinned=pinned)
+        elif self.method in ("distributed", "async_distributed") and self.same_worker:
             return self.run_distributed_same_worker(out_dict)
-        elif self.method == "distributed":
-            return asyncio.run(self.run_distributed(mapped_dict))
-        elif self.method == "async_distributed":
-            return self.run_distributed(mapped_dict)
+        elif self.method in ("distributed", "async_distributed"):
+            return self.run_distributed(graph.out_nodes())
         else:
             raise ValueError(
                 "The provided method is not identified."
                 " It should be one of sync, async or distributed"
             )
 
+    def submit(
+        self,
+        out_dict: Dict[str, Union[OutNode, dict]],
+        selected_node_ids: Optional[List[str]] = None,
+        as_models: bool = True,
+        keep: str = "all",
+        pinned: Optional[List[str]] = None,
+    ) -> Future:
+        """Run a flow in the shared runtime of this runner
+
+        The flow is run in an event loop which runs in a background thread and
+        is shared by all the flows submitted to this runner. Functions which
+        are not coroutines are run in the thread pool of the runner so that
+        they don't block the other flows. See `run` for the arguments.
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            Future which resolves to the same value `run` would return.
+        """
+        future = Future()
+        try:
+            if not out_dict:
+                future.set_result(None)
+                return future
+            graph = self.prepare(out_dict, selected_node_ids)
+            coroutine = self.flow_coroutine(graph, out_dict, as_models, keep, pinned)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        return asyncio.run_coroutine_threadsafe(coroutine, self.runtime_loop())
+
+    def run_many(
+        self,
+        out_dicts: List[Dict[str, Union[OutNode, dict]]],
+        as_models: bool = True,
+        return_exceptions: bool = False,
+        keep: str = "all",
+    ) -> list:
+        """Run many independent flows concurrently in the shared runtime
+
+        Parameters
+        ----------
+        out_dicts: list
+            The flows to run
+        as_models: bool
+            See `run`
+        return_exceptions: bool
+            If True, the exceptions raised by a flow (like a
+            GraphValidationError) are returned in its place instead of being
+            raised.
+        keep: str
+            See `run`
+
+        Returns
+        -------
+        results: list
+            Results of the flows in the same order as the flows
+        """
+        futures = [
+            self.submit(out_dict, as_models=as_models, keep=keep) for out_dict in out_dicts
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def runtime_loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop of the shared runtime, started on first use"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="flowfunc-runtime", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+        return self._loop
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool used to run functions which shouldn't block the event loop"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="flowfunc"
+                )
+        return self._executor
+
+    def limiter(self) -> Optional[FairLimiter]:
+        """Limiter of the running loop if the concurrency is limited"""
+        if self.max_concurrency is None:
+            return None
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = FairLimiter(self.max_concurrency)
+        return limiter
+
+    def close(self):
+        """Stop the shared runtime and the thread pool"""
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def dependent_nodes(self, selected_node_ids, mapped_dict):
         """Function to downselect only some nodes from the mapped_dict"""
-        new_node_ids = []
-        for nodeid, node in mapped_dict.items():
-            if nodeid in selected_node_ids:
-                new_node_ids.append(nodeid)
-                if not node.connections.inputs:
-                    continue
-                for param, mapping in node.connections.inputs.items():
-                    for connection in mapping:
-                        new_node_ids.append(connection.nodeId)
-        new_node_ids = list(set(new_node_ids))  # List of unique
-        if len(new_node_ids) > len(selected_node_ids):
-            return self.dependent_nodes(new_node_ids, mapped_dict)
-        return new_node_ids
-
-    async def run_async(self, mapped_dict) -> Dict[str, OutNode]:
-        """Run the flow asynchronously"""
-        nodes_evaluted = []
-        for nodeid, node in mapped_dict.items():
-            # Storing the lock in the node itself so that dependent nodes
-            # dont start a new job.
-            node.run_event = asyncio.Event()
-            nodes_evaluted.append(self.evaluate_node_async(nodeid, mapped_dict))
-        await asyncio.gather(*nodes_evaluted)
-        return mapped_dict
+        graph = Graph.from_dict(mapped_dict)
+        return [
+            graph.ids[i] for i in graph.upstream(graph.indices(selected_node_ids))
+        ]
 
-    async def evaluate_node_async(self, nodeid: str, mapped_dict: dict):
-        """Evaluate the node and return the result"""
-        out_node = mapped_dict[nodeid]
-        out_node.status = "started"
-        if hasattr(out_node, "result") and out_node.result:
+    async def run_async(
+        self,
+        mapped_dict: Union[Graph, Dict[str, Any]],
+        as_models: bool = True,
+        keep: str = "all",
+        pinned: Optional[List[str]] = None,
+    ) -> Union[Dict[str, OutNode], RunResult]:
+        """Run the flow asynchronously. See `run` for the arguments."""
+        graph = mapped_dict
+        if not isinstance(graph, Graph):
+            graph = Graph.from_dict(mapped_dict)
+            if self.validate:
+                issues = self.check(graph)
+                if issues:
+                    raise GraphValidationError(issues)
+            graph = inline_composites(graph, self.flume_config)
+        state = RunState(len(graph))
+        await self.execute(graph, state, self.kept_nodes(graph, keep, pinned))
+        result = RunResult(graph, state)
+        if as_models:
+            return result.to_models()
+        return result
+
+    @staticmethod
+    def kept_nodes(
+        graph: Graph, keep: str = "all", pinned: Optional[List[str]] = None
+    ) -> Optional[Set[int]]:
+        """Indices of the nodes whose results are kept (see `run`)
+
+        None if all the results are kept.
+        """
+        if keep == "all":
+            return None
+        if keep != "outputs":
+            raise ValueError(f"keep should be all or outputs, not {keep}.")
+        kept = {i for i in range(len(graph)) if not len(graph.out_edges(i))}
+        kept.update(graph.indices(pinned or ()))
+        return kept
+
+    async def execute(self, graph: Graph, state: RunState, keep: Optional[Set[int]] = None):
+        """Evaluate the nodes of the graph in the order of their dependencies
+
+        A node is started as soon as all the nodes connected to its inputs are
+        done. Nodes which are part of a cycle are never started. Duplicated
+        nodes (see `Graph.duplicates`) are not evaluated, they get a copy of
+        the state of their original once it's done.
+
+        If `keep` is given, the results of the other nodes are released once
+        all the nodes connected to their outputs are done. With a
+        `memory_budget`, results are spilled to disk when they don't fit in it.
+        At the end, only the spilled results of the kept nodes (the sink
+        nodes by default) are loaded back, the others are loaded when they
+        are read from the RunResult.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None
+        if self.run_timeout is not None:
+            deadline = loop.time() + self.run_timeout
+        waiting = graph.in_degrees()
+        ready = deque(i for i in range(len(graph)) if waiting[i] == 0)
+        running = {}
+        # Duplicated nodes waiting for their original to finish
+        copies: Dict[int, List[int]] = {}
+        finished = set()
+        # Number of nodes which still need the results of each node
+        consumers = None
+        if keep is not None:
+            consumers = array("l", [0]) * len(graph)
+            for src in graph.edge_src:
+                if src >= 0:
+                    consumers[src] += 1
+            for original in graph.duplicates.values():
+                consumers[original] += 1
+        budget = None
+        if self.memory_budget is not None:
+            budget = MemoryBudget(graph, state, self.memory_budget, self.spill_dir)
+
+        def release(i: int):
+            consumers[i] -= 1
+            if consumers[i] == 0 and i not in keep:
+                state.result[i] = None
+                state.result_mapped[i] = None
+                if budget is not None:
+                    budget.remove(i)
+
+        def done_with(i: int):
+            finished.add(i)
+            for duplicate in copies.pop(i, ()):
+                copy_state(i, duplicate)
+            if consumers is not None:
+                for edge in graph.in_edges(i):
+                    src = graph.edge_src[edge]
+                    if src >= 0:
+                        release(src)
+            for edge in graph.out_edges(i):
+                dst = graph.edge_dst[edge]
+                waiting[dst] -= 1
+                if waiting[dst] == 0:
+                    ready.append(dst)
+
+        def copy_state(original: int, i: int):
+            state.status[i] = state.status[original]
+            state.result[i] = state.result[original]
+            state.result_mapped[i] = state.result_mapped[original]
+            state.error[i] = state.error[original]
+            if budget is not None:
+                budget.share(original, i)
+            done_with(i)
+            if consumers is not None:
+                release(original)
+
+        try:
+            while ready or running:
+                while ready:
+                    i = ready.popleft()
+                    original = graph.duplicates.get(i)
+                    if original is not None:
+                        if original in finished:
+                            copy_state(original, i)
+                        else:
+                            copies.setdefault(original, []).append(i)
+                        continue
+                    task = asyncio.ensure_future(
+                        self.evaluate_node_async(graph, state, i, budget)
+                    )
+                    running[task] = i
+                timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.error(f"Run did not finish within {self.run_timeout} seconds.")
+                    await self.cancel_nodes(
+                        state,
+                        running,
+                        RunCancelledError(
+                            f"The run did not finish within {self.run_timeout} seconds."
+                        ),
+                    )
+                    return
+                for task in done:
+                    i = running.pop(task)
+                    task.result()
+                    if self.fail_fast and state.error[i] is not None:
+                        await self.cancel_nodes(
+                            state,
+                            running,
+                            RunCancelledError(f"Cancelled since node {graph.ids[i]} failed."),
+                        )
+                        return
+                    done_with(i)
+        except asyncio.CancelledError:
+            await self.cancel_nodes(
+                state, running, RunCancelledError("The run was cancelled.")
+            )
+            raise
+        finally:
+            if budget is not None:
+                budget.close(keep)
+                if budget.spilled:
+                    logger.info(f"Spilled {budget.spilled} bytes of results to disk.")
+
+    async def cancel_nodes(self, state: RunState, running: dict, error: Exception):
+        """Cancel the running nodes and mark them, along with the nodes which
+        were not started yet, as canceled (the same status rq uses).
+        """
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+        for task, i in running.items():
+            if task.cancelled():
+                state.status[i] = "canceled"
+                state.error[i] = error
+        running.clear()
+        for i, status in enumerate(state.status):
+            if status == "idle":
+                state.status[i] = "canceled"
+                state.error[i] = error
+
+    async def evaluate_node_async(
+        self,
+        graph: Graph,
+        state: RunState,
+        i: int,
+        budget: Optional[MemoryBudget] = None,
+    ):
+        """Evaluate the node and store the result in the run state
+
+        The result is counted in the memory `budget` of the run, if any, as
+        soon as it's stored.
+        """
+        nodeid = graph.ids[i]
+        if i in graph.preset:
+            state.result[i], state.result_mapped[i] = graph.preset[i]
+            state.status[i] = "finished"
+            return
+        state.status[i] = "started"
+        try:
+            config_node = self.flume_config.get_node(graph.types[i])
+        except ValueError as e:
+            state.error[i] = e
+            state.status[i] = "failed"
             return
-        config_node = self.flume_config.get_node(out_node.type)
         # method = validate_arguments(config_node.method)
         method = config_node.method
         logger.info(f"Evaluating node with id {nodeid} and function {method}")
-        out_node.result = None
-        out_node.result_mapped = {}
-        input_args = {}
-        for key, values in out_node.inputData.items():
-            if not values:
-                continue
-            # If there are more than one control in this port return the dict
-            if len(values) > 1:
-                variable_value = values
-            else:
-                # else return the value of the first item in the dict
-                # TODO: when flume implements option to have multiple inputs
-                # address it here.
-                variable_value = next(iter(values.values()))
-            if variable_value is None:
-                continue  # This is null coming from react for unset controls
-            input_args[key] = variable_value
-        for key, connections in out_node.connections.inputs.items():
-            # Now only one connection is supported by flume.
-            # Hence using the first one
-            dependent_nodeid = connections[0].nodeId
-            dependent_node = mapped_dict[dependent_nodeid]
-            out_node.status = "deferred"
-            logger.info(f"Node {nodeid} waiting for Node {dependent_nodeid} to finish.")
-            await dependent_node.run_event.wait()
-            if hasattr(dependent_node, "error") and dependent_node.error:
-                out_node.error = ErrorInDependentNode(
-                    f"Error in node {dependent_node.id}"
+        input_args = dict(graph.inputs[i])
+        for edge in graph.in_edges(i):
+            dependent_index = graph.edge_src[edge]
+            if dependent_index < 0:
+                state.error[i] = ErrorInDependentNode(
+                    f"Node {graph.missing[edge]} not found"
                 )
-                out_node.status = "failed"
-                out_node.run_event.set()
+                state.status[i] = "failed"
+                return
+            if state.error[dependent_index] is not None:
+                state.error[i] = ErrorInDependentNode(
+                    f"Error in node {graph.ids[dependent_index]}"
+                )
+                state.status[i] = "failed"
                 return
-            input_args[key] = dependent_node.result_mapped[connections[0].portName]
-        if inspect.iscoroutinefunction(method):
-            try:
-                method_output = await validate_call(
-                    config=ConfigDict(arbitrary_types_allowed=True)
-                )(method)(**input_args)
-            except Exception as e:
-                out_node.error = e
-                out_node.status = "failed"
-        else:
             try:
-                method_output = validate_call(
-                    config=ConfigDict(arbitrary_types_allowed=True)
-                )(method)(**input_args)
-            except Exception as e:
-                logger.error(f"Execution of Node {nodeid} has failed.")
-                out_node.error = e
-                out_node.status = "failed"
-        out_node.run_event.set()
-
-        if hasattr(out_node, "error") and out_node.error:
+                value = state.result_mapped[dependent_index][graph.edge_src_port[edge]]
+            except KeyError:
+                state.error[i] = ErrorInDependentNode(
+                    f"Node {graph.ids[dependent_index]} has no output"
+                    f" {graph.edge_src_port[edge]}"
+                )
+                state.status[i] = "failed"
+                return
+            if budget is not None:
+                # Spilled results are loaded back
+                value = budget.load(dependent_index, graph.edge_src_port[edge])
+            input_args[graph.edge_dst_port[edge]] = value
+        timeout = self.timeout_for(config_node)
+        retry = self.retry_for(config_node)
+        mapper = map_of(config_node)
+        try:
+            if mapper is not None:
+                # The chunks are limited and retried one by one
+                method_output = await self.call_map(mapper, input_args, id(state), nodeid)
+            else:
+                method_output = await self.call_with_retry(
+                    partial(self.call, method, input_args, timeout=timeout),
+                    retry,
+                    id(state),
+                    nodeid,
+                )
+        except Exception as e:
+            logger.error(f"Execution of Node {nodeid} has failed.")
+            state.error[i] = e
+            state.status[i] = "failed"
             return
-        out_node.result = method_output
+        state.result[i] = method_output
 
         # Converting the method output to a tuple so that it can be mapped
         # to the outputs dict
         if not isinstance(method_output, tuple):
             method_output = (method_output,)
-        output_args = [
-            x.name for x in (self.flume_config.get_node(out_node.type).outputs or [])
-        ]
-        out_node.result_mapped = {x: y for x, y in zip(output_args, method_output)}
-        out_node.status = "finished"
+        output_args = [x.name for x in (config_node.outputs or [])]
+        state.result_mapped[i] = {x: y for x, y in zip(output_args, method_output)}
+        state.status[i] = "finished"
+        if i in graph.constants:
+            self.constants.put(graph.constants[i], state.result[i], state.result_mapped[i])
+        if budget is not None:
+            budget.add(i)
 
     async def run_distributed(
         self, mapped_dict: Dict[str, OutNode]
     ) -> Dict[str, OutNode]:
         """Run the flow using python rq"""
         nodes_evaluted = []
+        run_id = uuid4().hex
         for nodeid, node in mapped_dict.items():
+            node.run_id = run_id
             # Storing the lock in the node itself so that dependent nodes
             # dont start a new job.
             if not hasattr(node, "run_event") or not node.run_event:
@@ -317,6 +1040,9 @@ class JobRunner:
 
     async def run_distributed_same_worker(self, out_dict: dict) -> Dict[str, OutNode]:
         """Run the whole flow in the same worker using python-rq"""
+        # Imported here so that python-rq is only loaded when it's used
+        from .distributed import NodeQueue
+
         if (
             not hasattr(self, "queue")
             or not self.queue
@@ -326,6 +1052,16 @@ class JobRunner:
                 "If the method is distributed, the `default_queue` argument cannot be empty."
                 " It should be an instance of NodeQueue."
             )
+        if self.config_name is not None:
+            return self.queue.enqueue(
+                run_registered_flow,
+                kwargs={
+                    "config_name": self.config_name,
+                    "config_version": self.config_version,
+                    "out_dict": out_dict,
+                },
+            )
+        # Without a registered config, the whole config has to be pickled
         return self.queue.enqueue(
             run_in_same_worker,
             kwargs={
@@ -391,6 +1127,10 @@ class JobRunner:
         )
         logger.info(f"Node {nodeid} has been submitted.")
         node.job_id = node.job.id
+        if node.run_id:
+            from .distributed import register_run_job
+
+            register_run_job(node.job, node.run_id)
         # Setting the current job's output connection job id
         # This may not be required
         if node.connections.outputs:
@@ -399,8 +1139,54 @@ class JobRunner:
                     conn.job_id = node.job.id
         node.run_event.set()
 
+    def cancel(self, run_id: str):
+        """Cancel the unfinished jobs of a distributed run
+
+        Queued and deferred jobs are cancelled and the workers running the
+        started jobs are asked to stop them.
+        """
+        from .distributed import cancel_run
+
+        cancel_run(run_id, self.queue.connection)
+
     def dict(self, mapped_dict: Dict[str, OutNode], *args, **kwargs) -> dict:
         ret_dict = {}
         for nodeid, node in mapped_dict.items():
             ret_dict[nodeid] = node.model_dump(*args, **kwargs)
         return ret_dict
+
+    def dumps(
+        self,
+        result: Union[RunResult, Dict[str, Union[OutNode, dict]]],
+        compress: bool = True,
+        with_flow: bool = False,
+    ) -> bytes:
+        """Encode the results of a run in the compact binary format
+
+        Parameters
+        ----------
+        result: RunResult | dict
+            A RunResult, or a flow (a dict of node dicts or OutNode objects,
+            like the one returned by `run`) with the results of its nodes
+        compress: bool
+            Compress the encoded data
+        with_flow: bool
+            Include the editor layout of the flow when encoding a RunResult
+
+        Returns
+        -------
+        data: bytes
+            Data which can be decoded using `loads`
+        """
+        if isinstance(result, RunResult):
+            return dumps_result(result, compress, with_flow)
+        return dumps_flow(result, compress)
+
+    def loads(self, data: bytes, allow_pickle: bool = False):
+        """Decode data encoded using `dumps`
+
+        Returns a RunResult for an encoded RunResult and a dict of node dicts,
+        which can be run again, for an encoded flow. Results which were
+        pickled are only loaded with `allow_pickle=True`, for trusted data.
+        """
+        return loads(data, allow_pickle)
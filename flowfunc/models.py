@@ -1,8 +1,9 @@
 # Pydantic models corresponding to flume's object structure
 
+import random
 from typing import Any, Callable
 from enum import Enum
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
 
 class ControlType(str, Enum):
@@ -85,6 +86,43 @@ class PortFunction(BaseModel):
     path: str | None = None
 
 
+class RetryPolicy(BaseModel):
+    """Retry policy of a node
+
+    A failed node is retried after a delay of `backoff * factor ** (attempt - 1)`
+    seconds plus a random jitter of up to `jitter` times that delay, capped at
+    `max_backoff`. Only the exceptions which are instances of `retry_on` are
+    retried. Argument validation errors are never retried.
+    """
+
+    max_attempts: int = Field(default=3, ge=1)  # Including the first attempt
+    backoff: float = Field(default=1.0, ge=0)
+    factor: float = Field(default=2.0, ge=1)
+    max_backoff: float | None = None
+    jitter: float = Field(default=0.1, ge=0)
+    retry_on: tuple[type[Exception], ...] = (Exception,)
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        """Check if a node which failed with the error in the given attempt
+        (starting at 1) should be retried.
+        """
+        if attempt >= self.max_attempts or isinstance(error, ValidationError):
+            return False
+        return isinstance(error, self.retry_on)
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retrying after the given failed attempt"""
+        delay = self.backoff * self.factor ** (attempt - 1)
+        delay += random.uniform(0, self.jitter * delay)
+        if self.max_backoff is not None:
+            delay = min(delay, self.max_backoff)
+        return delay
+
+    def delays(self) -> list[float]:
+        """Delays before each of the retries"""
+        return [self.delay(attempt) for attempt in range(1, self.max_attempts)]
+
+
 class Node(BaseModel):
     """Objects corresponding to python functions. But only the name of the
     function are stored in the pydantic model
@@ -102,6 +140,15 @@ class Node(BaseModel):
     inputs: list[Port] | PortFunction | None = None
     outputs: list[Port] | PortFunction | None = None
 
+    # Execution options which are not sent to the editor
+    # Seconds after which the execution of the node is cancelled
+    timeout: float | None = Field(default=None, exclude=True)
+    # How the node is retried when it fails
+    retry: RetryPolicy | None = Field(default=None, exclude=True)
+    # The function always returns the same outputs for the same inputs and
+    # has no side effects, so its results can be reused
+    pure: bool = Field(default=False, exclude=True)
+
     def __hash__(self):
         return hash(self.type)
 
@@ -164,6 +211,9 @@ class OutNode(BaseModel):
     job: Any | None = Field(default=None, exclude=True)
     job_id: str | None = None
 
+    # ID of the run in which the node was executed
+    run_id: str | None = None
+
     # rq related settings which will be passed to enqueue function
     settings: dict[str, Any] | None = None
 
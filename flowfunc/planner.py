@@ -0,0 +1,275 @@
+"""
+Planner
+-------
+Passes which simplify a graph before it is run.
+
+Nodes created from functions marked as pure (``@node_options(pure=True)``)
+always return the same outputs for the same inputs and have no side effects.
+A pure node whose inputs are all literal values or outputs of other such
+nodes is a constant: it computes the same value in every run of the flow.
+
+Constants are identified by a structural key, a hash of the node type, the
+literal inputs and the keys of the nodes connected to the inputs. The key
+doesn't depend on the node ids or the editor layout, so the same constant
+gets the same key in every run and in every copy of a workflow, and a new
+key as soon as the workflow is edited. The runner keeps the results of the
+constants in a `ConstantCache` by their key and sets them as the results of
+the nodes before later runs, so the constant parts of the flow are only
+evaluated once.
+
+Pure nodes which are connected to nodes that are not pure are keyed by the
+ids of those nodes, so the copies of a pure node (or of a whole subgraph of pure nodes)
+with the same inputs in one flow get the same key. Only one of the copies is
+evaluated and its results are shared with the others.
+
+The cached and shared results are used by many nodes, so the nodes
+shouldn't modify their inputs in place.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import Config
+from .graph import Graph
+from .utils import logger, value_size
+
+# Default maximum size of the results in a ConstantCache
+CONSTANT_CACHE_BYTES = 256 * 2**20
+
+
+def topological_order(graph: Graph) -> List[int]:
+    """Node indices in the order of their dependencies
+
+    The nodes which are part of a cycle (or depend on one) are left out.
+    """
+    waiting = graph.in_degrees()
+    ready = deque(i for i in range(len(graph)) if waiting[i] == 0)
+    order = []
+    while ready:
+        i = ready.popleft()
+        order.append(i)
+        for edge in graph.out_edges(i):
+            dst = graph.edge_dst[edge]
+            waiting[dst] -= 1
+            if waiting[dst] == 0:
+                ready.append(dst)
+    return order
+
+
+def _is_pure(config: Config, node_type: str) -> bool:
+    try:
+        return bool(config.get_node(node_type).pure)
+    except ValueError:
+        return False
+
+
+def structural_keys(
+    graph: Graph, config: Config, salt: str = ""
+) -> Tuple[Dict[int, str], Set[int]]:
+    """Structural keys of the pure nodes of a graph
+
+    Nodes which are connected to nodes that are not pure are identified by
+    the ids of those nodes, so two pure nodes have the same key if they
+    compute the same value in the same run.
+
+    Parameters
+    ----------
+    graph: Graph
+        The graph
+    config: Config
+        The config with the nodes of the graph
+    salt: str
+        Optional. Added to all the keys, for example the version of the config
+
+    Returns
+    -------
+    keys: Dict[int, str]
+        Node index to key of the pure nodes
+    constants: Set[int]
+        The pure nodes which only depend on other pure nodes
+    """
+    keys: Dict[int, str] = {}
+    constants: Set[int] = set()
+    pure: Dict[str, bool] = {}
+    for i in topological_order(graph):
+        node_type = graph.types[i]
+        if node_type not in pure:
+            pure[node_type] = _is_pure(config, node_type)
+        if not pure[node_type] or i in graph.preset:
+            continue
+        connections = []
+        constant = True
+        for edge in graph.in_edges(i):
+            src = graph.edge_src[edge]
+            if src < 0:
+                break
+            if src in keys:
+                source = keys[src]
+                constant = constant and src in constants
+            else:
+                source = f"node:{graph.ids[src]}"
+                constant = False
+            connections.append((graph.edge_dst_port[edge], graph.edge_src_port[edge], source))
+        else:
+            try:
+                data = json.dumps(
+                    [salt, node_type, graph.inputs[i], sorted(connections)], sort_keys=True
+                )
+            except (TypeError, ValueError):
+                # Only json values can be compared reliably
+                continue
+            keys[i] = hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+            if constant:
+                constants.add(i)
+    return keys, constants
+
+
+def constant_keys(graph: Graph, config: Config, salt: str = "") -> Dict[int, str]:
+    """Structural keys of the constant nodes of a graph"""
+    keys, constants = structural_keys(graph, config, salt)
+    return {i: keys[i] for i in constants}
+
+
+def duplicate_nodes(keys: Dict[int, str]) -> Dict[int, int]:
+    """The pure nodes which compute the same value as another node
+
+    Returns a mapping of the node index of each duplicate to the index of the
+    first node with the same structural key (see `structural_keys`). Since
+    the key of a node includes the keys of the nodes connected to its inputs,
+    copies of whole subgraphs are found.
+    """
+    first: Dict[str, int] = {}
+    duplicates = {}
+    for i in sorted(keys):
+        original = first.setdefault(keys[i], i)
+        if original != i:
+            duplicates[i] = original
+    return duplicates
+
+
+class ConstantCache:
+    """Least recently used cache of the results of constant nodes
+
+    The cache is limited by the number of results and by their estimated
+    size in bytes (see `flowfunc.utils.value_size`). Results larger than
+    `max_value_bytes` aren't cached, so large results can still be
+    released or spilled during a run.
+
+    Attributes
+    ----------
+    maxsize: int
+        Maximum number of results in the cache
+    max_bytes: int
+        Maximum total size of the results in the cache
+    max_value_bytes: int
+        Maximum size of a cached result. A sixteenth of `max_bytes` by default.
+    nbytes: int
+        Total size of the results in the cache
+    hits: int
+        Number of nodes whose result was found in the cache
+    misses: int
+        Number of constant nodes which had to be evaluated
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        max_bytes: int = CONSTANT_CACHE_BYTES,
+        max_value_bytes: Optional[int] = None,
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_bytes // 16 if max_value_bytes is None else max_value_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, Tuple[Any, dict]] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Tuple[Any, dict]]:
+        """The (result, result_mapped) of a constant node, if it's cached"""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, result: Any, result_mapped: dict):
+        """Cache the results of a constant node, unless they are too large"""
+        values = result if isinstance(result, tuple) else (result,)
+        size = sum(value_size(v) for v in values)
+        with self._lock:
+            self._remove(key)
+            if size > min(self.max_value_bytes, self.max_bytes):
+                return
+            self._cache[key] = (result, result_mapped)
+            self._sizes[key] = size
+            self.nbytes += size
+            while len(self._cache) > self.maxsize or self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._cache)))
+
+    def _remove(self, key: str):
+        if key in self._cache:
+            del self._cache[key]
+            self.nbytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def merge_duplicates(graph: Graph, keys: Dict[int, str]) -> int:
+    """Find the duplicated pure nodes of a graph, given their structural keys
+
+    The duplicates are stored in `graph.duplicates`, so that the runner only
+    evaluates the first of the copies. Returns the number of duplicates.
+    """
+    graph.duplicates = duplicate_nodes(keys)
+    if graph.duplicates:
+        logger.info(f"Found {len(graph.duplicates)} duplicated node(s).")
+    return len(graph.duplicates)
+
+
+def fold_constants(graph: Graph, keys: Dict[int, str], cache: ConstantCache) -> int:
+    """Set the cached results of the constant nodes as their results
+
+    Parameters
+    ----------
+    graph: Graph
+        The graph
+    keys: Dict[int, str]
+        Node index to structural key of the constant nodes (see
+        `constant_keys`). They are stored in `graph.constants`, so that the
+        runner can cache the results of the ones which are evaluated.
+    cache: ConstantCache
+        The results of the constants evaluated before
+
+    Returns
+    -------
+    folded: int
+        Number of nodes whose result was found in the cache
+    """
+    graph.constants = keys
+    folded = 0
+    for i, key in graph.constants.items():
+        value = cache.get(key)
+        if value is not None:
+            graph.preset[i] = value
+            folded += 1
+    if graph.constants:
+        logger.info(
+            f"Found {len(graph.constants)} constant node(s), {folded} of them cached."
+        )
+    return folded
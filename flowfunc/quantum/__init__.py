@@ -0,0 +1,32 @@
+"""
+Quantum
+-------
+Circuits, a NumPy statevector simulator and the nodes to use them in flows.
+"""
+try:
+    import numpy  # noqa: F401
+except ImportError as e:
+    raise ImportError(
+        "numpy is required for the quantum nodes. Install it using"
+        " `pip install numpy`."
+    ) from e
+
+from .backends import run_circuit
+from .circuit import Circuit, Operation
+from .gates import GATES, gate_matrix
+from .mps import MPSState, simulate_mps
+from .state import QuantumState
+from .statevector import StateVector, simulate
+
+__all__ = [
+    "Circuit",
+    "Operation",
+    "GATES",
+    "gate_matrix",
+    "QuantumState",
+    "StateVector",
+    "MPSState",
+    "simulate",
+    "simulate_mps",
+    "run_circuit",
+]
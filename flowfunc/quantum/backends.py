@@ -0,0 +1,24 @@
+"""
+Backends
+--------
+Simulation of a circuit with the backend selected by the circuit.
+"""
+from .circuit import Circuit
+from .mps import simulate_mps
+from .state import QuantumState
+from .statevector import simulate
+
+
+def run_circuit(circuit: Circuit, fuse: bool = True) -> QuantumState:
+    """Simulate a circuit with its backend
+
+    Parameters
+    ----------
+    circuit: Circuit
+        The circuit. Its `backend` selects the simulator.
+    fuse: bool
+        Fuse the gates before applying them (statevector backend only)
+    """
+    if circuit.backend == "mps":
+        return simulate_mps(circuit)
+    return simulate(circuit, fuse=fuse)
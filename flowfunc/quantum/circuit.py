@@ -0,0 +1,327 @@
+"""
+Circuit
+-------
+Description of a quantum circuit which is built up by the gate nodes.
+
+A `Circuit` is immutable. Adding a gate returns a new circuit which points to
+the circuit it was created from, so adding a gate is O(1) and a circuit can
+be used by many nodes (for example two branches of a flow which add
+different gates) without copying it. Nothing is simulated until the circuit
+is passed to a simulator.
+"""
+from __future__ import annotations
+import hashlib
+from typing import Iterable, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .gates import gate_spec
+
+PRECISIONS = {"complex64": np.complex64, "complex128": np.complex128}
+BACKENDS = ("statevector", "mps")
+
+
+class Operation(NamedTuple):
+    """A gate applied to some qubits of a circuit
+
+    The `matrix` is only set for custom unitaries (name "unitary"), otherwise
+    it's created from the name and the parameters of the gate.
+    """
+
+    name: str
+    qubits: Tuple[int, ...]
+    params: Tuple[float, ...] = ()
+    controls: Tuple[int, ...] = ()
+    matrix: Optional[np.ndarray] = None
+
+
+class Circuit:
+    """An immutable quantum circuit
+
+    Attributes
+    ----------
+    num_qubits: int
+        Number of qubits. Qubit 0 is the most significant bit of the index of
+        an amplitude in the statevector.
+    precision: str
+        complex64 or complex128. The precision of the amplitudes when the
+        circuit is simulated. complex64 halves the memory required.
+    backend: str
+        The simulator which is used for the circuit. "statevector" keeps all
+        the 2**n amplitudes. "mps" keeps a matrix product state, whose memory
+        only grows linearly with the number of qubits for circuits with
+        little entanglement.
+    max_bond: int
+        Maximum bond dimension of a matrix product state
+    cutoff: float
+        The smallest singular values of a matrix product state are discarded
+        as long as their total weight stays below this fraction
+    """
+
+    __slots__ = (
+        "num_qubits",
+        "precision",
+        "backend",
+        "max_bond",
+        "cutoff",
+        "_parent",
+        "_op",
+        "_length",
+        "_ops",
+        "_fingerprint",
+    )
+
+    def __init__(
+        self,
+        num_qubits: int,
+        precision: str = "complex128",
+        backend: str = "statevector",
+        max_bond: int = 64,
+        cutoff: float = 1e-10,
+    ):
+        if num_qubits < 1:
+            raise ValueError("A circuit needs at least one qubit.")
+        if precision not in PRECISIONS:
+            raise ValueError(
+                f"Unknown precision {precision}. Use one of {', '.join(PRECISIONS)}."
+            )
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}. Use one of {', '.join(BACKENDS)}.")
+        if max_bond < 1:
+            raise ValueError("The maximum bond dimension should be at least 1.")
+        self.num_qubits = num_qubits
+        self.precision = precision
+        self.backend = backend
+        self.max_bond = max_bond
+        self.cutoff = cutoff
+        self._parent: Optional[Circuit] = None
+        self._op: Optional[Operation] = None
+        self._length = 0
+        self._ops: Optional[Tuple[Operation, ...]] = ()
+        self._fingerprint: Optional[str] = None
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(PRECISIONS[self.precision])
+
+    def _child(self, op: Operation) -> Circuit:
+        circuit = object.__new__(Circuit)
+        circuit.num_qubits = self.num_qubits
+        circuit.precision = self.precision
+        circuit.backend = self.backend
+        circuit.max_bond = self.max_bond
+        circuit.cutoff = self.cutoff
+        circuit._parent = self
+        circuit._op = op
+        circuit._length = self._length + 1
+        circuit._ops = None
+        circuit._fingerprint = None
+        return circuit
+
+    def _check_qubits(self, qubits: Iterable[int]) -> Tuple[int, ...]:
+        qubits = tuple(int(q) for q in qubits)
+        for q in qubits:
+            if not 0 <= q < self.num_qubits:
+                raise ValueError(
+                    f"Qubit {q} is out of range for a circuit with"
+                    f" {self.num_qubits} qubit(s)."
+                )
+        if len(set(qubits)) != len(qubits):
+            raise ValueError(f"A gate cannot use a qubit twice: {qubits}.")
+        return qubits
+
+    def gate(
+        self,
+        name: str,
+        qubits: Sequence[int],
+        params: Sequence[float] = (),
+        controls: Sequence[int] = (),
+    ) -> Circuit:
+        """Create a new circuit with a gate added at the end
+
+        Parameters
+        ----------
+        name: str
+            Name of the gate (see `flowfunc.quantum.gates.GATES`)
+        qubits: Sequence[int]
+            The target qubits of the gate
+        params: Sequence[float]
+            The parameters of the gate, for example the angle of a rotation
+        controls: Sequence[int]
+            Qubits which control the gate. The gate is only applied to the
+            amplitudes where all the control qubits are 1.
+        """
+        spec = gate_spec(name)
+        if len(qubits) != spec.num_qubits:
+            raise ValueError(
+                f"Gate {name} acts on {spec.num_qubits} qubit(s), {len(qubits)} given."
+            )
+        if len(params) != spec.num_params:
+            raise ValueError(
+                f"Gate {name} takes {spec.num_params} parameter(s), {len(params)} given."
+            )
+        all_qubits = self._check_qubits(tuple(controls) + tuple(qubits))
+        return self._child(
+            Operation(
+                name,
+                all_qubits[len(controls) :],
+                tuple(float(p) for p in params),
+                all_qubits[: len(controls)],
+            )
+        )
+
+    def unitary(
+        self, matrix: np.ndarray, qubits: Sequence[int], controls: Sequence[int] = ()
+    ) -> Circuit:
+        """Create a new circuit with a custom unitary added at the end"""
+        matrix = np.asarray(matrix, dtype=np.complex128)
+        if matrix.shape != (2 ** len(qubits),) * 2:
+            raise ValueError(
+                f"A unitary on {len(qubits)} qubit(s) should have the shape"
+                f" {(2 ** len(qubits),) * 2}, not {matrix.shape}."
+            )
+        all_qubits = self._check_qubits(tuple(controls) + tuple(qubits))
+        matrix.setflags(write=False)
+        return self._child(
+            Operation(
+                "unitary",
+                all_qubits[len(controls) :],
+                (),
+                all_qubits[: len(controls)],
+                matrix,
+            )
+        )
+
+    @property
+    def ops(self) -> Tuple[Operation, ...]:
+        """The operations of the circuit in the order they are applied"""
+        if self._ops is None:
+            ops = []
+            circuit = self
+            while circuit._ops is None:
+                ops.append(circuit._op)
+                circuit = circuit._parent
+            self._ops = circuit._ops + tuple(reversed(ops))
+        return self._ops
+
+    @classmethod
+    def from_operations(
+        cls,
+        num_qubits: int,
+        ops: Iterable[Operation],
+        precision: str = "complex128",
+        backend: str = "statevector",
+        max_bond: int = 64,
+        cutoff: float = 1e-10,
+    ) -> Circuit:
+        """Create a circuit from a sequence of operations"""
+        circuit = cls(num_qubits, precision, backend, max_bond, cutoff)
+        for op in ops:
+            circuit = circuit._child(Operation(*op))
+        return circuit
+
+    @property
+    def parameters(self) -> np.ndarray:
+        """The parameters of all the gates, in the order of the operations"""
+        return np.array([p for op in self.ops for p in op.params], dtype=float)
+
+    def with_parameters(self, values: Sequence[float]) -> Circuit:
+        """Create a circuit with the same gates but other parameters
+
+        The values replace the parameters of the gates in the same order as
+        `parameters`.
+        """
+        values = [float(v) for v in np.ravel(values)]
+        count = sum(len(op.params) for op in self.ops)
+        if len(values) != count:
+            raise ValueError(f"The circuit has {count} parameter(s), {len(values)} given.")
+        ops = []
+        for op in self.ops:
+            if op.params:
+                op = op._replace(params=tuple(values[: len(op.params)]))
+                values = values[len(op.params) :]
+            ops.append(op)
+        return Circuit.from_operations(
+            self.num_qubits, ops, self.precision, self.backend, self.max_bond, self.cutoff
+        )
+
+    def __reduce__(self):
+        # Pickled as a flat list of operations instead of the chain of parents
+        return (
+            Circuit.from_operations,
+            (
+                self.num_qubits,
+                self.ops,
+                self.precision,
+                self.backend,
+                self.max_bond,
+                self.cutoff,
+            ),
+        )
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __repr__(self) -> str:
+        return (
+            f"Circuit({self.num_qubits} qubit(s), {self._length} operation(s),"
+            f" {self.precision}, {self.backend})"
+        )
+
+    def fingerprint(self) -> str:
+        """Hash of the qubits, precision and operations of the circuit
+
+        The hash of a circuit is derived from the hash of the circuit it was
+        created from, so it's only computed for the new operations.
+        """
+        if self._fingerprint is None:
+            chain = []
+            circuit = self
+            while circuit._fingerprint is None and circuit._parent is not None:
+                chain.append(circuit)
+                circuit = circuit._parent
+            if circuit._fingerprint is None:
+                circuit._fingerprint = hashlib.sha256(
+                    f"{circuit.num_qubits}:{circuit.precision}".encode()
+                ).hexdigest()
+            fingerprint = circuit._fingerprint
+            for circuit in reversed(chain):
+                op = circuit._op
+                digest = hashlib.sha256(fingerprint.encode())
+                digest.update(repr((op.name, op.qubits, op.params, op.controls)).encode())
+                if op.matrix is not None:
+                    digest.update(op.matrix.tobytes())
+                fingerprint = circuit._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    # Shortcuts for the common gates
+
+    def h(self, qubit: int) -> Circuit:
+        return self.gate("h", [qubit])
+
+    def x(self, qubit: int) -> Circuit:
+        return self.gate("x", [qubit])
+
+    def y(self, qubit: int) -> Circuit:
+        return self.gate("y", [qubit])
+
+    def z(self, qubit: int) -> Circuit:
+        return self.gate("z", [qubit])
+
+    def rx(self, qubit: int, theta: float) -> Circuit:
+        return self.gate("rx", [qubit], [theta])
+
+    def ry(self, qubit: int, theta: float) -> Circuit:
+        return self.gate("ry", [qubit], [theta])
+
+    def rz(self, qubit: int, theta: float) -> Circuit:
+        return self.gate("rz", [qubit], [theta])
+
+    def cx(self, control: int, target: int) -> Circuit:
+        return self.gate("x", [target], controls=[control])
+
+    def cz(self, control: int, target: int) -> Circuit:
+        return self.gate("z", [target], controls=[control])
+
+    def swap(self, qubit1: int, qubit2: int) -> Circuit:
+        return self.gate("swap", [qubit1, qubit2])
@@ -0,0 +1,206 @@
+"""
+Gate fusion
+-----------
+Fuses the operations of a circuit into fewer, larger unitaries before the
+circuit is simulated.
+
+Each operation applied by the statevector simulator is a full pass over the
+amplitudes, so a deep circuit is limited by the memory bandwidth. A gate on
+up to `MAX_WINDOW` neighbouring qubits costs about the same as a single
+qubit gate, so the operations are greedily merged into blocks of at most
+`max_qubits` qubits which can be applied with a single matmul:
+
+- Each qubit has at most one pending block. A new operation is merged with
+  the pending blocks of its qubits if the merged block is still small
+  enough, otherwise those blocks are emitted and the operation starts a new
+  block.
+- Pending blocks never share a qubit, so they commute and can be emitted in
+  any order.
+- Blocks with a single operation are emitted as they are, so that the
+  simulator can still use the fast paths for diagonal and controlled gates.
+
+The fused operations of a circuit are cached by its fingerprint, so a circuit
+which is simulated many times (for example by the nodes of different runs of
+a workflow) is only fused once.
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils import logger
+from .circuit import Circuit, Operation
+from .gates import gate_matrix
+from .statevector import MAX_WINDOW, expand_matrix, window_for
+
+
+def operation_matrix(op: Operation) -> np.ndarray:
+    """Matrix of an operation on its controls followed by its qubits"""
+    matrix = op.matrix if op.matrix is not None else gate_matrix(op.name, op.params)
+    if not op.controls:
+        return matrix
+    size = 2 ** (len(op.controls) + len(op.qubits))
+    d = matrix.shape[-1]
+    full = np.zeros(matrix.shape[:-2] + (size, size), dtype=np.complex128)
+    full[..., range(size - d), range(size - d)] = 1
+    full[..., -d:, -d:] = matrix
+    return full
+
+
+def _fusable(op: Operation, batched: bool) -> bool:
+    # Operations with a matrix per state of a batch are only fused on demand
+    if batched:
+        return True
+    if op.matrix is not None:
+        return op.matrix.ndim == 2
+    return not any(np.ndim(p) for p in op.params)
+
+
+class _Block:
+    __slots__ = ("qubits", "ops", "matrix")
+
+    def __init__(self, op: Operation):
+        self.qubits = tuple(op.controls) + tuple(op.qubits)
+        self.ops = [op]
+        self.matrix: Optional[np.ndarray] = None
+
+    def get_matrix(self) -> np.ndarray:
+        if self.matrix is None:
+            self.matrix = operation_matrix(self.ops[0])
+        return self.matrix
+
+    def operation(self) -> Operation:
+        if len(self.ops) == 1:
+            return self.ops[0]
+        matrix = self.get_matrix()
+        matrix.setflags(write=False)
+        return Operation("unitary", self.qubits, matrix=matrix)
+
+
+def fuse_operations(
+    ops: Iterable[Operation],
+    num_qubits: int,
+    max_qubits: int = MAX_WINDOW,
+    batched: bool = False,
+) -> List[Operation]:
+    """Fuse consecutive operations into unitaries on at most `max_qubits` qubits
+
+    Parameters
+    ----------
+    ops: Iterable[Operation]
+        The operations in the order they are applied
+    num_qubits: int
+        Number of qubits of the circuit
+    max_qubits: int
+        Maximum number of qubits of a fused unitary
+    batched: bool
+        Also fuse the operations with one matrix per state of a batch. The
+        unitaries they are fused into are batched too.
+
+    Returns
+    -------
+    ops: List[Operation]
+        Operations with the same effect. The fused unitaries act on their
+        qubits in increasing order.
+    """
+    fused: List[Operation] = []
+    # The pending block of each qubit, and all the pending blocks in the order
+    # they were created (blocks are hashable by identity)
+    pending: Dict[int, _Block] = {}
+    blocks: Dict[_Block, None] = {}
+
+    def emit(block: _Block):
+        del blocks[block]
+        for q in block.qubits:
+            del pending[q]
+        fused.append(block.operation())
+
+    for op in ops:
+        qubits = tuple(op.controls) + tuple(op.qubits)
+        touched = list(dict.fromkeys(pending[q] for q in qubits if q in pending))
+        merged = sorted(set(qubits).union(*(b.qubits for b in touched)))
+        if not _fusable(op, batched) or len(qubits) > max_qubits:
+            for block in touched:
+                emit(block)
+            fused.append(op)
+            continue
+        if len(merged) > max_qubits or window_for(merged, num_qubits) is None:
+            for block in touched:
+                emit(block)
+            touched = []
+            merged = sorted(qubits)
+            if window_for(merged, num_qubits) is None:
+                # Gates on qubits far apart are not fused with other gates
+                fused.append(op)
+                continue
+        block = _Block(op)
+        if touched:
+            matrix = expand_matrix(operation_matrix(op), qubits, merged)
+            for other in touched:
+                matrix = matrix @ expand_matrix(other.get_matrix(), other.qubits, merged)
+                block.ops = other.ops + block.ops
+                del blocks[other]
+            block.qubits = tuple(merged)
+            block.matrix = matrix
+        for q in block.qubits:
+            pending[q] = block
+        blocks[block] = None
+    for block in list(blocks):
+        emit(block)
+    return fused
+
+
+class FusionCache:
+    """Least recently used cache of the fused operations of circuits
+
+    Attributes
+    ----------
+    maxsize: int
+        Maximum number of circuits in the cache
+    hits: int
+        Number of circuits found in the cache
+    misses: int
+        Number of circuits which were fused
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[Tuple[str, int], Tuple[Operation, ...]] = OrderedDict()
+
+    def get(self, circuit: Circuit, max_qubits: int = MAX_WINDOW) -> Tuple[Operation, ...]:
+        """Fused operations of a circuit"""
+        key = (circuit.fingerprint(), max_qubits)
+        with self._lock:
+            ops = self._cache.get(key)
+            if ops is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return ops
+        ops = tuple(fuse_operations(circuit.ops, circuit.num_qubits, max_qubits))
+        logger.debug(f"Fused {len(circuit)} operation(s) into {len(ops)}.")
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = ops
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return ops
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+fusion_cache = FusionCache()
+
+
+def fused_operations(circuit: Circuit, max_qubits: int = MAX_WINDOW) -> Tuple[Operation, ...]:
+    """Fused operations of a circuit, using the shared cache"""
+    return fusion_cache.get(circuit, max_qubits)
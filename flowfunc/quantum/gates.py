@@ -0,0 +1,152 @@
+"""
+Gates
+-----
+Matrices of the gates supported by the simulators.
+
+Each gate is described by a `GateSpec` with the number of qubits it acts on
+and the number of its parameters. The matrices use the big endian qubit
+order of the simulators: the first qubit of a gate is the most significant
+bit of the row and column index of its matrix.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, NamedTuple, Sequence
+
+import numpy as np
+
+_SQRT1_2 = 1 / np.sqrt(2)
+
+
+class GateSpec(NamedTuple):
+    """Description of a gate"""
+
+    name: str
+    num_qubits: int
+    num_params: int
+    # Function which creates the matrix from the parameters
+    matrix: Callable[..., np.ndarray]
+    # Diagonal gates are applied by scaling the amplitudes in place
+    diagonal: bool = False
+
+
+def _fixed(matrix) -> Callable[[], np.ndarray]:
+    matrix = np.asarray(matrix, dtype=np.complex128)
+    matrix.setflags(write=False)
+    return lambda: matrix
+
+
+def _rx(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[c, -1j * s], [-1j * s, c]], dtype=np.complex128)
+
+
+def _ry(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[c, -s], [s, c]], dtype=np.complex128)
+
+
+def _rz(theta):
+    return np.diag([np.exp(-0.5j * theta), np.exp(0.5j * theta)])
+
+
+def _phase(phi):
+    return np.diag([1, np.exp(1j * phi)]).astype(np.complex128)
+
+
+def _u(theta, phi, lam):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array(
+        [
+            [c, -np.exp(1j * lam) * s],
+            [np.exp(1j * phi) * s, np.exp(1j * (phi + lam)) * c],
+        ],
+        dtype=np.complex128,
+    )
+
+
+def _rxx(theta):
+    c, s = np.cos(theta / 2), -1j * np.sin(theta / 2)
+    return np.array(
+        [[c, 0, 0, s], [0, c, s, 0], [0, s, c, 0], [s, 0, 0, c]], dtype=np.complex128
+    )
+
+
+def _ryy(theta):
+    c, s = np.cos(theta / 2), 1j * np.sin(theta / 2)
+    return np.array(
+        [[c, 0, 0, s], [0, c, -s, 0], [0, -s, c, 0], [s, 0, 0, c]], dtype=np.complex128
+    )
+
+
+def _rzz(theta):
+    a, b = np.exp(-0.5j * theta), np.exp(0.5j * theta)
+    return np.diag([a, b, b, a])
+
+
+GATES: Dict[str, GateSpec] = {
+    spec.name: spec
+    for spec in [
+        GateSpec("id", 1, 0, _fixed(np.eye(2)), diagonal=True),
+        GateSpec("h", 1, 0, _fixed([[_SQRT1_2, _SQRT1_2], [_SQRT1_2, -_SQRT1_2]])),
+        GateSpec("x", 1, 0, _fixed([[0, 1], [1, 0]])),
+        GateSpec("y", 1, 0, _fixed([[0, -1j], [1j, 0]])),
+        GateSpec("z", 1, 0, _fixed(np.diag([1, -1])), diagonal=True),
+        GateSpec("s", 1, 0, _fixed(np.diag([1, 1j])), diagonal=True),
+        GateSpec("sdg", 1, 0, _fixed(np.diag([1, -1j])), diagonal=True),
+        GateSpec("t", 1, 0, _fixed(np.diag([1, np.exp(0.25j * np.pi)])), diagonal=True),
+        GateSpec(
+            "tdg", 1, 0, _fixed(np.diag([1, np.exp(-0.25j * np.pi)])), diagonal=True
+        ),
+        GateSpec("sx", 1, 0, _fixed(0.5 * np.array([[1 + 1j, 1 - 1j], [1 - 1j, 1 + 1j]]))),
+        GateSpec("rx", 1, 1, _rx),
+        GateSpec("ry", 1, 1, _ry),
+        GateSpec("rz", 1, 1, _rz, diagonal=True),
+        GateSpec("p", 1, 1, _phase, diagonal=True),
+        GateSpec("u", 1, 3, _u),
+        GateSpec(
+            "swap",
+            2,
+            0,
+            _fixed([[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]]),
+        ),
+        GateSpec(
+            "iswap",
+            2,
+            0,
+            _fixed([[1, 0, 0, 0], [0, 0, 1j, 0], [0, 1j, 0, 0], [0, 0, 0, 1]]),
+        ),
+        GateSpec("rxx", 2, 1, _rxx),
+        GateSpec("ryy", 2, 1, _ryy),
+        GateSpec("rzz", 2, 1, _rzz, diagonal=True),
+    ]
+}
+
+
+def gate_spec(name: str) -> GateSpec:
+    """Get the description of a gate by its name"""
+    try:
+        return GATES[name]
+    except KeyError:
+        raise ValueError(f"Unknown gate {name}.") from None
+
+
+def gate_matrix(name: str, params: Sequence[float] = ()) -> np.ndarray:
+    """Matrix of a gate
+
+    Parameters
+    ----------
+    name: str
+        Name of the gate
+    params: Sequence[float]
+        Parameters of the gate, for example the angle of a rotation. A
+        parameter can also be a 1D array, in which case a batch of matrices
+        with shape (batch, 2**k, 2**k) is returned.
+    """
+    spec = gate_spec(name)
+    if len(params) != spec.num_params:
+        raise ValueError(
+            f"Gate {name} takes {spec.num_params} parameter(s), {len(params)} given."
+        )
+    if any(np.ndim(param) for param in params):
+        params = np.broadcast_arrays(*[np.asarray(param, dtype=float) for param in params])
+        return np.stack([spec.matrix(*values) for values in zip(*params)])
+    return spec.matrix(*params)
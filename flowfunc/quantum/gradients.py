@@ -0,0 +1,222 @@
+"""
+Gradients
+---------
+Gradients of expectation values with respect to the parameters of the gates,
+for variational circuits.
+
+The gradients are computed with the parameter-shift rule: the derivative
+with respect to the angle of a rotation is a combination of the expectation
+values of the circuit with this angle shifted by fixed amounts. For P
+parameters this takes 2 * P circuits (4 for the rotations with controls),
+which only differ by the value of one parameter. They are all simulated at
+once as a batch of states, where the shifted parameter of each gate is an
+array with one value per state of the batch, instead of simulating 2 * P
+circuits one after the other.
+
+The optimizers repeat the gradient steps in a loop, so a whole optimization
+runs in one node.
+"""
+from __future__ import annotations
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils import logger
+from .circuit import Circuit, Operation
+from .fusion import fuse_operations
+from .state import check_pauli
+from .statevector import StateVector
+
+# Memory used by the two buffers of a batch of shifted circuits
+GRADIENT_MEMORY = 256 * 2**20
+
+# Parameters which are the angle of a rotation exp(-i theta / 2 G) with
+# G**2 = 1, the others are phases exp(i phi |1><1|)
+_ROTATIONS = {"rx": (0,), "ry": (0,), "rz": (0,), "rxx": (0,), "ryy": (0,), "rzz": (0,), "u": (0,)}
+
+# (shift, coefficient) of the parameter-shift rules. With controls, the
+# generator of a rotation has the eigenvalues 0 and +-1/2, which needs four
+# shifted circuits instead of two.
+_TWO_TERMS = ((math.pi / 2, 0.5), (-math.pi / 2, -0.5))
+_D_PLUS = (math.sqrt(2) + 1) / (4 * math.sqrt(2))
+_D_MINUS = (math.sqrt(2) - 1) / (4 * math.sqrt(2))
+_FOUR_TERMS = (
+    (math.pi / 2, _D_PLUS),
+    (-math.pi / 2, -_D_PLUS),
+    (3 * math.pi / 2, -_D_MINUS),
+    (-3 * math.pi / 2, _D_MINUS),
+)
+
+Observable = List[Tuple[float, str]]
+
+_TERM = re.compile(r"^([+-]?)\s*(?:([0-9.eE+-]+)\s*\*?\s*)?([IXYZixyz]+)$")
+
+
+def parse_observable(observable: str, num_qubits: int) -> Observable:
+    """Sum of Pauli strings like "0.5 * ZZ + XI - 2 IZ"
+
+    Returns a list of (coefficient, Pauli string).
+    """
+    # Splitting before the signs which are not part of an exponent
+    terms = re.split(r"(?<![eE])(?=[+-])", observable.replace(" ", ""))
+    parsed = []
+    for term in terms:
+        if not term:
+            continue
+        match = _TERM.match(term)
+        if match is None:
+            raise ValueError(f"Invalid term of the observable: {term}")
+        sign, coefficient, pauli = match.groups()
+        value = float(coefficient) if coefficient else 1.0
+        parsed.append((-value if sign == "-" else value, check_pauli(pauli, num_qubits)))
+    if not parsed:
+        raise ValueError("The observable is empty.")
+    return parsed
+
+
+def shift_rule(op: Operation, index: int) -> Tuple[Tuple[float, float], ...]:
+    """Shifts and coefficients of the parameter-shift rule of a parameter"""
+    if op.controls and index in _ROTATIONS.get(op.name, ()):
+        return _FOUR_TERMS
+    return _TWO_TERMS
+
+
+def _expectation(state: StateVector, observable: Observable) -> np.ndarray:
+    values = 0
+    for coefficient, pauli in observable:
+        values = values + coefficient * np.atleast_1d(state.expectation(pauli))
+    return values
+
+
+def _shifted_operations(
+    ops: List[Operation],
+    offsets: List[int],
+    rows: List[Tuple[int, float]],
+    num_qubits: int,
+) -> List[Operation]:
+    """Operations of a batch of circuits, each with one parameter shifted
+
+    The parameters which are shifted in some of the rows become arrays with
+    one value per row, and the gates are fused into batched unitaries.
+    """
+    shifts: Dict[int, np.ndarray] = {}
+    for row, (param, shift) in enumerate(rows):
+        if param >= 0:
+            shifts.setdefault(param, np.zeros(len(rows)))[row] = shift
+    batched = []
+    for op, offset in zip(ops, offsets):
+        if any(offset + i in shifts for i in range(len(op.params))):
+            op = op._replace(
+                params=tuple(p + shifts.get(offset + i, 0.0) for i, p in enumerate(op.params))
+            )
+        batched.append(op)
+    return fuse_operations(batched, num_qubits, batched=True)
+
+
+def parameter_shift(
+    circuit: Circuit, observable: str, batch_size: Optional[int] = None
+) -> Tuple[float, np.ndarray]:
+    """Expectation value of an observable and its gradient
+
+    Parameters
+    ----------
+    circuit: Circuit
+        The circuit, simulated with the statevector backend
+    observable: str
+        Sum of Pauli strings like "0.5 * ZZ + XI"
+    batch_size: int
+        Optional. Number of circuits simulated at once. By default as many as
+        fit in `GRADIENT_MEMORY`.
+
+    Returns
+    -------
+    value: float
+        The expectation value
+    gradient: np.ndarray
+        The derivatives with respect to `circuit.parameters`
+    """
+    if circuit.backend != "statevector":
+        raise ValueError("Gradients are only supported by the statevector backend.")
+    terms = parse_observable(observable, circuit.num_qubits)
+    ops = list(circuit.ops)
+    offsets = list(np.cumsum([0] + [len(op.params) for op in ops[:-1]]))
+    # The first row is the circuit itself, then one row per shifted circuit
+    rows: List[Tuple[int, float]] = [(-1, 0.0)]
+    coefficients = [0.0]
+    for op, offset in zip(ops, offsets):
+        for i in range(len(op.params)):
+            for shift, coefficient in shift_rule(op, i):
+                rows.append((offset + i, shift))
+                coefficients.append(coefficient)
+    if batch_size is None:
+        per_state = 2 * 2**circuit.num_qubits * circuit.dtype.itemsize
+        batch_size = max(1, GRADIENT_MEMORY // per_state)
+    values = []
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start : start + batch_size]
+        state = StateVector(circuit.num_qubits, circuit.dtype, len(chunk))
+        for op in _shifted_operations(ops, offsets, chunk, circuit.num_qubits):
+            state.apply(op)
+        values.append(_expectation(state, terms))
+    values = np.concatenate(values)
+    gradient = np.zeros(len(circuit.parameters))
+    np.add.at(gradient, [param for param, _ in rows[1:]], values[1:] * coefficients[1:])
+    return float(values[0]), gradient
+
+
+def minimize(
+    circuit: Circuit,
+    observable: str,
+    steps: int = 100,
+    learning_rate: float = 0.1,
+    method: str = "adam",
+    tolerance: float = 0.0,
+) -> Tuple[Circuit, List[float]]:
+    """Minimize the expectation value of an observable over the parameters
+
+    Parameters
+    ----------
+    circuit: Circuit
+        The circuit, whose parameters are the starting point
+    observable: str
+        Sum of Pauli strings like "0.5 * ZZ + XI"
+    steps: int
+        Maximum number of gradient steps
+    learning_rate: float
+        Size of the steps
+    method: str
+        "adam" or "gradient_descent"
+    tolerance: float
+        Stop when the norm of the gradient is below it
+
+    Returns
+    -------
+    circuit: Circuit
+        The circuit with the optimized parameters
+    history: List[float]
+        The expectation value before each step
+    """
+    if method not in ("adam", "gradient_descent"):
+        raise ValueError(f"Unknown optimization method: {method}")
+    params = circuit.parameters
+    m = np.zeros_like(params)
+    v = np.zeros_like(params)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    history = []
+    for step in range(1, steps + 1):
+        value, gradient = parameter_shift(circuit.with_parameters(params), observable)
+        history.append(value)
+        if np.linalg.norm(gradient) <= tolerance:
+            break
+        if method == "adam":
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient**2
+            m_hat = m / (1 - beta1**step)
+            v_hat = v / (1 - beta2**step)
+            params = params - learning_rate * m_hat / (np.sqrt(v_hat) + epsilon)
+        else:
+            params = params - learning_rate * gradient
+    logger.debug(f"Minimized {observable} in {len(history)} step(s): {history[-1]}")
+    return circuit.with_parameters(params), history
@@ -0,0 +1,148 @@
+"""
+Measurement
+-----------
+Sampling of measurement outcomes from the probabilities of a state.
+
+All the shots are drawn at once from the probability vector, so measuring a
+state 10000 times costs one vectorized call instead of 10000 runs of a flow.
+The outcomes are returned as count histograms (multinomial sampling) or as
+arrays of bits (one row per shot). Pass a seed or a `numpy.random.Generator`
+to get reproducible results.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .state import QuantumState
+
+Seed = Union[None, int, np.random.Generator]
+
+# Counts are drawn from a multinomial when there are at least as many shots
+# as outcomes, and for at most this number of measured qubits
+MAX_MULTINOMIAL_BITS = 20
+
+
+def make_rng(seed: Seed = None) -> np.random.Generator:
+    """Random generator from a seed (or a generator, which is returned as is)"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def parse_qubits(qubits: Union[str, Sequence[int], None]) -> Optional[List[int]]:
+    """Qubits given as a list or as a comma separated string like "0, 2"
+
+    None or an empty string means all the qubits.
+    """
+    if qubits is None:
+        return None
+    if isinstance(qubits, str):
+        qubits = [q for q in qubits.replace(" ", "").split(",") if q]
+        if not qubits:
+            return None
+    return [int(q) for q in qubits]
+
+
+def _normalized(probabilities: np.ndarray) -> np.ndarray:
+    # The probabilities of a complex64 state don't sum to exactly 1
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    return probabilities / probabilities.sum(axis=-1, keepdims=True)
+
+
+def sample_counts(probabilities: np.ndarray, shots: int, seed: Seed = None) -> np.ndarray:
+    """Number of times each outcome is measured in a number of shots
+
+    Parameters
+    ----------
+    probabilities: np.ndarray
+        Probabilities of the outcomes, with optional leading batch axes
+    shots: int
+        Number of shots (per state of the batch)
+    seed: Seed
+        Optional. Seed or random generator
+
+    Returns
+    -------
+    counts: np.ndarray
+        Integer array with the same shape as the probabilities
+    """
+    return make_rng(seed).multinomial(shots, _normalized(probabilities))
+
+
+def sample_outcomes(probabilities: np.ndarray, shots: int, seed: Seed = None) -> np.ndarray:
+    """Outcomes (the indices of the basis states) of a number of shots
+
+    Returns an integer array of the shape (..., shots), with the leading batch
+    axes of the probabilities.
+    """
+    probabilities = _normalized(probabilities)
+    batch = probabilities.shape[:-1]
+    size = probabilities.shape[-1]
+    cdf = np.cumsum(probabilities.reshape(-1, size), axis=-1)
+    cdf[:, -1] = 1
+    # Sampling the inverse of the cumulative distributions of all the states
+    # of the batch at once by offsetting each of them by its row number
+    rows = np.arange(len(cdf))[:, None]
+    uniform = make_rng(seed).random((len(cdf), shots))
+    outcomes = np.searchsorted((cdf + rows).ravel(), (uniform + rows).ravel(), side="right")
+    outcomes = np.minimum(outcomes.reshape(len(cdf), shots) - rows * size, size - 1)
+    return outcomes.reshape(batch + (shots,))
+
+
+def outcome_bits(outcomes: np.ndarray, num_bits: int) -> np.ndarray:
+    """Bits of the outcomes as a uint8 array of the shape (..., num_bits)
+
+    The first bit is the first measured qubit.
+    """
+    shifts = np.arange(num_bits - 1, -1, -1)
+    return ((outcomes[..., None] >> shifts) & 1).astype(np.uint8)
+
+
+def counts_dict(counts: np.ndarray) -> Dict[str, int]:
+    """Count histogram as a dict of bitstrings, without the zero counts"""
+    num_bits = max(len(counts) - 1, 1).bit_length()
+    return {format(int(i), f"0{num_bits}b"): int(counts[i]) for i in counts.nonzero()[0]}
+
+
+def bits_counts(bits: np.ndarray) -> Dict[str, int]:
+    """Count histogram of the rows of a (shots, num_bits) bit array"""
+    rows, counts = np.unique(bits, axis=0, return_counts=True)
+    return {(row + ord("0")).tobytes().decode(): int(c) for row, c in zip(rows, counts)}
+
+
+def measure_counts(
+    state: QuantumState,
+    shots: int,
+    qubits: Optional[Sequence[int]] = None,
+    seed: Seed = None,
+) -> Union[Dict[str, int], List[Dict[str, int]]]:
+    """Count histogram of measuring (some of) the qubits of a state
+
+    A list with one histogram per state is returned for a batch of states.
+    """
+    num_bits = state.num_qubits if qubits is None else len(qubits)
+    if num_bits <= MAX_MULTINOMIAL_BITS and shots >= 2**num_bits:
+        counts = sample_counts(state.probabilities(qubits), shots, seed)
+        if counts.ndim == 1:
+            return counts_dict(counts)
+        return [counts_dict(c) for c in counts]
+    # With fewer shots than outcomes it's faster to count the sampled outcomes
+    bits = state.sample_bits(shots, qubits, seed)
+    if bits.ndim == 2:
+        return bits_counts(bits)
+    return [bits_counts(b) for b in bits]
+
+
+def measure_bits(
+    state: QuantumState,
+    shots: int,
+    qubits: Optional[Sequence[int]] = None,
+    seed: Seed = None,
+) -> np.ndarray:
+    """Measured bits of (some of) the qubits of a state
+
+    Returns a uint8 array of the shape (shots, num_bits), or
+    (batch, shots, num_bits) for a batch of states.
+    """
+    return state.sample_bits(shots, qubits, seed)
@@ -0,0 +1,290 @@
+"""
+Matrix product states
+---------------------
+Simulation of circuits with matrix product states (MPS).
+
+The state of n qubits is a chain of n tensors of the shape
+(left bond, 2, right bond). The memory grows linearly with the number of
+qubits and quadratically with the bond dimension, which grows with the
+entanglement of the state. Shallow circuits with little entanglement can be
+simulated for far more qubits than a dense statevector can hold.
+
+The chain is kept in mixed canonical form: the tensors left of the center
+are left orthonormal and the ones right of it are right orthonormal. A gate
+on k neighbouring qubits moves the center to its first qubit, contracts the
+k tensors, applies the gate and splits the result with SVDs, keeping at most
+`max_bond` singular values and discarding the smallest ones as long as their
+total weight stays below `cutoff`. Gates on qubits which are not neighbours
+are applied after moving the qubits next to each other with swaps.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .circuit import Circuit, Operation
+from .fusion import operation_matrix
+from .gates import gate_matrix
+from .measurement import Seed, make_rng
+from .state import QuantumState, check_pauli
+from .statevector import expand_matrix
+
+_SWAP = gate_matrix("swap")
+_PAULI = {
+    "X": gate_matrix("x"),
+    "Y": gate_matrix("y"),
+    "Z": gate_matrix("z"),
+}
+
+
+class MPSState(QuantumState):
+    """Matrix product state of a number of qubits, starting in |0...0>
+
+    Attributes
+    ----------
+    num_qubits: int
+        Number of qubits
+    max_bond: int
+        Maximum bond dimension
+    cutoff: float
+        Maximum total weight of the singular values discarded by a gate
+    truncation_error: float
+        Total weight of the singular values discarded so far. The fidelity
+        with the exact state is roughly 1 - truncation_error.
+    tensors: List[np.ndarray]
+        The tensors of the qubits, of the shape (left bond, 2, right bond)
+    """
+
+    __slots__ = (
+        "num_qubits",
+        "batch",
+        "max_bond",
+        "cutoff",
+        "truncation_error",
+        "tensors",
+        "_center",
+    )
+
+    def __init__(
+        self,
+        num_qubits: int,
+        dtype: Union[str, np.dtype] = np.complex128,
+        max_bond: int = 64,
+        cutoff: float = 1e-10,
+    ):
+        self.num_qubits = num_qubits
+        self.batch = None
+        self.max_bond = max_bond
+        self.cutoff = cutoff
+        self.truncation_error = 0.0
+        zero = np.zeros((1, 2, 1), dtype=dtype)
+        zero[0, 0, 0] = 1
+        self.tensors = [zero.copy() for _ in range(num_qubits)]
+        self._center = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.tensors[0].dtype
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the tensors"""
+        return sum(t.nbytes for t in self.tensors)
+
+    @property
+    def bond_dimensions(self) -> List[int]:
+        """Dimensions of the bonds between the neighbouring qubits"""
+        return [t.shape[2] for t in self.tensors[:-1]]
+
+    def __repr__(self) -> str:
+        return (
+            f"MPSState({self.num_qubits} qubit(s), {self.dtype},"
+            f" max bond {max(self.bond_dimensions, default=1)})"
+        )
+
+    def _move_center(self, site: int):
+        self._center = _move_center(self.tensors, self._center, site)
+
+    def _truncate(self, s: np.ndarray) -> int:
+        """Number of singular values to keep"""
+        weights = s**2
+        total = weights.sum()
+        # Weight discarded when keeping the first i values
+        discarded = total - np.cumsum(weights)
+        keep = int(np.searchsorted(-discarded, -self.cutoff * total)) + 1
+        keep = max(1, min(keep, self.max_bond, len(s)))
+        self.truncation_error += float(discarded[keep - 1] / total) if total else 0.0
+        return keep
+
+    def _apply_sites(self, matrix: np.ndarray, site: int, k: int):
+        """Apply a gate on k neighbouring sites starting at `site`"""
+        tensors = self.tensors
+        self._move_center(site)
+        theta = tensors[site]
+        for i in range(1, k):
+            theta = np.tensordot(theta, tensors[site + i], axes=1)
+        left, right = theta.shape[0], theta.shape[-1]
+        theta = theta.reshape(left, 2**k, right)
+        theta = np.einsum("st,ltr->lsr", matrix.astype(self.dtype, copy=False), theta)
+        for i in range(k - 1):
+            rest = theta.size // (left * 2)
+            u, s, vh = np.linalg.svd(theta.reshape(left * 2, rest), full_matrices=False)
+            keep = self._truncate(s)
+            s = s[:keep] / np.linalg.norm(s[:keep])
+            tensors[site + i] = u[:, :keep].reshape(left, 2, keep)
+            theta = (s[:, None] * vh[:keep]).astype(self.dtype, copy=False)
+            left = keep
+        tensors[site + k - 1] = theta.reshape(left, 2, right)
+        self._center = site + k - 1
+
+    def apply_matrix(self, matrix: np.ndarray, qubits: Sequence[int]):
+        """Apply a gate on any qubits, given its matrix"""
+        matrix = np.asarray(matrix)
+        if matrix.ndim != 2:
+            raise ValueError("Matrix product states don't support batched gates.")
+        k = len(qubits)
+        if k == 1:
+            q = qubits[0]
+            self.tensors[q] = np.einsum(
+                "st,ltr->lsr", matrix.astype(self.dtype, copy=False), self.tensors[q]
+            )
+            return
+        # Moving the qubits next to the first one with swaps
+        order = sorted(qubits)
+        first = order[0]
+        swaps = []
+        for i, q in enumerate(order[1:], start=1):
+            for site in range(q - 1, first + i - 1, -1):
+                self._apply_sites(_SWAP, site, 2)
+                swaps.append(site)
+        self._apply_sites(expand_matrix(matrix, qubits, order), first, k)
+        for site in reversed(swaps):
+            self._apply_sites(_SWAP, site, 2)
+
+    def apply(self, op: Operation):
+        """Apply an operation of a circuit"""
+        if op.matrix is None and any(np.ndim(p) for p in op.params):
+            raise ValueError("Matrix product states don't support batched gates.")
+        self.apply_matrix(operation_matrix(op), tuple(op.controls) + tuple(op.qubits))
+
+    def _environment(
+        self, qubits: Sequence[int], operators: Optional[Dict[int, np.ndarray]] = None
+    ) -> np.ndarray:
+        """Contract the state with itself from the first to the last qubit
+
+        The physical index of the measured `qubits` is kept open (as the
+        diagonal of the density matrix), so the first axis of the result has
+        2**len(qubits) entries. The `operators` are applied on their qubits.
+        The contraction includes the center, so the state isn't modified.
+        """
+        operators = operators or {}
+        sites = set(qubits) | set(operators) | {self._center}
+        lo, hi = min(sites), max(sites)
+        bond = self.tensors[lo].shape[0]
+        env = np.eye(bond, dtype=self.dtype)[None]
+        for site in range(lo, hi + 1):
+            a = self.tensors[site]
+            b = a if site not in operators else np.einsum("st,ltr->lsr", operators[site], a)
+            if site in qubits:
+                env = np.einsum("oab,asc,bsd->oscd", env, a.conj(), b)
+                env = env.reshape(-1, env.shape[2], env.shape[3])
+            else:
+                env = np.einsum("oab,asc,bsd->ocd", env, a.conj(), b)
+        # The tensors right of the last site are right orthonormal
+        return np.einsum("obb->o", env)
+
+    def probabilities(self, qubits: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Probabilities of the basis states of (some of) the qubits
+
+        Only use it for a small number of qubits, since the result has 2**k
+        entries.
+        """
+        qubits = list(range(self.num_qubits)) if qubits is None else list(qubits)
+        probabilities = self._environment(sorted(qubits)).real
+        k = len(qubits)
+        if qubits != sorted(qubits):
+            order = sorted(qubits)
+            tensor = probabilities.reshape((2,) * k)
+            tensor = np.moveaxis(tensor, [order.index(q) for q in qubits], range(k))
+            probabilities = tensor.reshape(-1)
+        return np.maximum(probabilities, 0)
+
+    def expectation_z(self, qubits: Sequence[int]) -> float:
+        """Expectation value of the product of Z on the given qubits"""
+        return self.expectation(
+            "".join("Z" if q in qubits else "I" for q in range(self.num_qubits))
+        )
+
+    def expectation(self, pauli: str) -> float:
+        """Expectation value of a Pauli string like "XIZ" (one letter per qubit)"""
+        pauli = check_pauli(pauli, self.num_qubits)
+        operators = {q: _PAULI[p] for q, p in enumerate(pauli) if p != "I"}
+        if not operators:
+            return 1.0
+        return float(self._environment([], operators)[0].real)
+
+    def sample_bits(
+        self, shots: int, qubits: Optional[Sequence[int]] = None, seed: Seed = None
+    ) -> np.ndarray:
+        """Measured bits of a number of shots
+
+        All the shots are sampled together, one qubit after the other, from
+        the conditional probabilities given the bits of the previous qubits.
+        """
+        rng = make_rng(seed)
+        # With the center on the first qubit, the norm of the partial
+        # contraction of the first qubits gives the conditional probabilities.
+        # The center is moved on a copy, so the state isn't modified.
+        tensors = list(self.tensors)
+        _move_center(tensors, self._center, 0)
+        bits = np.empty((shots, self.num_qubits), dtype=np.uint8)
+        left = np.ones((shots, 1), dtype=self.dtype)
+        for site, tensor in enumerate(tensors):
+            branches = np.einsum("na,asb->nsb", left, tensor)
+            weights = np.einsum("nsb,nsb->ns", branches, branches.conj()).real
+            p1 = weights[:, 1] / weights.sum(axis=1)
+            outcome = (rng.random(shots) < p1).astype(np.uint8)
+            bits[:, site] = outcome
+            chosen = branches[np.arange(shots), outcome]
+            norms = np.sqrt(weights[np.arange(shots), outcome])
+            left = chosen / norms[:, None]
+        return bits if qubits is None else bits[:, list(qubits)]
+
+    def to_amplitudes(self) -> np.ndarray:
+        """The dense statevector. Only use it for a small number of qubits."""
+        theta = self.tensors[0]
+        for tensor in self.tensors[1:]:
+            theta = np.tensordot(theta, tensor, axes=1)
+        return theta.reshape(-1)
+
+
+def _move_center(tensors: List[np.ndarray], center: int, site: int) -> int:
+    """Move the center of a chain of tensors to a site with QR decompositions
+
+    The tensors are replaced in the list. Returns the new center.
+    """
+    while center < site:
+        left, _, right = tensors[center].shape
+        q, r = np.linalg.qr(tensors[center].reshape(left * 2, right))
+        tensors[center] = q.reshape(left, 2, -1)
+        tensors[center + 1] = np.tensordot(r, tensors[center + 1], axes=1)
+        center += 1
+    while center > site:
+        left, _, right = tensors[center].shape
+        q, r = np.linalg.qr(tensors[center].reshape(left, 2 * right).conj().T)
+        tensors[center] = q.conj().T.reshape(-1, 2, right)
+        tensors[center - 1] = np.tensordot(tensors[center - 1], r.conj().T, axes=1)
+        center -= 1
+    return center
+
+
+def simulate_mps(circuit: Circuit, state: Optional[MPSState] = None) -> MPSState:
+    """Simulate a circuit with a matrix product state
+
+    The maximum bond dimension and the cutoff are taken from the circuit.
+    """
+    if state is None:
+        state = MPSState(circuit.num_qubits, circuit.dtype, circuit.max_bond, circuit.cutoff)
+    for op in circuit.ops:
+        state.apply(op)
+    return state
@@ -0,0 +1,312 @@
+"""
+Quantum nodes
+-------------
+Nodes to build circuits and simulate them in a flow.
+
+A flow starts with a `quantum_circuit` node, the gate nodes are chained
+through their `circuit` ports and the circuit is then passed to `simulate`,
+whose state can be read out by the measurement nodes::
+
+    from flowfunc.config import Config
+    from flowfunc.quantum.nodes import quantum_nodes
+
+    config = Config.from_function_list(quantum_nodes)
+
+The gate nodes only add a gate to the (immutable) circuit, so they are cheap.
+All the simulation happens in the `simulate` node, with the backend chosen in
+the `quantum_circuit` node: a statevector (which first fuses the runs of gates
+into larger unitaries, see `flowfunc.quantum.fusion`) or a matrix product
+state for circuits with more qubits but little entanglement.
+
+The nodes which don't draw random numbers are pure, so a circuit which only
+depends on literal inputs is built and simulated once by a runner and reused
+in its later runs (see `flowfunc.planner`).
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from ..config import node_options
+from .backends import run_circuit
+from .circuit import Circuit
+from .gradients import minimize, parameter_shift
+from .measurement import bits_counts, measure_bits, measure_counts, parse_qubits
+from .noise import NoiseModel, noisy_expectation, noisy_measure_bits
+from .state import QuantumState
+
+CIRCUIT = "Quantum circuit"
+GATES = "Quantum gates"
+MEASUREMENT = "Quantum measurement"
+NOISE = "Quantum noise"
+VARIATIONAL = "Quantum variational"
+
+
+@node_options(category=CIRCUIT, pure=True)
+def quantum_circuit(
+    num_qubits: int = 2,
+    precision: str = "complex128",
+    backend: str = "statevector",
+    max_bond: int = 64,
+    cutoff: float = 1e-10,
+) -> Circuit:
+    """Creates an empty circuit with all the qubits in the |0> state. The backend (statevector or mps) is used to simulate it."""
+    return Circuit(num_qubits, precision, backend, max_bond, cutoff)
+
+
+@node_options(category=GATES, pure=True)
+def hadamard(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a Hadamard gate."""
+    return circuit.gate("h", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def pauli_x(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a Pauli X (NOT) gate."""
+    return circuit.gate("x", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def pauli_y(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a Pauli Y gate."""
+    return circuit.gate("y", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def pauli_z(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a Pauli Z gate."""
+    return circuit.gate("z", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def s_gate(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds an S (sqrt(Z)) gate."""
+    return circuit.gate("s", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def t_gate(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a T (fourth root of Z) gate."""
+    return circuit.gate("t", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def sqrt_x(circuit: Circuit, qubit: int = 0) -> Circuit:
+    """Adds a sqrt(X) gate."""
+    return circuit.gate("sx", [qubit])
+
+
+@node_options(category=GATES, pure=True)
+def rotation_x(circuit: Circuit, qubit: int = 0, theta: float = 0.0) -> Circuit:
+    """Adds a rotation around the X axis by the angle theta."""
+    return circuit.gate("rx", [qubit], [theta])
+
+
+@node_options(category=GATES, pure=True)
+def rotation_y(circuit: Circuit, qubit: int = 0, theta: float = 0.0) -> Circuit:
+    """Adds a rotation around the Y axis by the angle theta."""
+    return circuit.gate("ry", [qubit], [theta])
+
+
+@node_options(category=GATES, pure=True)
+def rotation_z(circuit: Circuit, qubit: int = 0, theta: float = 0.0) -> Circuit:
+    """Adds a rotation around the Z axis by the angle theta."""
+    return circuit.gate("rz", [qubit], [theta])
+
+
+@node_options(category=GATES, pure=True)
+def phase(circuit: Circuit, qubit: int = 0, phi: float = 0.0) -> Circuit:
+    """Adds a phase shift of phi to the |1> state."""
+    return circuit.gate("p", [qubit], [phi])
+
+
+@node_options(category=GATES, pure=True)
+def u3(
+    circuit: Circuit, qubit: int = 0, theta: float = 0.0, phi: float = 0.0, lam: float = 0.0
+) -> Circuit:
+    """Adds a general single qubit rotation U(theta, phi, lambda)."""
+    return circuit.gate("u", [qubit], [theta, phi, lam])
+
+
+@node_options(category=GATES, pure=True)
+def cnot(circuit: Circuit, control: int = 0, target: int = 1) -> Circuit:
+    """Adds a controlled NOT gate."""
+    return circuit.gate("x", [target], controls=[control])
+
+
+@node_options(category=GATES, pure=True)
+def controlled_z(circuit: Circuit, control: int = 0, target: int = 1) -> Circuit:
+    """Adds a controlled Z gate."""
+    return circuit.gate("z", [target], controls=[control])
+
+
+@node_options(category=GATES, pure=True)
+def controlled_phase(
+    circuit: Circuit, control: int = 0, target: int = 1, phi: float = 0.0
+) -> Circuit:
+    """Adds a controlled phase shift of phi."""
+    return circuit.gate("p", [target], [phi], controls=[control])
+
+
+@node_options(category=GATES, pure=True)
+def swap(circuit: Circuit, qubit1: int = 0, qubit2: int = 1) -> Circuit:
+    """Swaps two qubits."""
+    return circuit.gate("swap", [qubit1, qubit2])
+
+
+@node_options(category=GATES, pure=True)
+def rzz(circuit: Circuit, qubit1: int = 0, qubit2: int = 1, theta: float = 0.0) -> Circuit:
+    """Adds a ZZ interaction exp(-i theta/2 Z Z) between two qubits."""
+    return circuit.gate("rzz", [qubit1, qubit2], [theta])
+
+
+@node_options(category=GATES, pure=True)
+def toffoli(
+    circuit: Circuit, control1: int = 0, control2: int = 1, target: int = 2
+) -> Circuit:
+    """Adds a Toffoli (controlled controlled NOT) gate."""
+    return circuit.gate("x", [target], controls=[control1, control2])
+
+
+@node_options(category=MEASUREMENT, pure=True)
+def simulate_circuit(circuit: Circuit, fuse: bool = True) -> QuantumState:
+    """Simulates the circuit with its backend and outputs the final state."""
+    return run_circuit(circuit, fuse=fuse)
+
+
+@node_options(category=MEASUREMENT, pure=True)
+def probabilities(state: QuantumState, threshold: float = 1e-12) -> Dict[str, float]:
+    """Probabilities of the basis states (as bitstrings) above a threshold. Only for a few qubits."""
+    probs = state.probabilities()
+    n = state.num_qubits
+    return {
+        format(int(i), f"0{n}b"): float(probs[i])
+        for i in (probs > threshold).nonzero()[0]
+    }
+
+
+@node_options(category=MEASUREMENT, pure=True)
+def expectation_z(state: QuantumState, qubit: int = 0) -> float:
+    """Expectation value of Z on a qubit."""
+    return state.expectation_z([qubit])
+
+
+@node_options(category=MEASUREMENT, pure=True)
+def expectation_value(state: QuantumState, pauli: str = "Z") -> float:
+    """Expectation value of a Pauli string like "XZ", one letter per qubit."""
+    return state.expectation(pauli)
+
+
+@node_options(category=MEASUREMENT)
+def measure(
+    state: QuantumState, shots: int = 1024, qubits: str = "", seed: Optional[int] = None
+) -> Dict[str, int]:
+    """Measures the qubits (all, or a comma separated list) a number of times and counts the outcomes."""
+    return measure_counts(state, shots, parse_qubits(qubits), seed)
+
+
+@node_options(category=MEASUREMENT)
+def measure_shots(
+    state: QuantumState, shots: int = 1024, qubits: str = "", seed: Optional[int] = None
+) -> np.ndarray:
+    """Measures the qubits a number of times and outputs the bits, one row per shot."""
+    return measure_bits(state, shots, parse_qubits(qubits), seed)
+
+
+@node_options(category=NOISE, pure=True)
+def noise_model(
+    depolarizing: float = 0.0, amplitude_damping: float = 0.0, readout: float = 0.0
+) -> NoiseModel:
+    """Noise applied after each gate (depolarizing, amplitude damping) and on the measured bits (readout)."""
+    noise = NoiseModel(depolarizing, amplitude_damping, readout)
+    noise.check()
+    return noise
+
+
+@node_options(category=NOISE)
+def noisy_expectation_value(
+    circuit: Circuit,
+    noise: NoiseModel,
+    pauli: str = "Z",
+    trajectories: int = 1000,
+    seed: Optional[int] = None,
+    workers: int = 1,
+) -> Dict[str, float]:
+    """Expectation value of a Pauli string for a noisy circuit, averaged over trajectories, with its standard error."""
+    estimate = noisy_expectation(circuit, pauli, noise, trajectories, seed, workers)
+    return estimate._asdict()
+
+
+@node_options(category=NOISE)
+def noisy_measure(
+    circuit: Circuit,
+    noise: NoiseModel,
+    shots: int = 1024,
+    qubits: str = "",
+    seed: Optional[int] = None,
+    workers: int = 1,
+) -> Dict[str, int]:
+    """Measures a noisy circuit a number of times (one trajectory per shot) and counts the outcomes."""
+    return bits_counts(
+        noisy_measure_bits(circuit, noise, shots, parse_qubits(qubits), seed=seed, workers=workers)
+    )
+
+
+@node_options(category=VARIATIONAL, pure=True)
+def parameter_shift_gradient(circuit: Circuit, observable: str = "Z") -> np.ndarray:
+    """Gradient of the expectation value of an observable like "0.5 * ZZ + XI" with respect to the gate parameters, with all the shifted circuits simulated as one batch."""
+    return parameter_shift(circuit, observable)[1]
+
+
+@node_options(category=VARIATIONAL, pure=True)
+def gradient_descent_step(
+    circuit: Circuit, gradient: np.ndarray, learning_rate: float = 0.1
+) -> Circuit:
+    """Moves the gate parameters of the circuit against the gradient."""
+    return circuit.with_parameters(circuit.parameters - learning_rate * gradient)
+
+
+@node_options(category=VARIATIONAL, pure=True)
+def minimize_expectation(
+    circuit: Circuit,
+    observable: str = "Z",
+    steps: int = 100,
+    learning_rate: float = 0.1,
+    method: str = "adam",
+) -> Circuit:
+    """Optimizes the gate parameters to minimize the expectation value of an observable (adam or gradient_descent), running all the steps in this node."""
+    return minimize(circuit, observable, steps, learning_rate, method)[0]
+
+
+quantum_nodes = [
+    quantum_circuit,
+    hadamard,
+    pauli_x,
+    pauli_y,
+    pauli_z,
+    s_gate,
+    t_gate,
+    sqrt_x,
+    rotation_x,
+    rotation_y,
+    rotation_z,
+    phase,
+    u3,
+    cnot,
+    controlled_z,
+    controlled_phase,
+    swap,
+    rzz,
+    toffoli,
+    simulate_circuit,
+    probabilities,
+    expectation_z,
+    expectation_value,
+    measure,
+    measure_shots,
+    noise_model,
+    noisy_expectation_value,
+    noisy_measure,
+    parameter_shift_gradient,
+    gradient_descent_step,
+    minimize_expectation,
+]
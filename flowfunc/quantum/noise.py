@@ -0,0 +1,252 @@
+"""
+Noise
+-----
+Simulation of noisy circuits with Monte-Carlo quantum trajectories.
+
+A density matrix needs 4**n entries, so instead each trajectory is a pure
+state on which the noise is applied at random: after every gate, each of
+its qubits is hit by a random Pauli error (depolarizing noise) or decays
+from |1> to |0> with a probability depending on the state (amplitude
+damping). Averaging a quantity over many trajectories gives the value of the
+noisy circuit, with an error bar which shrinks with the square root of the
+number of trajectories. Readout noise flips the measured bits.
+
+The trajectories are simulated in batches along the batch axis of a
+StateVector, sized to stay within a memory budget. The batches can be spread
+across a process pool. Each batch has its own random generator derived from
+the seed, so the results only depend on the seed and not on the number of
+processes.
+"""
+from __future__ import annotations
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .circuit import Circuit
+from .gates import gate_matrix
+from .measurement import make_rng
+from .state import check_pauli
+from .statevector import StateVector
+
+# Memory used by the two buffers of a batch of trajectories
+TRAJECTORY_MEMORY = 256 * 2**20
+
+_PAULIS = np.stack([gate_matrix(name) for name in ("id", "x", "y", "z")])
+
+
+class NoiseModel(NamedTuple):
+    """Noise applied to a circuit
+
+    Attributes
+    ----------
+    depolarizing: float
+        Probability of an error after each gate on each of its qubits. The
+        error is an X, Y or Z with equal probabilities.
+    amplitude_damping: float
+        Probability of |1> decaying to |0> after each gate on each of its
+        qubits
+    readout: float
+        Probability of flipping each measured bit
+    """
+
+    depolarizing: float = 0.0
+    amplitude_damping: float = 0.0
+    readout: float = 0.0
+
+    def check(self):
+        for name, value in self._asdict().items():
+            if not 0 <= value <= 1:
+                raise ValueError(f"The {name} probability should be between 0 and 1.")
+
+
+class Estimate(NamedTuple):
+    """Mean of a quantity over trajectories and its standard error"""
+
+    mean: float
+    error: float
+    trajectories: int
+
+
+def _apply_rows(state: StateVector, rows: np.ndarray, matrices: np.ndarray, qubit: int):
+    """Apply a matrix per trajectory, only on some of the trajectories"""
+    sub = StateVector(state.num_qubits, state.dtype, len(rows), state.data[rows])
+    sub.apply_single(matrices, qubit)
+    state.data[rows] = sub.data
+
+
+def _depolarize(state: StateVector, qubit: int, p: float, rng: np.random.Generator):
+    batch = state.data.shape[0]
+    rows = (rng.random(batch) < p).nonzero()[0]
+    if len(rows):
+        _apply_rows(state, rows, _PAULIS[rng.integers(1, 4, len(rows))], qubit)
+
+
+def _damp(state: StateVector, qubit: int, gamma: float, rng: np.random.Generator):
+    batch = state.data.shape[0]
+    excited = state.data.reshape(batch, 2**qubit, 2, -1)[:, :, 1]
+    # Probability of the decay in each trajectory
+    p1 = gamma * np.einsum("bij,bij->b", excited.conj(), excited).real
+    jumps = rng.random(batch) < p1
+    # The trajectories which don't decay get the (diagonal) Kraus operator
+    # diag(1, sqrt(1 - gamma)), normalized
+    norms = np.sqrt(np.maximum(1 - p1, 1e-300))
+    diagonal = np.empty((batch, 2))
+    diagonal[:, 0] = np.where(jumps, 1, 1 / norms)
+    diagonal[:, 1] = np.where(jumps, 1, math.sqrt(1 - gamma) / norms)
+    state.apply_diagonal(diagonal, [qubit])
+    rows = jumps.nonzero()[0]
+    if len(rows):
+        kraus = np.zeros((len(rows), 2, 2))
+        kraus[:, 0, 1] = np.sqrt(gamma / p1[rows])
+        _apply_rows(state, rows, kraus, qubit)
+
+
+def simulate_trajectories(
+    circuit: Circuit, noise: NoiseModel, trajectories: int, seed=None
+) -> StateVector:
+    """Simulate a batch of noisy trajectories of a circuit
+
+    Returns a StateVector with one trajectory per state of the batch.
+    """
+    if circuit.backend != "statevector":
+        raise ValueError("Noise is only supported by the statevector backend.")
+    rng = make_rng(seed)
+    state = StateVector(circuit.num_qubits, circuit.dtype, trajectories)
+    for op in circuit.ops:
+        state.apply(op)
+        for q in tuple(op.controls) + tuple(op.qubits):
+            if noise.depolarizing:
+                _depolarize(state, q, noise.depolarizing, rng)
+            if noise.amplitude_damping:
+                _damp(state, q, noise.amplitude_damping, rng)
+    return state
+
+
+def batch_sizes(circuit: Circuit, trajectories: int, batch_size: Optional[int] = None) -> List[int]:
+    """Split trajectories into batches which fit in the memory budget"""
+    if batch_size is None:
+        per_state = 2 * 2**circuit.num_qubits * circuit.dtype.itemsize
+        batch_size = max(1, TRAJECTORY_MEMORY // per_state)
+    batch_size = min(batch_size, trajectories)
+    sizes = [batch_size] * (trajectories // batch_size)
+    if trajectories % batch_size:
+        sizes.append(trajectories % batch_size)
+    return sizes
+
+
+def _map_batches(
+    func: Callable,
+    circuit: Circuit,
+    noise: NoiseModel,
+    sizes: List[int],
+    seed: Optional[int],
+    workers: Optional[int],
+    *args,
+) -> list:
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    calls = [(circuit, noise, size, s) + args for size, s in zip(sizes, seeds)]
+    if workers is None or workers <= 1 or len(sizes) == 1:
+        return [func(*call) for call in calls]
+    with ProcessPoolExecutor(max_workers=min(workers, len(sizes))) as pool:
+        return list(pool.map(func, *zip(*calls)))
+
+
+def _expectations(
+    circuit: Circuit, noise: NoiseModel, size: int, seed, pauli: str
+) -> np.ndarray:
+    state = simulate_trajectories(circuit, noise, size, seed)
+    return np.atleast_1d(state.expectation(pauli))
+
+
+def _shots(
+    circuit: Circuit,
+    noise: NoiseModel,
+    size: int,
+    seed,
+    shots: int,
+    qubits: Optional[Sequence[int]],
+) -> np.ndarray:
+    rng = make_rng(seed)
+    state = simulate_trajectories(circuit, noise, size, rng)
+    bits = state.sample_bits(shots, qubits, rng)
+    bits = bits.reshape(-1, bits.shape[-1])
+    if noise.readout:
+        bits ^= (rng.random(bits.shape) < noise.readout).astype(np.uint8)
+    return bits
+
+
+def noisy_expectation(
+    circuit: Circuit,
+    pauli: str,
+    noise: NoiseModel,
+    trajectories: int = 1000,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> Estimate:
+    """Expectation value of a Pauli string for a noisy circuit
+
+    Parameters
+    ----------
+    circuit: Circuit
+        The circuit
+    pauli: str
+        Pauli string like "XIZ", one letter per qubit
+    noise: NoiseModel
+        The noise
+    trajectories: int
+        Number of trajectories to average over
+    seed: int
+        Optional. Seed of the random generators
+    workers: int
+        Optional. Number of processes to spread the batches of trajectories
+        over. By default they are simulated in this process.
+    batch_size: int
+        Optional. Number of trajectories simulated at once. By default as
+        many as fit in `TRAJECTORY_MEMORY`.
+
+    Returns
+    -------
+    estimate: Estimate
+        The mean over the trajectories and its standard error
+    """
+    noise.check()
+    pauli = check_pauli(pauli, circuit.num_qubits)
+    sizes = batch_sizes(circuit, trajectories, batch_size)
+    values = np.concatenate(
+        _map_batches(_expectations, circuit, noise, sizes, seed, workers, pauli)
+    )
+    # The readout errors flip the sign of each measured Pauli with the
+    # probability of the readout noise
+    values = values * (1 - 2 * noise.readout) ** (len(pauli) - pauli.count("I"))
+    error = values.std(ddof=1) / math.sqrt(len(values)) if len(values) > 1 else 0.0
+    return Estimate(float(values.mean()), float(error), len(values))
+
+
+def noisy_measure_bits(
+    circuit: Circuit,
+    noise: NoiseModel,
+    shots: int,
+    qubits: Optional[Sequence[int]] = None,
+    trajectories: Optional[int] = None,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> np.ndarray:
+    """Measured bits of a noisy circuit
+
+    Each trajectory is measured `shots / trajectories` times, by default
+    once. Returns a uint8 array of the shape (shots, num_bits).
+    """
+    noise.check()
+    trajectories = min(trajectories or shots, shots)
+    shots_per_trajectory = math.ceil(shots / trajectories)
+    sizes = batch_sizes(circuit, trajectories, batch_size)
+    bits = np.concatenate(
+        _map_batches(
+            _shots, circuit, noise, sizes, seed, workers, shots_per_trajectory, qubits
+        )
+    )
+    return bits[:shots]
@@ -0,0 +1,63 @@
+"""
+Quantum state
+-------------
+Interface of the states produced by the simulators, which is used by the
+readout and measurement nodes.
+"""
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+
+class QuantumState(ABC):
+    """A simulated quantum state (or a batch of states)
+
+    Attributes
+    ----------
+    num_qubits: int
+        Number of qubits
+    batch: Optional[int]
+        Number of states in the batch. None if it's a single state.
+    """
+
+    __slots__ = ()
+
+    num_qubits: int
+    batch: Optional[int]
+
+    @abstractmethod
+    def probabilities(self, qubits: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Probabilities of the basis states of (some of) the qubits"""
+
+    @abstractmethod
+    def expectation_z(self, qubits: Sequence[int]) -> Union[float, np.ndarray]:
+        """Expectation value of the product of Z on the given qubits"""
+
+    @abstractmethod
+    def expectation(self, pauli: str) -> Union[float, np.ndarray]:
+        """Expectation value of a Pauli string like "XIZ" (one letter per qubit)"""
+
+    @abstractmethod
+    def sample_bits(
+        self,
+        shots: int,
+        qubits: Optional[Sequence[int]] = None,
+        seed: Union[None, int, np.random.Generator] = None,
+    ) -> np.ndarray:
+        """Measured bits of a number of shots
+
+        Returns a uint8 array of the shape (shots, num_bits), or
+        (batch, shots, num_bits) for a batch of states.
+        """
+
+
+def check_pauli(pauli: str, num_qubits: int) -> str:
+    """Upper case Pauli string, checked to have one of I, X, Y or Z per qubit"""
+    pauli = pauli.upper()
+    if len(pauli) != num_qubits or set(pauli) - set("IXYZ"):
+        raise ValueError(
+            f"The Pauli string should have one of I, X, Y or Z per qubit: {pauli}"
+        )
+    return pauli
@@ -0,0 +1,417 @@
+"""
+Statevector simulator
+---------------------
+Dense statevector simulation of circuits with NumPy.
+
+The amplitudes are stored in a flat buffer which is viewed as a tensor with
+one axis of size 2 per qubit, so a gate is applied by contracting its small
+matrix with the axes of its qubits instead of building a 2**n x 2**n matrix.
+All the operations work in place on two buffers which are allocated once:
+
+- Diagonal gates (Z, S, T, RZ, phase, RZZ, ...) scale the amplitudes in place.
+- Gates on a few neighbouring qubits are applied with one matmul from the
+  state buffer into the scratch buffer, after which the two buffers are
+  swapped. The matrix of the gate is expanded to the window of qubits
+  between its first and last qubit. When the window is at the end of the
+  qubits (where a matmul from the left would be a huge number of tiny
+  products), the window is extended to the last qubit and the amplitudes
+  are multiplied from the right instead.
+- Controlled gates only touch the sub tensor where all the controls are 1.
+  For a single target the two halves of the sub tensor are updated in place.
+- Gates on qubits which are far apart are applied with a matmul after
+  moving their axes to the end, and controlled gates on more than one
+  target qubit are contracted with einsum.
+
+A state can hold a batch of states along an extra leading axis, for example
+to simulate many noise trajectories or parameter values at once. A gate can
+then have a different matrix for each state of the batch.
+"""
+from __future__ import annotations
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from .circuit import Circuit, Operation
+from .gates import gate_matrix, gate_spec
+from .measurement import Seed, outcome_bits, sample_outcomes
+from .state import QuantumState, check_pauli
+
+# Maximum number of qubits in the window of a gate applied with a matmul
+MAX_WINDOW = 4
+# Maximum number of qubits in a window which is extended to the last qubit
+MAX_LOW_WINDOW = 6
+# Below this number of amplitudes after the window, a matmul from the left is
+# too slow and the window is extended to the last qubit instead
+MATMUL_MIN_INNER = 16
+
+
+class StateVector(QuantumState):
+    """Amplitudes of a (batch of) quantum state(s)
+
+    Attributes
+    ----------
+    num_qubits: int
+        Number of qubits
+    batch: Optional[int]
+        Number of states in the batch. None if it's a single state.
+    data: np.ndarray
+        The amplitudes with the shape (batch, 2**num_qubits). The buffer is
+        swapped with the scratch buffer by some gates, so don't keep a
+        reference to it across gates.
+    """
+
+    __slots__ = ("num_qubits", "batch", "data", "_scratch")
+
+    def __init__(
+        self,
+        num_qubits: int,
+        dtype: Union[str, np.dtype] = np.complex128,
+        batch: Optional[int] = None,
+        data: Optional[np.ndarray] = None,
+    ):
+        self.num_qubits = num_qubits
+        self.batch = batch
+        shape = (batch or 1, 2**num_qubits)
+        if data is None:
+            data = np.zeros(shape, dtype=dtype)
+            data[:, 0] = 1
+        else:
+            data = np.ascontiguousarray(data, dtype=dtype).reshape(shape)
+        self.data = data
+        self._scratch: Optional[np.ndarray] = None
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.data.dtype
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the amplitudes and the scratch buffer"""
+        return self.data.nbytes + (0 if self._scratch is None else self._scratch.nbytes)
+
+    @property
+    def amplitudes(self) -> np.ndarray:
+        """The amplitudes, without the batch axis if it's a single state"""
+        return self.data[0] if self.batch is None else self.data
+
+    def __repr__(self) -> str:
+        batch = "" if self.batch is None else f", batch of {self.batch}"
+        return f"StateVector({self.num_qubits} qubit(s), {self.dtype}{batch})"
+
+    def copy(self) -> StateVector:
+        return StateVector(self.num_qubits, self.dtype, self.batch, self.data.copy())
+
+    def _tensor(self, data: Optional[np.ndarray] = None) -> np.ndarray:
+        data = self.data if data is None else data
+        return data.reshape((data.shape[0],) + (2,) * self.num_qubits)
+
+    def _scratch_buffer(self) -> np.ndarray:
+        if self._scratch is None:
+            self._scratch = np.empty_like(self.data)
+        return self._scratch
+
+    def _swap(self):
+        self.data, self._scratch = self._scratch, self.data
+
+    def _controlled(self, controls: Sequence[int], qubits: Sequence[int]):
+        """Sub tensor where all the controls are 1 and the new axes of the qubits"""
+        tensor = self._tensor()
+        if not controls:
+            return tensor, [q + 1 for q in qubits]
+        index = [slice(None)] * tensor.ndim
+        for c in controls:
+            index[c + 1] = 1
+        axes = [q + 1 - sum(1 for c in controls if c < q) for q in qubits]
+        return tensor[tuple(index)], axes
+
+    def _coefficient(self, matrix: np.ndarray, i: int, j: int, ndim: int):
+        if matrix.ndim == 2:
+            return matrix[i, j]
+        # One matrix per state of the batch
+        return matrix[:, i, j].reshape((-1,) + (1,) * (ndim - 1))
+
+    def _matrix(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.asarray(matrix)
+        if matrix.ndim == 3 and matrix.shape[0] != self.data.shape[0]:
+            raise ValueError(
+                f"Got {matrix.shape[0]} matrices for a batch of {self.data.shape[0]}."
+            )
+        return matrix.astype(self.dtype, copy=False)
+
+    def apply_diagonal(
+        self, diagonal: np.ndarray, qubits: Sequence[int], controls: Sequence[int] = ()
+    ):
+        """Apply a diagonal gate, given the diagonal of its matrix"""
+        diagonal = self._matrix(diagonal)
+        tensor, axes = self._controlled(controls, qubits)
+        k = len(qubits)
+        for i in range(2**k):
+            if diagonal.ndim == 1:
+                value = diagonal[i]
+                if value == 1:
+                    continue
+            else:
+                value = diagonal[:, i].reshape((-1,) + (1,) * (tensor.ndim - 1 - k))
+            index = [slice(None)] * tensor.ndim
+            for bit, axis in enumerate(axes):
+                index[axis] = (i >> (k - 1 - bit)) & 1
+            tensor[tuple(index)] *= value
+
+    def apply_single(self, matrix: np.ndarray, qubit: int, controls: Sequence[int] = ()):
+        """Apply a single qubit gate, optionally controlled by other qubits"""
+        matrix = self._matrix(matrix)
+        if not controls and self._apply_window(matrix, [qubit]):
+            return
+        tensor, (axis,) = self._controlled(controls, [qubit])
+        before = (slice(None),) * axis
+        a0, a1 = tensor[before + (0,)], tensor[before + (1,)]
+        scratch = self._scratch_buffer().reshape(-1)
+        size = a0.size
+        t0 = scratch[:size].reshape(a0.shape)
+        t1 = scratch[size : 2 * size].reshape(a0.shape)
+        u00, u01, u10, u11 = (
+            self._coefficient(matrix, i, j, a0.ndim) for i, j in ((0, 0), (0, 1), (1, 0), (1, 1))
+        )
+        np.copyto(t0, a0)
+        if matrix.ndim == 2 and u00 == 0 and u11 == 0:
+            # X and Y like gates only swap the halves (with a phase)
+            np.multiply(a1, u01, out=a0)
+            np.multiply(t0, u10, out=a1)
+            return
+        a0 *= u00
+        np.multiply(a1, u01, out=t1)
+        a0 += t1
+        a1 *= u11
+        np.multiply(t0, u10, out=t1)
+        a1 += t1
+
+    def _apply_window(self, matrix: np.ndarray, qubits: Sequence[int]) -> bool:
+        """Apply a gate with a matmul on the window of qubits around it
+
+        Returns False if the qubits are too far apart for a matmul.
+        """
+        n = self.num_qubits
+        window = window_for(qubits, n)
+        if window is None:
+            return False
+        lo = window[0]
+        matrix = expand_matrix(matrix, qubits, window)
+        batch = self.data.shape[0]
+        size = 2 ** len(window)
+        inner = 2 ** (n - window[-1] - 1)
+        scratch = self._scratch_buffer()
+        if inner == 1:
+            # Multiplying the rows of the last qubits from the right
+            shape = (batch, 2 ** (n - len(window)), size)
+            np.matmul(
+                self.data.reshape(shape),
+                np.swapaxes(matrix, -1, -2),
+                out=scratch.reshape(shape),
+            )
+        else:
+            shape = (batch, 2**lo, size, inner)
+            if matrix.ndim == 3:
+                matrix = matrix[:, None]
+            np.matmul(matrix, self.data.reshape(shape), out=scratch.reshape(shape))
+        self._swap()
+        return True
+
+    def _apply_transposed(self, matrix: np.ndarray, qubits: Sequence[int]):
+        """Apply a gate on qubits which are far apart with a matmul
+
+        The axes of the qubits are moved to the end (copying the amplitudes
+        into the scratch buffer), the matrix is applied from the right and
+        the axes are moved back.
+        """
+        tensor = self._tensor()
+        axes = [q + 1 for q in qubits]
+        order = [0] + [a for a in range(1, tensor.ndim) if a not in axes] + axes
+        shape = tuple(tensor.shape[a] for a in order)
+        moved = self._scratch_buffer().reshape(shape)
+        np.copyto(moved, tensor.transpose(order))
+        rows = (tensor.shape[0], -1, 2 ** len(qubits))
+        np.matmul(
+            moved.reshape(rows), np.swapaxes(matrix, -1, -2), out=self.data.reshape(rows)
+        )
+        np.copyto(
+            self._tensor(self._scratch), self.data.reshape(shape).transpose(np.argsort(order))
+        )
+        self._swap()
+
+    def apply_matrix(
+        self, matrix: np.ndarray, qubits: Sequence[int], controls: Sequence[int] = ()
+    ):
+        """Apply a gate on any number of qubits by contracting its matrix"""
+        k = len(qubits)
+        if k == 1:
+            return self.apply_single(matrix, qubits[0], controls)
+        matrix = self._matrix(matrix)
+        if not controls:
+            if not self._apply_window(matrix, qubits):
+                self._apply_transposed(matrix, qubits)
+            return
+        tensor, axes = self._controlled(controls, qubits)
+        batched = matrix.ndim == 3
+        gate = matrix.reshape(matrix.shape[:-2] + (2,) * (2 * k))
+        labels = list(range(tensor.ndim))
+        new_labels = [tensor.ndim + i for i in range(k)]
+        gate_labels = ([0] if batched else []) + new_labels + [labels[a] for a in axes]
+        out_labels = list(labels)
+        for axis, label in zip(axes, new_labels):
+            out_labels[axis] = label
+        scratch = self._scratch_buffer().reshape(-1)[: tensor.size].reshape(tensor.shape)
+        np.einsum(gate, gate_labels, tensor, labels, out_labels, out=scratch)
+        if controls:
+            np.copyto(tensor, scratch)
+        else:
+            self._swap()
+
+    def apply(self, op: Operation):
+        """Apply an operation of a circuit"""
+        if op.matrix is not None:
+            matrix = op.matrix
+            diagonal = matrix.ndim == 2 and not np.count_nonzero(
+                matrix - np.diag(np.diag(matrix))
+            )
+        else:
+            matrix = gate_matrix(op.name, op.params)
+            diagonal = gate_spec(op.name).diagonal
+        if diagonal:
+            if matrix.ndim == 3:
+                diag = np.diagonal(matrix, axis1=1, axis2=2)
+            else:
+                diag = np.diag(matrix)
+            self.apply_diagonal(diag, op.qubits, op.controls)
+        else:
+            self.apply_matrix(matrix, op.qubits, op.controls)
+
+    def probabilities(self, qubits: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Probabilities of the basis states
+
+        Parameters
+        ----------
+        qubits: Sequence[int]
+            Optional. Only return the marginal probabilities of these qubits
+
+        Returns
+        -------
+        probabilities: np.ndarray
+            Shape (2**k,) for a single state or (batch, 2**k) for a batch
+        """
+        probabilities = np.abs(self.data) ** 2
+        if qubits is not None:
+            tensor = self._tensor(probabilities)
+            others = tuple(q + 1 for q in range(self.num_qubits) if q not in qubits)
+            tensor = tensor.sum(axis=others)
+            # The remaining axes are in increasing qubit order
+            order = sorted(qubits)
+            tensor = np.moveaxis(
+                tensor, [order.index(q) + 1 for q in qubits], range(1, len(qubits) + 1)
+            )
+            probabilities = tensor.reshape(tensor.shape[0], -1)
+        return probabilities[0] if self.batch is None else probabilities
+
+    def expectation_z(self, qubits: Sequence[int]) -> Union[float, np.ndarray]:
+        """Expectation value of the product of Z on the given qubits"""
+        tensor = self._tensor(np.abs(self.data) ** 2)
+        for q in sorted(qubits, reverse=True):
+            tensor = tensor.take(0, axis=q + 1) - tensor.take(1, axis=q + 1)
+        values = tensor.reshape(tensor.shape[0], -1).sum(axis=1)
+        return float(values[0]) if self.batch is None else values
+
+    def expectation(self, pauli: str) -> Union[float, np.ndarray]:
+        """Expectation value of a Pauli string like "XIZ" (one letter per qubit)"""
+        pauli = check_pauli(pauli, self.num_qubits)
+        state = self
+        if set(pauli) & {"X", "Y"}:
+            # Rotating the X and Y terms to the Z basis on a copy of the state
+            state = self.copy()
+            h = gate_matrix("h")
+            sdg = gate_matrix("sdg")
+            for q, p in enumerate(pauli):
+                if p == "Y":
+                    state.apply_diagonal(np.diag(sdg), [q])
+                if p in "XY":
+                    state.apply_single(h, q)
+        return state.expectation_z([q for q, p in enumerate(pauli) if p != "I"])
+
+    def sample_bits(
+        self, shots: int, qubits: Optional[Sequence[int]] = None, seed: Seed = None
+    ) -> np.ndarray:
+        """Measured bits of a number of shots, drawn at once from the probabilities"""
+        num_bits = self.num_qubits if qubits is None else len(qubits)
+        outcomes = sample_outcomes(self.probabilities(qubits), shots, seed)
+        return outcome_bits(outcomes, num_bits)
+
+
+def window_for(qubits: Sequence[int], num_qubits: int) -> Optional[range]:
+    """Window of qubits on which a gate is applied with a single matmul
+
+    None if the qubits are too far apart.
+    """
+    lo, hi = min(qubits), max(qubits)
+    if hi - lo < MAX_WINDOW and 2 ** (num_qubits - hi - 1) >= MATMUL_MIN_INNER:
+        return range(lo, hi + 1)
+    if num_qubits - lo <= MAX_LOW_WINDOW:
+        return range(lo, num_qubits)
+    return None
+
+
+def expand_matrix(
+    matrix: np.ndarray, qubits: Sequence[int], window: Sequence[int]
+) -> np.ndarray:
+    """Matrix of a gate on some qubits as a gate on a window of qubits
+
+    The qubits of the gate have to be in the window. The gate acts as the
+    identity on the other qubits of the window. The first qubit of the
+    window is the most significant bit of the index in the new matrix.
+    """
+    k, w = len(qubits), len(window)
+    if list(qubits) == list(window):
+        return matrix
+    batch = matrix.shape[:-2]
+    others = [q for q in window if q not in qubits]
+    identity = np.eye(2 ** (w - k), dtype=matrix.dtype)
+    full = np.einsum("...ij,kl->...ikjl", matrix, identity)
+    # Axes of the rows and columns in the order qubits + others
+    full = full.reshape(batch + (2,) * (2 * w))
+    order = [list(qubits).index(q) if q in qubits else k + others.index(q) for q in window]
+    offset = len(batch)
+    axes = list(range(offset)) + [offset + i for i in order] + [offset + w + i for i in order]
+    return np.ascontiguousarray(full.transpose(axes)).reshape(batch + (2**w, 2**w))
+
+
+def simulate(
+    circuit: Circuit,
+    batch: Optional[int] = None,
+    state: Optional[StateVector] = None,
+    fuse: bool = True,
+) -> StateVector:
+    """Simulate a circuit from the all zero state
+
+    Parameters
+    ----------
+    circuit: Circuit
+        The circuit
+    batch: int
+        Optional. Simulate a batch of states. The parameters of the gates can
+        then be 1D arrays with one value per state.
+    state: StateVector
+        Optional. Apply the circuit to this state (in place) instead
+    fuse: bool
+        Fuse the gates into fewer, larger unitaries before applying them (see
+        `flowfunc.quantum.fusion`). The fused gates are cached by the
+        fingerprint of the circuit.
+    """
+    if state is None:
+        state = StateVector(circuit.num_qubits, circuit.dtype, batch)
+    if fuse:
+        # Imported here since the fusion uses the helpers of this module
+        from .fusion import fused_operations
+
+        ops = fused_operations(circuit)
+    else:
+        ops = circuit.ops
+    for op in ops:
+        state.apply(op)
+    return state
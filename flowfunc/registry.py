@@ -0,0 +1,178 @@
+"""
+Config registry
+---------------
+Named and versioned configs, so that distributed jobs can refer to a config
+by its name instead of carrying the whole config.
+
+The module which defines the nodes registers the config, and both the app
+and the workers import that module::
+
+    # nodes.py
+    config = register_config("quantum", Config.from_function_list(functions))
+
+    # app.py
+    runner = JobRunner(config, method="distributed", same_worker=True,
+                       default_queue=queue, config_name="quantum")
+
+Jobs then only carry the name and version of the config along with the flow.
+A worker which has a different version of the config registered rejects the
+job with a ConfigVersionError instead of running it with the wrong nodes.
+
+A config can also be registered with a factory which is only called the
+first time the config is requested, or when the configs are preloaded.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Optional
+
+from .config import Config
+from .exceptions import ConfigNotFoundError, ConfigVersionError
+from .serialization import function_path
+
+
+class _Registration:
+    __slots__ = ("version", "config", "factory")
+
+    def __init__(
+        self,
+        version: Optional[str],
+        config: Optional[Config],
+        factory: Optional[Callable[[], Config]],
+    ):
+        self.version = version
+        self.config = config
+        self.factory = factory
+
+
+_registry: Dict[str, _Registration] = {}
+_lock = threading.RLock()
+
+
+def _canonical_ports(ports) -> None:
+    for port in ports if isinstance(ports, list) else ():
+        if port.get("acceptTypes"):
+            port["acceptTypes"] = sorted(port["acceptTypes"])
+
+
+def config_version(config: Config) -> str:
+    """Version derived from the node types, ports and functions of a config"""
+    config_dict = config.dict()
+    # The version should be the same in every process, so nothing which
+    # depends on the hash seed (sets of port types) is hashed as it is
+    _canonical_ports(config_dict["portTypes"])
+    config_dict["portTypes"].sort(key=lambda port: port["type"])
+    for node in config_dict["nodeTypes"]:
+        _canonical_ports(node.get("inputs"))
+        _canonical_ports(node.get("outputs"))
+    config_dict["nodeTypes"].sort(key=lambda node: node["type"])
+    data = json.dumps(
+        {
+            "config": config_dict,
+            "methods": {node.type: function_path(node.method) for node in config.nodes},
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def register_config(
+    name: str,
+    config: Optional[Config] = None,
+    version: Optional[str] = None,
+    factory: Optional[Callable[[], Config]] = None,
+) -> Optional[Config]:
+    """Register a config under a name
+
+    Parameters
+    ----------
+    name: str
+        Name of the config
+    config: Config
+        The config. Either the config or a factory is required.
+    version: str
+        Optional. Version of the config. By default a hash of the node types,
+        ports and functions of the config is used.
+    factory: Callable[[], Config]
+        Optional. Function which creates the config when it's first requested
+
+    Returns
+    -------
+    config: Config
+        The registered config. None if it's created by a factory.
+    """
+    if (config is None) == (factory is None):
+        raise ValueError("Either a config or a factory is required.")
+    if config is not None and version is None:
+        version = config_version(config)
+    with _lock:
+        _registry[name] = _Registration(version, config, factory)
+    return config
+
+
+def unregister_config(name: str):
+    """Remove a config from the registry"""
+    with _lock:
+        _registry.pop(name, None)
+
+
+def _load(name: str) -> _Registration:
+    registration = _registry.get(name)
+    if registration is None:
+        raise ConfigNotFoundError(f"Config {name} is not registered.")
+    if registration.config is None:
+        with _lock:
+            if registration.config is None:
+                config = registration.factory()
+                if registration.version is None:
+                    registration.version = config_version(config)
+                registration.config = config
+    return registration
+
+
+def get_config(name: str, version: Optional[str] = None) -> Config:
+    """Get a registered config
+
+    Raises a ConfigNotFoundError if there is no config with the name and a
+    ConfigVersionError if a version is given and the registered config has a
+    different version.
+    """
+    registration = _load(name)
+    if version is not None and version != registration.version:
+        raise ConfigVersionError(
+            f"Config {name} has version {registration.version}, but version"
+            f" {version} was requested."
+        )
+    return registration.config
+
+
+def get_config_version(name: str) -> str:
+    """Version of a registered config"""
+    return _load(name).version
+
+
+def registered_configs() -> Dict[str, Optional[str]]:
+    """Names of the registered configs and their versions
+
+    The version of a config created by a factory without an explicit version
+    is None until the config is loaded.
+    """
+    with _lock:
+        return {name: reg.version for name, reg in _registry.items()}
+
+
+def is_registered(name: str) -> bool:
+    """Check if a config is registered under the name"""
+    return name in _registry
+
+
+def preload_configs() -> Dict[str, str]:
+    """Create all the configs registered with a factory
+
+    Returns the names of the configs and their versions.
+    """
+    with _lock:
+        names = list(_registry)
+    return {name: _load(name).version for name in names}
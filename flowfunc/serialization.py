@@ -0,0 +1,433 @@
+"""
+Serialization
+-------------
+Compact binary encoding of flows, graphs, run results and configs.
+
+The data is packed with msgpack (``pip install msgpack``) and optionally
+compressed with zlib. Every payload starts with a 5 byte header::
+
+    b"FFW" | format version (1 byte) | flags (1 byte, bit 0 = compressed)
+
+Node ids, node types and port names are interned: they are stored once in a
+table and referred to by their integer index everywhere else. Connections
+are stored as flat lists of integers.
+
+Values (inputs and results of nodes) are stored as msgpack types. Tuples,
+numpy arrays and scalars and complex numbers are stored as extension types,
+so they keep their type. Other objects are pickled, like python-rq does for
+job results. Payloads with pickled objects are only loaded with
+``allow_pickle=True``, which should only be used for trusted sources.
+"""
+from __future__ import annotations
+import importlib
+import pickle
+import sys
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from .graph import Graph, RunResult, RunState, _get
+from .models import OutNode
+
+FORMAT_VERSION = 1
+MAGIC = b"FFW"
+FLAG_COMPRESSED = 1
+# Payloads smaller than this are never compressed
+COMPRESS_MIN_SIZE = 256
+
+EXT_NDARRAY = 1
+EXT_NUMPY_SCALAR = 2
+EXT_COMPLEX = 3
+EXT_PICKLE = 4
+EXT_TUPLE = 5
+
+# Fields of a node in the editor which are stored in the fixed columns of a
+# flow. The other fields are stored as they are.
+_FLOW_FIELDS = {"id", "x", "y", "type", "width", "connections", "inputData"}
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError(
+            "msgpack is required for the binary format. Install it using"
+            " `pip install msgpack`."
+        ) from e
+    return msgpack
+
+
+def _packb(obj: Any) -> bytes:
+    # Exact types only, so that tuples are passed to `_default` instead of
+    # being packed as lists
+    return _msgpack().packb(obj, default=_default, use_bin_type=True, strict_types=True)
+
+
+def _default(obj: Any) -> Any:
+    msgpack = _msgpack()
+    # An object can only be a numpy object if numpy has been imported
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(obj, np.ndarray) and obj.dtype.kind not in "OV":
+            obj = np.ascontiguousarray(obj)
+            return msgpack.ExtType(
+                EXT_NDARRAY,
+                msgpack.packb([obj.dtype.str, list(obj.shape), obj.tobytes()]),
+            )
+        if isinstance(obj, np.generic) and obj.dtype.kind not in "OV":
+            return msgpack.ExtType(
+                EXT_NUMPY_SCALAR, msgpack.packb([obj.dtype.str, obj.tobytes()])
+            )
+    if isinstance(obj, complex):
+        return msgpack.ExtType(EXT_COMPLEX, msgpack.packb([obj.real, obj.imag]))
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, _packb(list(obj)))
+    # Subclasses of the msgpack types (enums, OrderedDict...) are stored as
+    # their base type
+    if isinstance(obj, str):
+        return str.__str__(obj)
+    for base in (int, float, bytes, dict, list):
+        if isinstance(obj, base):
+            return base(obj)
+    return msgpack.ExtType(EXT_PICKLE, pickle.dumps(obj))
+
+
+def _ext_hook(allow_pickle: bool) -> Callable[[int, bytes], Any]:
+    msgpack = _msgpack()
+
+    def ext_hook(code: int, data: bytes) -> Any:
+        if code == EXT_NDARRAY:
+            import numpy as np
+
+            dtype, shape, buffer = msgpack.unpackb(data)
+            # Copied so that the array is writable
+            return np.frombuffer(buffer, dtype=dtype).reshape(shape).copy()
+        if code == EXT_NUMPY_SCALAR:
+            import numpy as np
+
+            dtype, buffer = msgpack.unpackb(data)
+            return np.frombuffer(buffer, dtype=dtype)[0]
+        if code == EXT_COMPLEX:
+            real, imag = msgpack.unpackb(data)
+            return complex(real, imag)
+        if code == EXT_PICKLE:
+            if not allow_pickle:
+                raise ValueError(
+                    "The payload contains pickled objects. Use allow_pickle=True"
+                    " to load them if it comes from a trusted source."
+                )
+            return pickle.loads(data)
+        if code == EXT_TUPLE:
+            return tuple(_unpackb(data, ext_hook))
+        return msgpack.ExtType(code, data)
+
+    return ext_hook
+
+
+def _unpackb(payload: bytes, ext_hook: Callable[[int, bytes], Any]) -> Any:
+    return _msgpack().unpackb(payload, ext_hook=ext_hook, raw=False, strict_map_key=False)
+
+
+def pack(obj: Any, compress: bool = True) -> bytes:
+    """Encode any object in the binary format
+
+    Parameters
+    ----------
+    obj: Any
+        The object to encode
+    compress: bool
+        Compress the payload with zlib if it's larger than a few hundred bytes
+
+    Returns
+    -------
+    data: bytes
+        The header followed by the payload
+    """
+    payload = _packb(obj)
+    flags = 0
+    if compress and len(payload) >= COMPRESS_MIN_SIZE:
+        payload = zlib.compress(payload)
+        flags |= FLAG_COMPRESSED
+    return MAGIC + bytes([FORMAT_VERSION, flags]) + payload
+
+
+def unpack(data: bytes, allow_pickle: bool = False) -> Any:
+    """Decode an object encoded using `pack`
+
+    Raises a ValueError if the payload contains pickled objects, unless
+    `allow_pickle` is True.
+    """
+    if data[:3] != MAGIC:
+        raise ValueError("Not a flowfunc binary payload.")
+    version, flags = data[3], data[4]
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}.")
+    payload = data[5:]
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    return _unpackb(payload, _ext_hook(allow_pickle))
+
+
+def is_binary(data: Any) -> bool:
+    """Check if the data is a payload in the binary format"""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:3]) == MAGIC
+
+
+class _Interner:
+    __slots__ = ("values", "index")
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def _kind(payload: Any, kind: str) -> dict:
+    if not isinstance(payload, dict) or payload.get("kind") != kind:
+        found = payload.get("kind") if isinstance(payload, dict) else None
+        raise ValueError(f"Expected a {kind} payload, found {found}.")
+    return payload
+
+
+def encode_flow(nodes: Dict[str, Any]) -> dict:
+    """Encode a flow (the nodes dict of the editor) to msgpack types
+
+    The nodes can be dicts or OutNode objects. Only the input connections are
+    stored since the output connections mirror them.
+    """
+    types, ports = _Interner(), _Interner()
+    ids = list(nodes)
+    index = {nodeid: i for i, nodeid in enumerate(ids)}
+    node_types, layout, input_data, edges, missing, extra = [], [], [], [], {}, {}
+    for i, node in enumerate(nodes.values()):
+        node_types.append(types(_get(node, "type")))
+        layout += [_get(node, "x", 0), _get(node, "y", 0), _get(node, "width", 0)]
+        input_data.append(_get(node, "inputData") or {})
+        connections = _get(node, "connections")
+        inputs = _get(connections, "inputs") if connections else None
+        for port, port_connections in (inputs or {}).items():
+            for connection in port_connections or []:
+                src_id = _get(connection, "nodeId")
+                src = index.get(src_id, -1)
+                if src < 0:
+                    missing[len(edges) // 4] = src_id
+                edges += [src, ports(_get(connection, "portName")), i, ports(port)]
+        if isinstance(node, OutNode):
+            fields = node.model_dump(exclude=_FLOW_FIELDS, exclude_defaults=True)
+        else:
+            fields = {k: v for k, v in node.items() if k not in _FLOW_FIELDS}
+        if fields:
+            extra[i] = fields
+    return {
+        "kind": "flow",
+        "types": types.values,
+        "ports": ports.values,
+        "ids": ids,
+        "t": node_types,
+        "layout": layout,
+        "data": input_data,
+        "edges": edges,
+        "missing": missing,
+        "extra": extra,
+    }
+
+
+def decode_flow(payload: dict) -> Dict[str, dict]:
+    """Decode a flow encoded using `encode_flow` to the nodes dict of the editor"""
+    payload = _kind(payload, "flow")
+    types, ports, ids = payload["types"], payload["ports"], payload["ids"]
+    layout, missing = payload["layout"], payload["missing"]
+    nodes = {}
+    for i, nodeid in enumerate(ids):
+        nodes[nodeid] = {
+            "id": nodeid,
+            "x": layout[3 * i],
+            "y": layout[3 * i + 1],
+            "type": types[payload["t"][i]],
+            "width": layout[3 * i + 2],
+            "connections": {"inputs": {}, "outputs": {}},
+            "inputData": payload["data"][i],
+            **payload["extra"].get(i, {}),
+        }
+    edges = payload["edges"]
+    for edge in range(len(edges) // 4):
+        src, src_port, dst, dst_port = edges[4 * edge : 4 * edge + 4]
+        src_id = ids[src] if src >= 0 else missing[edge]
+        nodes[ids[dst]]["connections"]["inputs"].setdefault(ports[dst_port], []).append(
+            {"nodeId": src_id, "portName": ports[src_port]}
+        )
+        if src >= 0:
+            nodes[src_id]["connections"]["outputs"].setdefault(
+                ports[src_port], []
+            ).append({"nodeId": ids[dst], "portName": ports[dst_port]})
+    return nodes
+
+
+def encode_graph(graph: Graph) -> dict:
+    """Encode a Graph to msgpack types. The source flow is not included."""
+    types, ports = _Interner(), _Interner()
+    node_types = [types(node_type) for node_type in graph.types]
+    return {
+        "kind": "graph",
+        "types": types.values,
+        "t": node_types,
+        "ids": graph.ids,
+        "inputs": graph.inputs,
+        "settings": graph.settings,
+        "src": graph.edge_src.tolist(),
+        "dst": graph.edge_dst.tolist(),
+        "src_port": [ports(port) for port in graph.edge_src_port],
+        "dst_port": [ports(port) for port in graph.edge_dst_port],
+        "ports": ports.values,
+        "missing": graph.missing,
+        "preset": {i: list(value) for i, value in graph.preset.items()},
+        "rewired": sorted(graph.rewired),
+    }
+
+
+def decode_graph(payload: dict) -> Graph:
+    """Decode a Graph encoded using `encode_graph`"""
+    payload = _kind(payload, "graph")
+    types, ports = payload["types"], payload["ports"]
+    graph = Graph()
+    for nodeid, t, inputs, settings in zip(
+        payload["ids"], payload["t"], payload["inputs"], payload["settings"]
+    ):
+        graph.add_node(nodeid, types[t], inputs, settings)
+    missing = payload["missing"]
+    for edge, (src, src_port, dst, dst_port) in enumerate(
+        zip(payload["src"], payload["src_port"], payload["dst"], payload["dst_port"])
+    ):
+        graph.add_edge(src, ports[src_port], dst, ports[dst_port], missing.get(edge))
+    graph.preset = {i: tuple(value) for i, value in payload["preset"].items()}
+    graph.rewired = set(payload.get("rewired", ()))
+    return graph
+
+
+def encode_result(result: RunResult, with_flow: bool = False) -> dict:
+    """Encode the results of a run to msgpack types
+
+    Parameters
+    ----------
+    result: RunResult
+        The results of the run
+    with_flow: bool
+        Also store the flow the graph was parsed from (with the editor
+        layout), so that `RunResult.to_models` returns the full nodes.
+    """
+    # Imported here since the spill module imports the config, which imports this module
+    from .spill import restore
+
+    statuses = _Interner()
+    state = result.state
+    restore(state, range(len(state.status)))
+    payload = {
+        "kind": "result",
+        "graph": encode_graph(result.graph),
+        "status": [statuses(status) for status in state.status],
+        "statuses": statuses.values,
+        "result": state.result,
+        "result_mapped": state.result_mapped,
+        "error": [None if error is None else str(error) for error in state.error],
+        "flow": None,
+    }
+    if with_flow and result.graph.source is not None:
+        payload["flow"] = encode_flow(result.graph.source)
+    return payload
+
+
+def decode_result(payload: dict) -> RunResult:
+    """Decode the results of a run encoded using `encode_result`
+
+    The errors of the nodes are restored as plain Exception objects with the
+    original message.
+    """
+    payload = _kind(payload, "result")
+    graph = decode_graph(payload["graph"])
+    if payload.get("flow") is not None:
+        graph.source = decode_flow(payload["flow"])
+    state = RunState(len(graph))
+    statuses = payload["statuses"]
+    state.status = [statuses[status] for status in payload["status"]]
+    state.result = payload["result"]
+    state.result_mapped = payload["result_mapped"]
+    state.error = [None if error is None else Exception(error) for error in payload["error"]]
+    return RunResult(graph, state)
+
+
+def dumps_flow(nodes: Dict[str, Any], compress: bool = True) -> bytes:
+    """Encode a flow (the nodes dict of the editor) in the binary format"""
+    return pack(encode_flow(nodes), compress)
+
+
+def loads_flow(data: bytes, allow_pickle: bool = False) -> Dict[str, dict]:
+    """Decode a flow encoded using `dumps_flow`"""
+    return decode_flow(unpack(data, allow_pickle))
+
+
+def dumps_graph(graph: Graph, compress: bool = True) -> bytes:
+    """Encode a Graph in the binary format"""
+    return pack(encode_graph(graph), compress)
+
+
+def loads_graph(data: bytes, allow_pickle: bool = False) -> Graph:
+    """Decode a Graph encoded using `dumps_graph`"""
+    return decode_graph(unpack(data, allow_pickle))
+
+
+def dumps_result(result: RunResult, compress: bool = True, with_flow: bool = False) -> bytes:
+    """Encode the results of a run in the binary format"""
+    return pack(encode_result(result, with_flow), compress)
+
+
+def loads_result(data: bytes, allow_pickle: bool = False) -> RunResult:
+    """Decode the results of a run encoded using `dumps_result`"""
+    return decode_result(unpack(data, allow_pickle))
+
+
+def loads(data: bytes, allow_pickle: bool = False) -> Any:
+    """Decode a flow, graph or run result depending on the kind of the payload"""
+    payload = unpack(data, allow_pickle)
+    decoders = {"flow": decode_flow, "graph": decode_graph, "result": decode_result}
+    kind = payload.get("kind") if isinstance(payload, dict) else None
+    if kind not in decoders:
+        raise ValueError(f"Unknown payload kind {kind}.")
+    return decoders[kind](payload)
+
+
+def function_path(func: Callable) -> str:
+    """Import path of a function: module:qualname"""
+    return f"{func.__module__}:{func.__qualname__}"
+
+
+def import_function(path: str) -> Callable:
+    """Import a function from a path created using `function_path`"""
+    module_name, qualname = path.split(":", 1)
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+class RQSerializer:
+    """Serializer for python-rq using the binary format
+
+    Pass it as the `serializer` of the queues and the workers. Job results
+    which are numbers, strings, containers or numpy arrays are stored without
+    pickle.
+    """
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return pack(obj)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        # The jobs are only read from the redis of the app, which is trusted
+        # like with the default pickle serializer of rq
+        return unpack(data, allow_pickle=True)
@@ -0,0 +1,298 @@
+"""
+Spill
+-----
+Keeps the results of a run within a memory budget by moving them to disk.
+
+When the results of the finished nodes of a run take more memory than the
+budget, the ones which will be needed last (by the order in which the nodes
+are run) are written to files in a temporary directory: NumPy arrays as
+`.npy` files and other values with pickle. The results of the node are
+replaced by `Spilled` handles. When a node needs a spilled input, the
+results are loaded once and put back in place of the handles, so the other
+nodes reading them share the loaded values. They count against the budget
+again and can be spilled again later without writing the files again.
+Arrays are memory-mapped (copy on write) so they are only read from disk as
+far as they are used.
+
+When the run ends, only the results which are kept (the sink nodes, and the
+pinned nodes with `keep="outputs"`) are loaded back. The other spilled
+results stay as handles which `RunResult.result` loads on first access. The
+directory is removed once no handle refers to it anymore.
+"""
+from __future__ import annotations
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import weakref
+from typing import Any, Dict, Iterable, List, Optional
+
+from .graph import Graph, RunState
+from .planner import topological_order
+from .utils import logger, value_size
+
+
+def _ndarray(value: Any) -> bool:
+    # NumPy is only imported by the nodes which use it
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray) and not value.dtype.hasobject
+
+
+class SpillDirectory:
+    """Temporary directory of spilled files, removed once it's no longer referenced"""
+
+    def __init__(self, parent: Optional[str] = None):
+        self.path = tempfile.mkdtemp(prefix="flowfunc-spill-", dir=parent)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+
+    def remove(self):
+        """Remove the files. Memory-mapped arrays stay valid on POSIX systems."""
+        self._finalizer()
+
+
+class Spilled:
+    """A value which was written to a file
+
+    The handle keeps the directory of the file alive.
+    """
+
+    __slots__ = ("directory", "path", "size")
+
+    def __init__(self, directory: SpillDirectory, path: str, size: int):
+        self.directory = directory
+        self.path = path
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f"Spilled({self.path!r}, {self.size} bytes)"
+
+    def load(self) -> Any:
+        """The value, arrays are memory-mapped"""
+        if self.path.endswith(".npy"):
+            import numpy as np
+
+            return np.load(self.path, mmap_mode="c")
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+
+class SpillStore:
+    """Files of the spilled values, in a temporary directory created on first use"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._files: Optional[SpillDirectory] = None
+        self._count = 0
+
+    @property
+    def path(self) -> Optional[str]:
+        return None if self._files is None else self._files.path
+
+    def spill(self, value: Any) -> Spilled:
+        """Write a value to a file"""
+        if self._files is None:
+            self._files = SpillDirectory(self.directory)
+        self._count += 1
+        if _ndarray(value):
+            import numpy as np
+
+            path = os.path.join(self._files.path, f"{self._count}.npy")
+            np.save(path, value, allow_pickle=False)
+        else:
+            path = os.path.join(self._files.path, f"{self._count}.pickle")
+            with open(path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return Spilled(self._files, path, value_size(value))
+
+    def close(self):
+        """Release the directory, it's removed when the last handle is gone"""
+        self._files = None
+
+
+def load(value: Any) -> Any:
+    """The value of an output, which is loaded if it was spilled"""
+    return value.load() if isinstance(value, Spilled) else value
+
+
+def _loader():
+    # Loads each handle only once
+    loaded: Dict[int, Any] = {}
+
+    def load_once(value):
+        if not isinstance(value, Spilled):
+            return value
+        if id(value) not in loaded:
+            loaded[id(value)] = value.load()
+        return loaded[id(value)]
+
+    return load_once
+
+
+def restore(state: RunState, nodes: Iterable[int]):
+    """Load the spilled results of some nodes of a run in place"""
+    load_once = _loader()
+    for i in nodes:
+        result = state.result[i]
+        if isinstance(result, tuple):
+            state.result[i] = tuple(load_once(v) for v in result)
+        else:
+            state.result[i] = load_once(result)
+        if state.result_mapped[i]:
+            state.result_mapped[i] = {
+                k: load_once(v) for k, v in state.result_mapped[i].items()
+            }
+
+
+class MemoryBudget:
+    """Spills the results of a run when they take more than `limit` bytes
+
+    The runner calls `add` when the results of a node are stored, `share` when a duplicated
+    node gets the results of its original (see `flowfunc.planner`), `load`
+    to read an input, `remove` when the results of a node are released and
+    `close` at the end of the run.
+    """
+
+    def __init__(
+        self, graph: Graph, state: RunState, limit: int, directory: Optional[str] = None
+    ):
+        self.graph = graph
+        self.state = state
+        self.limit = limit
+        self.store = SpillStore(directory)
+        self.used = 0
+        self.spilled = 0
+        # Bytes of the results in memory of each node
+        self.sizes: Dict[int, int] = {}
+        self.shared: Dict[int, List[int]] = {}
+        self.rank = [len(graph)] * len(graph)
+        for position, i in enumerate(topological_order(graph)):
+            self.rank[i] = position
+        self._duplicates: Dict[int, List[int]] = {}
+        for duplicate, original in graph.duplicates.items():
+            self._duplicates.setdefault(original, []).append(duplicate)
+        # Handles of the results which were loaded back, reused if they are
+        # spilled again
+        self.files: Dict[int, Any] = {}
+        # The nodes which hold the same spilled results
+        self._groups: Dict[int, List[int]] = {}
+
+    def add(self, i: int):
+        """Count the results of a node and spill results if needed"""
+        if self.state.status[i] != "finished" or i in self.graph.preset:
+            return
+        result = self.state.result[i]
+        values = result if isinstance(result, tuple) else (result,)
+        self.sizes[i] = sum(value_size(v) for v in values)
+        self.used += self.sizes[i]
+        if self.used > self.limit:
+            self._spill()
+
+    def share(self, original: int, duplicate: int):
+        """A duplicated node got the (same) results of its original"""
+        if original in self.sizes:
+            self.shared.setdefault(original, []).append(duplicate)
+
+    def load(self, i: int, port: str) -> Any:
+        """An output of a node, whose results are loaded back if they were spilled
+
+        The loaded results replace the handles, so they are only loaded once
+        for all the nodes reading them, and count against the budget again.
+        """
+        state = self.state
+        value = state.result_mapped[i][port]
+        if not isinstance(value, Spilled):
+            return value
+        group = self._groups.get(i, [i])
+        for node in group:
+            self._groups.pop(node, None)
+        holders = [node for node in group if state.result_mapped[node] is not None]
+        handles = state.result[i]
+        restore(state, holders)
+        value = state.result_mapped[i][port]
+        size = sum(h.size for h in (handles if isinstance(handles, tuple) else (handles,)))
+        self.sizes[holders[0]] = size
+        self.shared[holders[0]] = holders[1:]
+        self.files[holders[0]] = handles
+        self.used += size
+        if self.used > self.limit:
+            # The nodes reading the results are about to run
+            self._spill(exclude=holders[0])
+        return value
+
+    def remove(self, i: int):
+        """The results of a node were released"""
+        size = self.sizes.pop(i, 0)
+        handles = self.files.pop(i, None)
+        holders = [d for d in self.shared.pop(i, ()) if self.state.result_mapped[d] is not None]
+        if size and holders:
+            # The duplicates still hold the same values
+            self.sizes[holders[0]] = size
+            self.shared[holders[0]] = holders[1:]
+            if handles is not None:
+                self.files[holders[0]] = handles
+        else:
+            self.used -= size
+
+    def _next_use(self, i: int) -> int:
+        """Position of the first node which still needs the results of a node"""
+        graph, status = self.graph, self.state.status
+        next_use = len(graph) + 1
+        for edge in graph.out_edges(i):
+            dst = graph.edge_dst[edge]
+            if status[dst] == "idle":
+                next_use = min(next_use, self.rank[dst])
+        for duplicate in self._duplicates.get(i, ()):
+            if status[duplicate] == "idle":
+                next_use = min(next_use, self.rank[duplicate])
+        return next_use
+
+    def _spill(self, exclude: Optional[int] = None):
+        # The results needed last are spilled first, the largest first
+        victims = sorted(
+            (i for i in self.sizes if i != exclude),
+            key=lambda i: (self._next_use(i), self.sizes[i]),
+        )
+        while self.used > self.limit and victims:
+            self._spill_node(victims.pop())
+
+    def _spill_node(self, i: int):
+        state = self.state
+        result = state.result[i]
+        # Results which were loaded back are still on disk
+        spilled = self.files.pop(i, None)
+        written = spilled is None
+        if written:
+            if isinstance(result, tuple):
+                spilled = tuple(self.store.spill(v) for v in result)
+            else:
+                spilled = self.store.spill(result)
+        values = spilled if isinstance(spilled, tuple) else (spilled,)
+        mapped = dict(zip(state.result_mapped[i], values))
+        group = [i] + self.shared.pop(i, [])
+        for node in group:
+            if state.result_mapped[node] is not None:
+                state.result[node] = spilled
+                state.result_mapped[node] = dict(mapped)
+            self._groups[node] = group
+        size = self.sizes.pop(i)
+        self.used -= size
+        if written:
+            self.spilled += size
+            logger.info(f"Spilled the results of node {self.graph.ids[i]} ({size} bytes).")
+
+    def close(self, kept: Optional[Iterable[int]] = None):
+        """Load back the spilled results of the kept nodes
+
+        By default the results of the sink nodes are loaded back. The other
+        spilled results are left as handles, the files are removed when the
+        last handle is gone.
+        """
+        if kept is None:
+            graph = self.graph
+            kept = [i for i in range(len(graph)) if not len(graph.out_edges(i))]
+        if self.store.path is not None:
+            restore(self.state, kept)
+        self.store.close()
+        self.files.clear()
+        self._groups.clear()
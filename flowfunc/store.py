@@ -0,0 +1,203 @@
+"""
+Workflow store
+--------------
+Server side storage for saved workflows.
+
+The metadata of the workflows (title, modification time, size) is stored and
+indexed separately from the nodes of the flow, so that listing the workflows
+never loads any of the flows. A flow is only loaded when a single workflow is
+requested using `get`.
+
+`WorkflowStore` defines the interface. `SQLiteWorkflowStore` is the default
+implementation which only needs the python standard library. It stores the
+flows in the compact binary format of `flowfunc.serialization` when msgpack
+is installed, and as JSON otherwise.
+"""
+from __future__ import annotations
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from .serialization import dumps_flow, is_binary, loads_flow
+
+
+class WorkflowSummary(BaseModel):
+    """Metadata of a saved workflow"""
+
+    id: str
+    title: str
+    description: str = ""
+    modified: datetime
+    # Size of the serialized flow in bytes
+    size: int
+
+
+class Workflow(WorkflowSummary):
+    """A saved workflow along with its flow"""
+
+    nodes: Dict[str, Any]
+
+
+class WorkflowStore(ABC):
+    """Interface of a workflow repository"""
+
+    @abstractmethod
+    def save(
+        self,
+        nodes: Dict[str, Any],
+        title: str,
+        description: str = "",
+        workflow_id: Optional[str] = None,
+    ) -> WorkflowSummary:
+        """Create a workflow, or replace it if a workflow_id is given"""
+
+    @abstractmethod
+    def get(self, workflow_id: str) -> Optional[Workflow]:
+        """Load a workflow with its flow. Returns None if it doesn't exist."""
+
+    @abstractmethod
+    def delete(self, workflow_id: str) -> bool:
+        """Delete a workflow. Returns False if it didn't exist."""
+
+    @abstractmethod
+    def list_workflows(self, offset: int = 0, limit: int = 20) -> List[WorkflowSummary]:
+        """Metadata of a page of workflows, most recently modified first"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of saved workflows"""
+
+
+class SQLiteWorkflowStore(WorkflowStore):
+    """Workflow store backed by an SQLite database
+
+    A new connection is opened for every operation so that the store can be
+    shared by the threads of a web server.
+
+    Attributes
+    ----------
+    path: str
+        Path of the database file
+    binary: bool
+        Store the flows in the binary format instead of JSON. By default the
+        binary format is used if msgpack is installed. Flows stored in either
+        format can always be read.
+    """
+
+    def __init__(self, path: str = "workflows.sqlite3", binary: Optional[bool] = None):
+        self.path = path
+        if binary is None:
+            try:
+                import msgpack  # noqa: F401
+
+                binary = True
+            except ImportError:
+                binary = False
+        self.binary = binary
+        with self._transaction() as connection:
+            connection.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS workflows (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL DEFAULT '',
+                    modified TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    nodes BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS workflows_modified ON workflows (modified);
+                CREATE INDEX IF NOT EXISTS workflows_title ON workflows (title);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """A new connection, committed and closed at the end of the block"""
+        # The connection as a context manager only commits or rolls back
+        with closing(self._connect()) as connection, connection:
+            yield connection
+
+    @staticmethod
+    def _summary(row) -> WorkflowSummary:
+        return WorkflowSummary(
+            id=row[0],
+            title=row[1],
+            description=row[2],
+            modified=datetime.fromisoformat(row[3]),
+            size=row[4],
+        )
+
+    def save(
+        self,
+        nodes: Dict[str, Any],
+        title: str,
+        description: str = "",
+        workflow_id: Optional[str] = None,
+    ) -> WorkflowSummary:
+        data = dumps_flow(nodes) if self.binary else json.dumps(nodes)
+        summary = WorkflowSummary(
+            id=workflow_id or f"wf_{uuid4().hex}",
+            title=title,
+            description=description,
+            modified=datetime.now(),
+            size=len(data) if self.binary else len(data.encode()),
+        )
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO workflows"
+                " (id, title, description, modified, size, nodes)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    summary.id,
+                    summary.title,
+                    summary.description,
+                    summary.modified.isoformat(),
+                    summary.size,
+                    data,
+                ),
+            )
+        return summary
+
+    def get(self, workflow_id: str) -> Optional[Workflow]:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT id, title, description, modified, size, nodes"
+                " FROM workflows WHERE id = ?",
+                (workflow_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        data = row[5]
+        # Flows from the editor only contain JSON values
+        nodes = loads_flow(data, allow_pickle=False) if is_binary(data) else json.loads(data)
+        return Workflow(**self._summary(row).model_dump(), nodes=nodes)
+
+    def delete(self, workflow_id: str) -> bool:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "DELETE FROM workflows WHERE id = ?", (workflow_id,)
+            )
+        return cursor.rowcount > 0
+
+    def list_workflows(self, offset: int = 0, limit: int = 20) -> List[WorkflowSummary]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, title, description, modified, size FROM workflows"
+                " ORDER BY modified DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def count(self) -> int:
+        with self._transaction() as connection:
+            return connection.execute("SELECT COUNT(*) FROM workflows").fetchone()[0]
@@ -1,4 +1,7 @@
+import hashlib
 import logging
+import os
+import sys
 
 logger = logging.getLogger(__name__)
 
@@ -11,4 +14,38 @@ def issubclass_safe(cls, classinfo):
     try:
         return issubclass(cls, classinfo)
     except TypeError:
-        return False
\ No newline at end of file
+        return False
+
+def module_fingerprint(modules) -> str | None:
+    """Create a fingerprint of the source files of the given modules.
+
+    The fingerprint is a hash of the path, the modification time and the
+    content hash of each module file. If any of the modules doesn't have a
+    source file (builtins, interactive sessions etc.), None is returned.
+    """
+    digest = hashlib.sha256()
+    for module_name in sorted(set(modules)):
+        module = sys.modules.get(module_name)
+        path = getattr(module, "__file__", None)
+        if not path or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        digest.update(
+            f"{module_name}:{path}:{os.stat(path).st_mtime_ns}:{content_hash}\n".encode()
+        )
+    return digest.hexdigest()
+
+
+def value_size(value, depth: int = 2) -> int:
+    """Estimated number of bytes of a value"""
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    size = sys.getsizeof(value)
+    if depth > 0:
+        if isinstance(value, dict):
+            size += sum(value_size(v, depth - 1) for v in value.values())
+        elif isinstance(value, (list, tuple, set)):
+            size += sum(value_size(v, depth - 1) for v in value)
+    return size
@@ -0,0 +1,182 @@
+"""
+Validation
+----------
+Checks which are run on a flow before any of its nodes are executed.
+
+All the problems of a flow are collected in a single pass over the nodes and
+connections (O(V+E)) so that they can be reported at once.
+"""
+from __future__ import annotations
+from collections import deque
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from .config import Config
+from .graph import Graph
+from .models import Port
+
+
+class GraphIssue(BaseModel):
+    """A problem found in a flow"""
+
+    kind: str  # unknown_type, missing_node, missing_port, type_mismatch, cycle
+    node_id: str
+    port: str | None = None
+    message: str
+
+
+def ports_compatible(output: Port, input_: Port) -> bool:
+    """Check if an output port can be connected to an input port
+
+    The object port can be connected to any port. Otherwise the type (or all
+    the accepted types of a union type) of the output should be accepted by
+    the input.
+    """
+    if output.type == "object" or input_.type == "object":
+        return True
+    accepted = set(input_.acceptTypes or [input_.type])
+    if output.type in accepted:
+        return True
+    return set(output.acceptTypes or [output.type]) <= accepted
+
+
+def _port(ports, name: str) -> Optional[Port]:
+    for port in ports:
+        if port.name == name:
+            return port
+    return None
+
+
+def _remaining_after_sort(graph: Graph, reverse: bool = False) -> set:
+    """Nodes left over after a topological sort (Kahn's algorithm)
+
+    These are the nodes which are part of a cycle or depend on one (or, when
+    sorting the reversed graph, the ones a cycle depends on).
+    """
+    src_array, dst_array = graph.edge_src, graph.edge_dst
+    if reverse:
+        src_array, dst_array = dst_array, src_array
+    degrees = [0] * len(graph)
+    for src, dst in zip(src_array, dst_array):
+        if src >= 0 and dst >= 0:
+            degrees[dst] += 1
+    queue = deque(i for i, degree in enumerate(degrees) if degree == 0)
+    while queue:
+        i = queue.popleft()
+        edges = graph.in_edges(i) if reverse else graph.out_edges(i)
+        for edge in edges:
+            nxt = dst_array[edge]
+            if nxt < 0:
+                continue
+            degrees[nxt] -= 1
+            if degrees[nxt] == 0:
+                queue.append(nxt)
+    return {i for i, degree in enumerate(degrees) if degree > 0}
+
+
+def validate_graph(
+    graph: Graph, config: Config, check_types: bool = True
+) -> List[GraphIssue]:
+    """Find all the problems in a flow
+
+    Parameters
+    ----------
+    graph: Graph
+        The flow to check
+    config: Config
+        The config with the nodes used in the flow
+    check_types: bool
+        Check if the connected ports have compatible types. Disable this if
+        the editor is used without type safety.
+
+    Returns
+    -------
+    issues: List[GraphIssue]
+        The problems found. The list is empty if the flow is valid.
+    """
+    issues = []
+    config_nodes = []
+    for i, node_type in enumerate(graph.types):
+        config_node = None
+        if config.has_node(node_type):
+            config_node = config.get_node(node_type)
+        else:
+            issues.append(
+                GraphIssue(
+                    kind="unknown_type",
+                    node_id=graph.ids[i],
+                    message=f"Node {graph.ids[i]} has an unknown type {node_type}.",
+                )
+            )
+        config_nodes.append(config_node)
+
+    for edge, (src, dst) in enumerate(zip(graph.edge_src, graph.edge_dst)):
+        dst_id = graph.ids[dst]
+        dst_port_name = graph.edge_dst_port[edge]
+        src_port_name = graph.edge_src_port[edge]
+        if src < 0:
+            issues.append(
+                GraphIssue(
+                    kind="missing_node",
+                    node_id=dst_id,
+                    port=dst_port_name,
+                    message=f"Input {dst_port_name} of node {dst_id} is connected"
+                    f" to node {graph.missing[edge]} which is not in the flow.",
+                )
+            )
+            continue
+        src_id = graph.ids[src]
+        dst_port = src_port = None
+        dst_node, src_node = config_nodes[dst], config_nodes[src]
+        if dst_node is not None and isinstance(dst_node.inputs, list):
+            dst_port = _port(dst_node.inputs, dst_port_name)
+            if dst_port is None:
+                issues.append(
+                    GraphIssue(
+                        kind="missing_port",
+                        node_id=dst_id,
+                        port=dst_port_name,
+                        message=f"Node {dst_id} ({dst_node.type}) has no input"
+                        f" {dst_port_name}.",
+                    )
+                )
+        if src_node is not None and isinstance(src_node.outputs, list):
+            src_port = _port(src_node.outputs, src_port_name)
+            if src_port is None:
+                issues.append(
+                    GraphIssue(
+                        kind="missing_port",
+                        node_id=src_id,
+                        port=src_port_name,
+                        message=f"Node {src_id} ({src_node.type}) has no output"
+                        f" {src_port_name}.",
+                    )
+                )
+        if check_types and dst_port and src_port:
+            if not ports_compatible(src_port, dst_port):
+                issues.append(
+                    GraphIssue(
+                        kind="type_mismatch",
+                        node_id=dst_id,
+                        port=dst_port_name,
+                        message=f"Output {src_port_name} ({src_port.type}) of node"
+                        f" {src_id} cannot be connected to input {dst_port_name}"
+                        f" ({dst_port.type}) of node {dst_id}.",
+                    )
+                )
+
+    # Nodes which can neither be reached from a source nor from a sink are
+    # the ones on a cycle (or between two cycles).
+    remaining = _remaining_after_sort(graph)
+    if remaining:
+        remaining &= _remaining_after_sort(graph, reverse=True)
+    for i in sorted(remaining):
+        issues.append(
+            GraphIssue(
+                kind="cycle",
+                node_id=graph.ids[i],
+                message=f"Node {graph.ids[i]} is part of a cycle.",
+            )
+        )
+    return issues
@@ -15,7 +15,7 @@ setup(
     name=package_name,
     version=package["version"],
     author=package["author"],
-    packages=[package_name],
+    packages=[package_name, f"{package_name}.quantum"],
     include_package_data=True,
     license=package["license"],
     description=package.get("description", package_name),
@@ -25,7 +25,12 @@ setup(
     install_requires=[
         "pydantic>=2,<3",
     ],
-    extras_require={"distributed": ["rq>=1.11"], "full": ["dash>=2.6", "rq>=1.11"]},
+    extras_require={
+        "distributed": ["rq>=1.11"],
+        "binary": ["msgpack>=1.0"],
+        "quantum": ["numpy>=1.22"],
+        "full": ["dash>=2.6", "rq>=1.11", "msgpack>=1.0", "numpy>=1.22"],
+    },
     classifiers=[
         "Framework :: Dash",
     ],
@@ -0,0 +1,79 @@
+import fakeredis
+import pytest
+
+from flowfunc.config import Config
+from flowfunc.distributed import NodeQueue, NodeWorker
+from flowfunc.jobrunner import JobRunner
+
+
+def add_one(a: int) -> int:
+    return a + 1
+
+
+def double(a: int) -> int:
+    return a * 2
+
+
+def source(x: int) -> int:
+    return x
+
+
+def node(node_id, function, connections=None, data=None):
+    return {
+        "id": node_id,
+        "x": 10,
+        "y": 20,
+        "width": 100,
+        "type": f"{__name__}.{function}",
+        "connections": {
+            "inputs": {
+                port: [{"nodeId": src, "portName": src_port}]
+                for port, (src, src_port) in (connections or {}).items()
+            },
+            "outputs": {},
+        },
+        "inputData": {key: {key: value} for key, value in (data or {}).items()},
+    }
+
+
+@pytest.fixture
+def config():
+    config = Config.from_function_list([add_one, double, source])
+    config.add_composite(
+        "blocks.inc_double",
+        {
+            "i": node("i", "add_one"),
+            "d": node("d", "double", {"a": ("i", "result")}),
+        },
+        inputs={"x": ("i", "a")},
+        outputs={"y": ("d", "result")},
+    )
+    return config
+
+
+@pytest.fixture
+def flow():
+    return {
+        "s": node("s", "source", data={"x": 4}),
+        "c": {**node("c", "source", {"x": ("s", "result")}), "type": "blocks.inc_double"},
+        "e": node("e", "add_one", {"a": ("c", "y")}),
+    }
+
+
+def test_composite_sync(config, flow):
+    result = JobRunner(config).run(flow)
+    assert result["c"].result == 10
+    assert result["e"].result == 11
+    # The editor data is kept for the nodes connected to the composite
+    assert (result["e"].x, result["e"].y) == (10, 20)
+
+
+def test_composite_distributed(config, flow):
+    connection = fakeredis.FakeStrictRedis()
+    queue = NodeQueue(connection=connection)
+    jobs = JobRunner(config, method="distributed", default_queue=queue).run(flow)
+    NodeWorker([queue], connection=connection, fork=False).work(burst=True)
+    statuses = {node_id: node.job.get_status(refresh=True) for node_id, node in jobs.items()}
+    assert set(statuses.values()) == {"finished"}
+    assert jobs["c"].job.return_value() == 10
+    assert jobs["e"].job.return_value() == 11
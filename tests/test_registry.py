@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VERSION_SCRIPT = """
+from typing import Optional, Union
+
+from flowfunc.config import Config
+from flowfunc.registry import config_version
+
+
+def first(x: int, y: float, z) -> str:
+    return ""
+
+
+def second(p: Union[int, str, float], q: list, r: dict) -> bytes:
+    return b""
+
+
+def third(v: Optional[complex], w: bool, t: tuple, s: set) -> float:
+    return 0.0
+
+
+print(config_version(Config.from_function_list([first, second, third])))
+"""
+
+
+def version_with_seed(seed: int) -> str:
+    env = {**os.environ, "PYTHONHASHSEED": str(seed), "PYTHONPATH": ROOT}
+    result = subprocess.run(
+        [sys.executable, "-c", VERSION_SCRIPT],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def test_config_version_does_not_depend_on_hash_seed():
+    assert version_with_seed(1) == version_with_seed(2)